@@ -0,0 +1,250 @@
+"""
+大模型调用的准入控制
+
+每个对话请求在调用上游前先申请一个名额：
+- 每个用户同时进行（含排队）的请求数不超过 PER_USER_LIMIT，超出时立即拒绝
+- 整个进程同时进行的请求数不超过 GLOBAL_LIMIT（按上游并发配额 / 进程数配置），
+  名额用完时按先来先到排队，最多排 MAX_QUEUE 个，等待超过 QUEUE_TIMEOUT 秒放弃
+- 被拒绝的请求返回429和Retry-After，而不是堆积在worker里等待上游
+
+名额在请求结束时释放；流式响应在流结束（或客户端断开）时释放。
+同步视图（线程）和异步视图（asyncio）共用同一个控制器，释放的名额直接交给队首的等待者。
+"""
+import asyncio
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+DEFAULT_ADMISSION_SETTINGS = {
+    'GLOBAL_LIMIT': 20,       # 进程内同时调用上游的请求数
+    'PER_USER_LIMIT': 2,      # 每个用户同时进行的请求数（含排队）
+    'MAX_QUEUE': 50,          # 等待名额的最大请求数
+    'QUEUE_TIMEOUT': 5,       # 排队等待的最长时间（秒）
+    'RETRY_AFTER': 5,         # 拒绝时建议客户端等待的时间（秒）
+}
+
+
+def admission_settings():
+    return {**DEFAULT_ADMISSION_SETTINGS, **getattr(settings, 'CHAT_ADMISSION', {})}
+
+
+class AdmissionRejected(Exception):
+    """
+    请求未获得调用名额，reason为 user（用户并发超限）、busy（队列已满）或 timeout（排队超时）
+    """
+    MESSAGES = {
+        'user': '您同时进行的对话请求过多，请等待之前的回复完成',
+        'busy': '当前请求过多，请稍后再试',
+        'timeout': '当前请求过多，排队超时，请稍后再试',
+    }
+
+    def __init__(self, reason, retry_after):
+        super().__init__(self.MESSAGES[reason])
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, user_id, loop=None):
+        self.user_id = user_id
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class Slot:
+    """
+    已获得的调用名额，release可以重复调用
+    """
+    def __init__(self, controller, user_id):
+        self.controller = controller
+        self.user_id = user_id
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self.user_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, global_limit=20, per_user_limit=2, max_queue=50, queue_timeout=5, retry_after=5):
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.per_user = {}
+        self.queue = deque()
+
+    def _try_admit(self, user_id, loop=None):
+        """
+        在锁内调用：返回 (Slot, None) 表示直接获得名额，(None, _Waiter) 表示需要排队
+        """
+        if self.per_user.get(user_id, 0) >= self.per_user_limit:
+            raise AdmissionRejected('user', self.retry_after)
+        if self.in_flight < self.global_limit and not self.queue:
+            self.in_flight += 1
+            self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+            return Slot(self, user_id), None
+        if len(self.queue) >= self.max_queue:
+            raise AdmissionRejected('busy', self.retry_after)
+        # 排队中的请求同样计入用户的并发数，一个用户不能占满队列
+        self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+        waiter = _Waiter(user_id, loop)
+        self.queue.append(waiter)
+        return None, waiter
+
+    def _abandon(self, waiter):
+        """
+        排队超时：在锁内检查是否恰好已获得名额，否则移出队列并抛出AdmissionRejected
+        """
+        with self.lock:
+            if waiter.granted:
+                return Slot(self, waiter.user_id)
+            self.queue.remove(waiter)
+            self._decrement_user(waiter.user_id)
+        raise AdmissionRejected('timeout', self.retry_after)
+
+    def acquire(self, user_id):
+        """
+        同步获取名额（会阻塞排队），失败时抛出AdmissionRejected
+        """
+        with self.lock:
+            slot, waiter = self._try_admit(user_id)
+        if slot is not None:
+            return slot
+        if waiter.event.wait(self.queue_timeout):
+            return Slot(self, user_id)
+        return self._abandon(waiter)
+
+    async def aacquire(self, user_id):
+        """
+        异步获取名额，排队期间不占用线程
+        """
+        with self.lock:
+            slot, waiter = self._try_admit(user_id, asyncio.get_running_loop())
+        if slot is not None:
+            return slot
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            return Slot(self, user_id)
+        except asyncio.TimeoutError:
+            return self._abandon(waiter)
+        except asyncio.CancelledError:
+            # 客户端断开：已获得的名额立即归还
+            try:
+                self._abandon(waiter).release()
+            except AdmissionRejected:
+                pass
+            raise
+
+    def _decrement_user(self, user_id):
+        count = self.per_user.get(user_id, 0) - 1
+        if count > 0:
+            self.per_user[user_id] = count
+        else:
+            self.per_user.pop(user_id, None)
+
+    def _release(self, user_id):
+        with self.lock:
+            self._decrement_user(user_id)
+            if self.queue:
+                # 名额直接交给队首的请求，in_flight不变
+                self.queue.popleft().grant()
+            else:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': self.in_flight, 'queued': len(self.queue), 'users': len(self.per_user)}
+
+
+class _ReleasingIterator:
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.release()
+
+    def close(self):
+        self.release()
+
+
+class _ReleasingAsyncIterator:
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+
+    async def __aiter__(self):
+        try:
+            async for part in self.content:
+                yield part
+        finally:
+            self.release()
+
+    def close(self):
+        self.release()
+
+
+def hold_for_response(response, slot):
+    """
+    普通响应立即释放名额；流式响应在流结束或响应关闭时释放
+    """
+    if not isinstance(response, StreamingHttpResponse):
+        slot.release()
+        return response
+    wrapper = _ReleasingAsyncIterator if response.is_async else _ReleasingIterator
+    response.streaming_content = wrapper(response.streaming_content, slot.release)
+    return response
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    返回进程内共享的控制器，首次调用时按 settings.CHAT_ADMISSION 创建
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                config = admission_settings()
+                _controller = AdmissionController(
+                    global_limit=config['GLOBAL_LIMIT'],
+                    per_user_limit=config['PER_USER_LIMIT'],
+                    max_queue=config['MAX_QUEUE'],
+                    queue_timeout=config['QUEUE_TIMEOUT'],
+                    retry_after=config['RETRY_AFTER'],
+                )
+    return _controller
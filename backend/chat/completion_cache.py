@@ -0,0 +1,166 @@
+"""
+相同提示词的回复缓存（精确匹配，默认关闭）
+
+很多用户发送相同的开场白或模板化的提示词，命中缓存时直接返回之前的回复，不再调用DashScope。
+缓存键为发送给DashScope的完整请求体（格式化后的消息、模型和参数）的sha256，
+消息内容在计算前做Unicode规范化（NFKC）并去掉首尾空白，只有这些差异的提示词共用同一条缓存。
+
+缓存在进程内，按 TTL 过期，超过 MAX_ENTRIES 条或 MAX_CHARS 个字符时淘汰最久未使用的条目。
+模型参数为随机采样（temperature > 0）时，同一提示词每次的回复本来就不同，
+设置 DETERMINISTIC_ONLY 后这类请求不使用缓存；temperature 由 settings.DASHSCOPE_PARAMETERS 配置，
+不为0时所有请求都不会使用缓存，创建缓存时会记录一条警告。
+
+命中缓存的回复仍然保存为 Message，tokens_used 为0，cache_hit 为真。
+"""
+import hashlib
+import json
+import threading
+import time
+import logging
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+
+from tools.metrics import Counter
+
+from .llm_client import build_payload
+
+DEFAULT_CACHE_SETTINGS = {
+    'ENABLED': False,             # 是否启用
+    'TTL': 60 * 60,               # 缓存有效期（秒）
+    'MAX_ENTRIES': 1000,          # 最多缓存的回复数
+    'MAX_CHARS': 2000000,         # 所有缓存回复的总字符数上限
+    'MAX_RESPONSE_CHARS': 8000,   # 超过该长度的回复不缓存
+    'DETERMINISTIC_ONLY': False,  # 只缓存 temperature 为0的请求
+}
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = Counter('chat_completion_cache_total', '回复缓存查询次数（result: hit/miss/bypass）', ['result'])
+
+
+def cache_settings():
+    return {**DEFAULT_CACHE_SETTINGS, **getattr(settings, 'CHAT_COMPLETION_CACHE', {})}
+
+
+def normalize_text(text):
+    return unicodedata.normalize('NFKC', text or '').strip()
+
+
+def normalized_payload(messages):
+    payload = build_payload(messages)
+    for message in payload['input']['messages']:
+        message['content'] = normalize_text(message['content'])
+    return payload
+
+
+def cache_key(payload):
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def is_deterministic(payload):
+    return payload['parameters'].get('temperature', 1) == 0
+
+
+class CompletionCache:
+    """
+    带TTL的LRU缓存：key -> (过期时间, 回复内容)
+    """
+    def __init__(self, ttl=3600, max_entries=1000, max_chars=2000000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.chars = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, content, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (now + self.ttl, content)
+            self.chars += len(content)
+            while self.entries and (len(self.entries) > self.max_entries or self.chars > self.max_chars):
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.chars -= len(entry[1])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = cache_settings()
+                if config['DETERMINISTIC_ONLY'] and not is_deterministic(build_payload([])):
+                    logger.warning("回复缓存设置了DETERMINISTIC_ONLY，但模型temperature不为0，所有请求都不会使用缓存")
+                _cache = CompletionCache(config['TTL'], config['MAX_ENTRIES'], config['MAX_CHARS'])
+    return _cache
+
+
+def lookup(messages):
+    """
+    返回 (缓存键, 命中的回复)；不使用缓存时缓存键为None
+    """
+    config = cache_settings()
+    if not config['ENABLED']:
+        return None, None
+    cache = get_completion_cache()
+    payload = normalized_payload(messages)
+    if config['DETERMINISTIC_ONLY'] and not is_deterministic(payload):
+        CACHE_LOOKUPS.inc(result='bypass')
+        return None, None
+    key = cache_key(payload)
+    cached = cache.get(key)
+    CACHE_LOOKUPS.inc(result='hit' if cached else 'miss')
+    return key, cached
+
+
+def store(key, api_response):
+    """
+    缓存上游的回复，空回复和过长的回复不缓存
+    """
+    content = api_response.get('content')
+    if key is None or not content or len(content) > cache_settings()['MAX_RESPONSE_CHARS']:
+        return
+    get_completion_cache().set(key, content)
+
+
+def cached_response(content):
+    """
+    命中缓存时返回给视图的结果：没有消耗token
+    """
+    return {
+        'content': content,
+        'usage': {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0},
+        'cache_hit': True,
+    }
@@ -0,0 +1,213 @@
+"""
+服务端对话上下文组装
+
+客户端只需发送 conversation_id 和新的用户消息，历史消息由服务端从 Message 表重建。
+每个对话的上下文缓存在Django缓存中，结构为：
+
+    {'last_id': 最后一条消息的id, 'messages': [{'id', 'role', 'content', 'token_count'}, ...]}
+
+读取时只查询 id > last_id 的新消息并追加到缓存末尾（增量更新），
+清空/删除对话或出现乱序写入时整体失效，下次读取从数据库重建。
+只有状态为success的消息会进入上下文，等待回复和失败的消息不会发送给大模型。
+
+发送给大模型前由 trim_context 按token预算裁剪：保留system消息和最新的对话轮次，
+超出预算的最早轮次被丢弃，或（summarize策略）压缩成一条摘要消息。
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Message
+from .tokens import estimate_tokens, message_tokens, MESSAGE_OVERHEAD_TOKENS
+
+
+CONTEXT_CACHE_TIMEOUT = getattr(settings, 'CHAT_CONTEXT_CACHE_TIMEOUT', 60 * 60)
+
+CONTEXT_FIELDS = ('id', 'role', 'content', 'token_count')
+
+# 上下文窗口默认配置，可通过 settings.CHAT_CONTEXT_WINDOW 覆盖
+DEFAULT_WINDOW_SETTINGS = {
+    'TOKEN_BUDGET': 6000,       # 发送给大模型的消息总token预算
+    'STRATEGY': 'drop',         # drop: 丢弃最早的轮次; summarize: 压缩为摘要消息
+    'SUMMARY_TOKENS': 400,      # 摘要消息的token上限（计入总预算）
+    'SUMMARY_SNIPPET_CHARS': 60,  # 摘要中每条消息保留的字符数
+}
+
+ROLE_LABELS = {'user': '用户', 'assistant': '助手', 'system': '系统'}
+
+
+def context_cache_key(conversation_id):
+    return f"chat_context_{conversation_id}"
+
+
+def _fetch_messages(conversation_id, after_id=0):
+    queryset = Message.objects.filter(
+        conversation_id=conversation_id,
+        status=Message.Status.SUCCESS,
+        id__gt=after_id
+    ).order_by('id')
+    messages = list(queryset.values(*CONTEXT_FIELDS))
+
+    # 迁移前写入的消息没有token_count，估算后写回数据库
+    missing = [m for m in messages if m['token_count'] is None]
+    if missing:
+        for message in missing:
+            message['token_count'] = estimate_tokens(message['content'])
+        Message.objects.bulk_update(
+            [Message(id=m['id'], token_count=m['token_count']) for m in missing],
+            ['token_count'], batch_size=500
+        )
+    return messages
+
+
+def load_context(conversation_id):
+    """
+    返回对话的历史消息列表 [{'id', 'role', 'content', 'token_count'}]，按写入顺序排列
+    """
+    key = context_cache_key(conversation_id)
+    entry = cache.get(key)
+
+    if entry is None:
+        messages = _fetch_messages(conversation_id)
+        entry = {'last_id': messages[-1]['id'] if messages else 0, 'messages': messages}
+        cache.set(key, entry, CONTEXT_CACHE_TIMEOUT)
+        return messages
+
+    # 增量更新：只取缓存之后新写入的消息
+    new_messages = _fetch_messages(conversation_id, entry['last_id'])
+    if new_messages:
+        entry['messages'].extend(new_messages)
+        entry['last_id'] = new_messages[-1]['id']
+        cache.set(key, entry, CONTEXT_CACHE_TIMEOUT)
+    return entry['messages']
+
+
+def append_to_context(conversation_id, messages):
+    """
+    把刚写入的消息追加到缓存的上下文中
+
+    并发请求可能导致消息id与写入完成的顺序不一致（例如较早创建的用户消息较晚才标记为success），
+    此时增量读取会漏掉这条消息，所以直接让缓存失效
+    """
+    key = context_cache_key(conversation_id)
+    entry = cache.get(key)
+    if entry is None:
+        return
+
+    messages = sorted(messages, key=lambda m: m.id)
+    if messages and messages[0].id <= entry['last_id']:
+        known_ids = {m['id'] for m in entry['messages']}
+        if any(m.id not in known_ids for m in messages):
+            cache.delete(key)
+        return
+
+    for message in messages:
+        entry['messages'].append({field: getattr(message, field) for field in CONTEXT_FIELDS})
+    if messages:
+        entry['last_id'] = messages[-1].id
+    cache.set(key, entry, CONTEXT_CACHE_TIMEOUT)
+
+
+def invalidate_context(conversation_id):
+    """
+    清空或删除对话的消息后调用，下次读取时从数据库重建
+    """
+    cache.delete(context_cache_key(conversation_id))
+
+
+def invalidate_contexts(conversation_ids):
+    """
+    批量删除对话后调用
+    """
+    cache.delete_many([context_cache_key(conversation_id) for conversation_id in conversation_ids])
+
+
+def window_settings():
+    return {**DEFAULT_WINDOW_SETTINGS, **getattr(settings, 'CHAT_CONTEXT_WINDOW', {})}
+
+
+def summarize_messages(messages, max_tokens, snippet_chars):
+    """
+    把被裁掉的消息压缩成一条system摘要消息（抽取式，不调用大模型）
+
+    每条消息只保留开头的snippet_chars个字符，超出max_tokens时优先保留较新的消息
+    """
+    header = '以下是更早对话内容的摘要：'
+    lines = []
+    used = estimate_tokens(header)
+    for message in reversed(messages):
+        content = ' '.join((message.get('content') or '').split())
+        if len(content) > snippet_chars:
+            content = content[:snippet_chars] + '…'
+        line = f"{ROLE_LABELS.get(message.get('role'), message.get('role'))}: {content}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    lines.reverse()
+    return {'role': 'system', 'content': '\n'.join([header, *lines])}
+
+
+def trim_context(messages, budget=None, strategy=None):
+    """
+    按token预算裁剪发送给大模型的消息列表
+
+    system消息和最后一条消息（本轮的用户输入）总是保留，其余消息从新到旧加入，
+    直到超出预算。返回 (裁剪后的消息列表, 裁剪信息)，裁剪信息会放在响应的usage.context中
+    """
+    config = window_settings()
+    budget = budget or config['TOKEN_BUDGET']
+    strategy = strategy or config['STRATEGY']
+
+    total = sum(message_tokens(m) for m in messages)
+    info = {
+        'strategy': strategy,
+        'budget': budget,
+        'input_messages': len(messages),
+        'input_tokens': total,
+        'kept_messages': len(messages),
+        'dropped_messages': 0,
+        'summarized_messages': 0,
+        'estimated_tokens': total,
+    }
+    if total <= budget or len(messages) <= 1:
+        return messages, info
+
+    system_messages = [m for m in messages[:-1] if m.get('role') == 'system']
+    history = [m for m in messages[:-1] if m.get('role') != 'system']
+    latest = messages[-1]
+
+    # summarize策略预留摘要消息的空间
+    reserve = config['SUMMARY_TOKENS'] if strategy == 'summarize' else 0
+    available = budget - reserve - message_tokens(latest) - sum(message_tokens(m) for m in system_messages)
+
+    kept = []
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if cost > available:
+            break
+        kept.append(message)
+        available -= cost
+    kept.reverse()
+
+    # 保证历史以用户消息开头，避免孤立的助手回复
+    while kept and kept[0].get('role') == 'assistant':
+        kept.pop(0)
+
+    dropped = history[:len(history) - len(kept)]
+    summary = None
+    if strategy == 'summarize' and dropped:
+        summary = summarize_messages(
+            dropped, config['SUMMARY_TOKENS'] - MESSAGE_OVERHEAD_TOKENS, config['SUMMARY_SNIPPET_CHARS']
+        )
+
+    result = [*system_messages, *([summary] if summary else []), *kept, latest]
+    info.update({
+        'kept_messages': len(system_messages) + len(kept) + 1,
+        'dropped_messages': len(dropped),
+        'summarized_messages': len(dropped) if summary else 0,
+        'estimated_tokens': sum(message_tokens(m) for m in result),
+    })
+    return result, info
@@ -0,0 +1,501 @@
+"""
+DashScope大模型HTTP客户端
+
+chat.views 中的同步/异步对话接口共用此模块：
+- 同步调用使用带连接池的 requests.Session（keep-alive，避免每次请求重新握手）
+- 异步调用为每个事件循环维护一个 httpx.AsyncClient
+- 连接/读取超时、对429/5xx的抖动指数退避重试，重试次数受全局重试预算限制
+- 记录每次调用的耗时、状态码与重试次数；非流式调用收到响应头时把等待时间计入请求的 llm_ttfb 阶段
+  （见tools.timing，流式调用由视图在收到首个分块时记录）
+"""
+import time
+import json
+import random
+import asyncio
+import weakref
+import threading
+from collections import deque
+
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from tools.timing import record
+
+from .metrics import observe_llm_call
+
+
+DEFAULT_API_URL = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+
+# 客户端默认配置，可通过 settings.DASHSCOPE_CLIENT 覆盖
+DEFAULT_CLIENT_SETTINGS = {
+    'POOL_CONNECTIONS': 10,          # 连接池数量（按host）
+    'POOL_MAXSIZE': 50,              # 每个host保持的最大连接数
+    'ASYNC_MAX_CONNECTIONS': 1000,   # 异步客户端的最大并发连接数
+    'CONNECT_TIMEOUT': 5.0,          # 建立连接超时（秒）
+    'READ_TIMEOUT': 120.0,           # 读取超时（秒），流式调用时为两段数据之间的最长间隔
+    'MAX_RETRIES': 3,                # 单次调用的最大重试次数
+    'BACKOFF_BASE': 0.5,             # 退避基数（秒）
+    'BACKOFF_MAX': 8.0,              # 单次退避上限（秒）
+    'RETRY_BUDGET_RATIO': 0.1,       # 每个请求为重试预算存入的令牌数
+    'RETRY_BUDGET_MIN_PER_SECOND': 1.0,  # 无论流量多少，每秒至少允许的重试次数
+}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 模型采样参数默认值，可通过 settings.DASHSCOPE_PARAMETERS 覆盖
+DEFAULT_MODEL_PARAMETERS = {
+    'temperature': 0.7,
+    'top_p': 0.8,
+}
+
+
+class LLMError(Exception):
+    """
+    大模型调用失败
+    """
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RetryBudget:
+    """
+    全局重试预算
+
+    每个请求存入ratio个令牌，每次重试消耗一个令牌，另外每秒固定补充
+    min_per_second个令牌。上游整体故障时重试总量被限制在正常流量的一定比例内，
+    避免重试风暴把上游进一步压垮。
+    """
+    def __init__(self, ratio=0.1, min_per_second=1.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        # 令牌上限：约10秒的最低重试量，防止长时间空闲后积攒过多
+        self.max_tokens = max(1.0, min_per_second * 10)
+        self.tokens = self.max_tokens
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def deposit(self):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self):
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class LatencyStats:
+    """
+    调用耗时与结果统计（进程内）
+    """
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.status_codes = {}
+
+    def record(self, latency, status_code=None, retries=0, error=False):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            if error:
+                self.errors += 1
+            if status_code is not None:
+                self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            self.samples.append(latency)
+        observe_llm_call(latency, status_code, retries)
+
+    def record_budget_exhausted(self):
+        with self.lock:
+            self.budget_exhausted += 1
+
+    def snapshot(self):
+        with self.lock:
+            ordered = sorted(self.samples)
+            data = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'budget_exhausted': self.budget_exhausted,
+                'status_codes': dict(self.status_codes),
+            }
+        for name, pct in (('p50', 50), ('p95', 95), ('p99', 99)):
+            if ordered:
+                index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+                data[f'{name}_ms'] = round(ordered[index] * 1000, 1)
+            else:
+                data[f'{name}_ms'] = None
+        return data
+
+
+def format_messages(messages):
+    """
+    转换消息格式以适应DashScope API
+    """
+    formatted_messages = []
+    for msg in messages:
+        role = msg.get('role')
+        content = msg.get('content')
+
+        # DashScope使用system/user/assistant角色
+        if role in ['system', 'user', 'assistant']:
+            formatted_messages.append({
+                "role": role,
+                "content": content
+            })
+
+    return formatted_messages
+
+
+def model_parameters():
+    return {**DEFAULT_MODEL_PARAMETERS, **getattr(settings, 'DASHSCOPE_PARAMETERS', {})}
+
+
+def build_payload(messages, incremental=False):
+    """
+    构建DashScope请求体
+    """
+    payload = {
+        "model": "qwen-max",  # 使用通义千问Max模型
+        "input": {
+            "messages": format_messages(messages)
+        },
+        "parameters": {
+            **model_parameters(),
+            "result_format": "message"
+        }
+    }
+    if incremental:
+        # 增量输出：每个事件只包含新生成的片段
+        payload["parameters"]["incremental_output"] = True
+    return payload
+
+
+def parse_result(result):
+    """
+    从DashScope响应中提取回复内容和用量
+    """
+    content = result.get("output", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
+    usage = result.get("usage", {})
+    return {
+        "content": content,
+        "usage": usage
+    }
+
+
+def parse_stream_line(line):
+    """
+    解析DashScope SSE响应中的一行，非data行返回None
+
+    流中途出错时DashScope返回带code/message的data，此时抛出异常
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    result = json.loads(line[len('data:'):].strip())
+
+    if 'output' not in result and result.get('code'):
+        raise LLMError(f"API调用失败: {result.get('code')}, {result.get('message')}")
+
+    choice = result.get("output", {}).get("choices", [{}])[0]
+    return {
+        "content": choice.get("message", {}).get("content", ""),
+        "usage": result.get("usage", {}),
+        "finish_reason": choice.get("finish_reason")
+    }
+
+
+class DashScopeClient:
+    """
+    DashScope文本生成接口客户端，进程内共享一个实例（见get_client）
+    """
+    def __init__(self, api_key, url=DEFAULT_API_URL, **options):
+        config = {**DEFAULT_CLIENT_SETTINGS, **options}
+        self.api_key = api_key
+        self.url = url
+        self.config = config
+        self.max_retries = config['MAX_RETRIES']
+        self.timeout = (config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+        self.retry_budget = RetryBudget(config['RETRY_BUDGET_RATIO'], config['RETRY_BUDGET_MIN_PER_SECOND'])
+        self.stats = LatencyStats()
+
+        # 同步连接池，重试由本类统一处理，adapter本身不重试
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config['POOL_CONNECTIONS'],
+            pool_maxsize=config['POOL_MAXSIZE'],
+            max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # 每个事件循环一个异步客户端，httpx的连接不能跨事件循环复用
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def headers(self, stream=False):
+        if not self.api_key:
+            raise ValueError("DashScope API密钥未配置")
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            headers["X-DashScope-SSE"] = "enable"
+        return headers
+
+    def async_client(self):
+        """
+        获取当前事件循环共享的httpx.AsyncClient
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect, read = self.timeout
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(
+                    max_connections=self.config['ASYNC_MAX_CONNECTIONS'],
+                    max_keepalive_connections=self.config['POOL_MAXSIZE']
+                )
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        计算第attempt次重试前的等待时间（全抖动指数退避，优先遵循Retry-After）
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.config['BACKOFF_MAX'])
+            except ValueError:
+                pass
+        ceiling = min(self.config['BACKOFF_MAX'], self.config['BACKOFF_BASE'] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def should_retry(self, attempt):
+        """
+        是否还能重试：受单次调用的重试上限和全局重试预算双重限制
+        """
+        if attempt >= self.max_retries:
+            return False
+        if not self.retry_budget.try_withdraw():
+            self.stats.record_budget_exhausted()
+            return False
+        return True
+
+    def _send(self, payload, stream=False):
+        """
+        发送同步请求，对连接错误和429/5xx按退避策略重试，返回(响应, 重试次数)
+
+        读取超时不重试：请求可能已在上游开始生成，重试会重复计费
+        """
+        headers = self.headers(stream=stream)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    self.url, headers=headers, json=payload,
+                    timeout=self.timeout, stream=stream
+                )
+            except requests.ConnectionError as e:
+                if not self.should_retry(attempt):
+                    raise LLMError(f"网络请求失败: {str(e)}")
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except requests.RequestException as e:
+                raise LLMError(f"网络请求失败: {str(e)}")
+
+            if response.status_code in RETRYABLE_STATUS_CODES and self.should_retry(attempt):
+                delay = self.backoff(attempt, response.headers.get('Retry-After'))
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            return response, attempt
+
+    def generate(self, messages):
+        """
+        同步调用，返回 {"content", "usage"}
+        """
+        started = time.perf_counter()
+        status_code = None
+        retries = 0
+        error = True
+        response = None
+        try:
+            # 以流的方式发送，收到响应头后再读取响应体，两者的耗时分开记录
+            response, retries = self._send(build_payload(messages), stream=True)
+            record('llm_ttfb', time.perf_counter() - started)
+            status_code = response.status_code
+            if status_code != 200:
+                raise LLMError(f"API调用失败: 状态码={status_code}, 响应={response.text}", status_code)
+            try:
+                result = parse_result(response.json())
+            except json.JSONDecodeError as e:
+                raise LLMError(f"响应解析失败: {str(e)}", status_code)
+            except requests.RequestException as e:
+                raise LLMError(f"网络请求失败: {str(e)}", status_code)
+            error = False
+            return result
+        finally:
+            if response is not None:
+                response.close()
+            self.stats.record(time.perf_counter() - started, status_code, retries, error)
+
+    def generate_stream(self, messages):
+        """
+        同步流式调用，逐段产出 {"content", "usage", "finish_reason"}
+
+        只在收到首个字节前重试，开始输出后出错直接抛出
+        """
+        started = time.perf_counter()
+        status_code = None
+        retries = 0
+        error = True
+        response = None
+        try:
+            response, retries = self._send(build_payload(messages, incremental=True), stream=True)
+            status_code = response.status_code
+            if status_code != 200:
+                raise LLMError(f"API调用失败: 状态码={status_code}, 响应={response.text}", status_code)
+
+            for line in response.iter_lines(decode_unicode=True):
+                chunk = parse_stream_line(line)
+                if chunk is not None:
+                    yield chunk
+            error = False
+        except requests.RequestException as e:
+            raise LLMError(f"网络请求失败: {str(e)}", status_code)
+        except json.JSONDecodeError as e:
+            raise LLMError(f"响应解析失败: {str(e)}", status_code)
+        finally:
+            if response is not None:
+                response.close()
+            self.stats.record(time.perf_counter() - started, status_code, retries, error)
+
+    async def _asend(self, payload, stream=False):
+        """
+        _send的异步版本；stream=True时返回尚未读取响应体的流式响应
+        """
+        headers = self.headers(stream=stream)
+        client = self.async_client()
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                request = client.build_request('POST', self.url, headers=headers, json=payload)
+                response = await client.send(request, stream=stream)
+            except httpx.ConnectError as e:
+                if not self.should_retry(attempt):
+                    raise LLMError(f"网络请求失败: {str(e)}")
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except httpx.HTTPError as e:
+                raise LLMError(f"网络请求失败: {str(e)}")
+
+            if response.status_code in RETRYABLE_STATUS_CODES and self.should_retry(attempt):
+                delay = self.backoff(attempt, response.headers.get('Retry-After'))
+                await response.aclose()
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            return response, attempt
+
+    async def agenerate(self, messages):
+        """
+        异步调用，返回 {"content", "usage"}
+        """
+        started = time.perf_counter()
+        status_code = None
+        retries = 0
+        error = True
+        response = None
+        try:
+            response, retries = await self._asend(build_payload(messages), stream=True)
+            record('llm_ttfb', time.perf_counter() - started)
+            status_code = response.status_code
+            try:
+                await response.aread()
+            except httpx.HTTPError as e:
+                raise LLMError(f"网络请求失败: {str(e)}", status_code)
+            if status_code != 200:
+                raise LLMError(f"API调用失败: 状态码={status_code}, 响应={response.text}", status_code)
+            try:
+                result = parse_result(response.json())
+            except json.JSONDecodeError as e:
+                raise LLMError(f"响应解析失败: {str(e)}", status_code)
+            error = False
+            return result
+        finally:
+            if response is not None:
+                await response.aclose()
+            self.stats.record(time.perf_counter() - started, status_code, retries, error)
+
+    async def agenerate_stream(self, messages):
+        """
+        异步流式调用，逐段产出 {"content", "usage", "finish_reason"}
+        """
+        started = time.perf_counter()
+        status_code = None
+        retries = 0
+        error = True
+        response = None
+        try:
+            response, retries = await self._asend(build_payload(messages, incremental=True), stream=True)
+            status_code = response.status_code
+            if status_code != 200:
+                body = (await response.aread()).decode('utf-8', errors='replace')
+                raise LLMError(f"API调用失败: 状态码={status_code}, 响应={body}", status_code)
+
+            async for line in response.aiter_lines():
+                chunk = parse_stream_line(line)
+                if chunk is not None:
+                    yield chunk
+            error = False
+        except httpx.HTTPError as e:
+            raise LLMError(f"网络请求失败: {str(e)}", status_code)
+        except json.JSONDecodeError as e:
+            raise LLMError(f"响应解析失败: {str(e)}", status_code)
+        finally:
+            if response is not None:
+                await response.aclose()
+            self.stats.record(time.perf_counter() - started, status_code, retries, error)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    获取进程内共享的DashScope客户端（按settings懒加载）
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DashScopeClient(
+                    api_key=getattr(settings, 'DASHSCOPE_API_KEY', ''),
+                    url=getattr(settings, 'DASHSCOPE_API_URL', DEFAULT_API_URL),
+                    **getattr(settings, 'DASHSCOPE_CLIENT', {})
+                )
+    return _client
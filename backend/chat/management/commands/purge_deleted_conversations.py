@@ -0,0 +1,48 @@
+"""
+物理删除已软删除的对话及其消息，开启 CHAT_SOFT_DELETE 时需要由cron等定时执行，例如每小时:
+    0 * * * * cd /path/to/backend && python manage.py purge_deleted_conversations --older-than-hours 1
+
+用法:
+    python manage.py purge_deleted_conversations                    # 清理全部已软删除的对话
+    python manage.py purge_deleted_conversations --older-than-hours 24
+    python manage.py purge_deleted_conversations --limit 1000 --chunk-size 5000
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import Conversation
+
+
+class Command(BaseCommand):
+    help = '分批物理删除已软删除的对话及其消息'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=float, default=0,
+                            help='只清理软删除超过指定小时数的对话')
+        parser.add_argument('--limit', type=int, default=None, help='本次最多清理的对话数')
+        parser.add_argument('--chunk-size', type=int, default=None, help='每批删除的消息数')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批处理的对话数')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['older_than_hours'])
+        queryset = Conversation.all_objects.filter(deleted_at__isnull=False, deleted_at__lte=cutoff).order_by('id')
+
+        purged_conversations = purged_messages = 0
+        limit = options['limit']
+        while limit is None or purged_conversations < limit:
+            size = options['batch_size'] if limit is None else min(options['batch_size'], limit - purged_conversations)
+            ids = list(queryset.values_list('id', flat=True)[:size])
+            if not ids:
+                break
+            conversations, messages = Conversation.all_objects.filter(id__in=ids).purge(
+                chunk_size=options['chunk_size']
+            )
+            purged_conversations += conversations
+            purged_messages += messages
+            self.stdout.write(f'已清理 {purged_conversations} 个对话, {purged_messages} 条消息')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'清理完成: {purged_conversations} 个对话, {purged_messages} 条消息'
+        ))
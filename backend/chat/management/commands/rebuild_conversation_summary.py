@@ -0,0 +1,62 @@
+"""
+回填或修复对话的冗余摘要字段（message_count、last_message_preview、last_message_at、total_tokens）
+
+用法:
+    python manage.py rebuild_conversation_summary            # 重算全部对话
+    python manage.py rebuild_conversation_summary --check    # 只检查不一致的对话，不写入
+    python manage.py rebuild_conversation_summary --conversation 12 --conversation 15
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import Conversation, SUMMARY_FIELDS, summary_expressions
+
+
+class Command(BaseCommand):
+    help = '根据Message表回填或修复对话的摘要字段'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', type=int, action='append', dest='conversation_ids',
+                            help='只处理指定的对话ID，可重复指定')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批更新的对话数')
+        parser.add_argument('--check', action='store_true', help='只报告不一致的对话，不写入')
+
+    def handle(self, *args, **options):
+        queryset = Conversation.objects.order_by('id')
+        if options['conversation_ids']:
+            queryset = queryset.filter(id__in=options['conversation_ids'])
+
+        if options['check']:
+            self.check_summaries(queryset, options['batch_size'])
+            return
+
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # 每批一条带相关子查询的UPDATE，短事务避免长时间锁表
+            with transaction.atomic():
+                updated += Conversation.objects.filter(id__in=ids).update(**summary_expressions())
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'已重算 {updated} 个对话的摘要字段'))
+
+    def check_summaries(self, queryset, batch_size):
+        expected = {f'expected_{field}': expression for field, expression in summary_expressions().items()}
+        mismatched = 0
+        for conversation in queryset.annotate(**expected).iterator(chunk_size=batch_size):
+            diffs = [
+                f'{field}: {getattr(conversation, field)!r} != {getattr(conversation, f"expected_{field}")!r}'
+                for field in SUMMARY_FIELDS
+                if getattr(conversation, field) != getattr(conversation, f'expected_{field}')
+            ]
+            if diffs:
+                mismatched += 1
+                self.stdout.write(f'对话 {conversation.id}: ' + '; '.join(diffs))
+
+        if mismatched:
+            self.stdout.write(self.style.WARNING(f'{mismatched} 个对话的摘要字段与消息不一致'))
+        else:
+            self.stdout.write(self.style.SUCCESS('所有对话的摘要字段一致'))
@@ -0,0 +1,71 @@
+"""
+对话相关的指标（见tools.metrics，通过 api/v1/metrics/ 采集）
+"""
+import time
+
+from tools.metrics import Counter, Gauge, Histogram
+
+# view: sync/async 接口；stream: 是否以SSE返回；
+# outcome: success/invalid/error/rejected(并发超限)/disconnected(客户端中途断开)
+COMPLETION_REQUESTS = Counter(
+    'chat_completion_requests_total', '对话请求数',
+    ['view', 'stream', 'outcome'],
+)
+COMPLETION_DURATION = Histogram(
+    'chat_completion_duration_seconds', '对话请求从进入视图到回复完成的耗时',
+    ['view', 'stream', 'outcome'],
+)
+COMPLETIONS_IN_FLIGHT = Gauge('chat_completions_in_flight', '正在进行的对话请求数（含流式响应）')
+COMPLETIONS_QUEUED = Gauge('chat_completions_queued', '等待调用名额的对话请求数')
+
+LLM_REQUESTS = Counter('dashscope_requests_total', 'DashScope调用次数（按最终状态码，网络错误为error）', ['status'])
+LLM_DURATION = Histogram('dashscope_request_duration_seconds', 'DashScope调用耗时（含重试）')
+LLM_RETRIES = Counter('dashscope_retries_total', 'DashScope调用的重试次数')
+LLM_TOKENS = Counter('llm_tokens_total', '大模型消耗的token数', ['type'])
+
+
+def completion_outcome(status_code):
+    """
+    非流式响应按状态码归类
+    """
+    if status_code == 429:
+        return 'rejected'
+    if status_code < 400:
+        return 'success'
+    if status_code < 500:
+        return 'invalid'
+    return 'error'
+
+
+def observe_completion(view, stream, outcome, started):
+    labels = {'view': view, 'stream': 'true' if stream else 'false', 'outcome': outcome}
+    COMPLETION_REQUESTS.inc(**labels)
+    COMPLETION_DURATION.observe(time.perf_counter() - started, **labels)
+
+
+def observe_usage(usage):
+    """
+    记录一次调用返回的token用量（DashScope的usage: input_tokens/output_tokens/total_tokens）
+    """
+    usage = usage or {}
+    if 'input_tokens' in usage or 'output_tokens' in usage:
+        LLM_TOKENS.inc(usage.get('input_tokens', 0), type='input')
+        LLM_TOKENS.inc(usage.get('output_tokens', 0), type='output')
+    elif usage.get('total_tokens'):
+        LLM_TOKENS.inc(usage['total_tokens'], type='total')
+
+
+def observe_llm_call(latency, status_code, retries):
+    LLM_REQUESTS.inc(status='error' if status_code is None else status_code)
+    LLM_DURATION.observe(latency)
+    if retries:
+        LLM_RETRIES.inc(retries)
+
+
+def _admission_stats(key):
+    from .admission import get_admission_controller
+    return get_admission_controller().stats()[key]
+
+
+COMPLETIONS_IN_FLIGHT.set_function(lambda: _admission_stats('in_flight'))
+COMPLETIONS_QUEUED.set_function(lambda: _admission_stats('queued'))
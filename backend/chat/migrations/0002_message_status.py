@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "等待回复"),
+                    ("success", "成功"),
+                    ("failed", "失败"),
+                ],
+                default="success",
+                max_length=10,
+                verbose_name="状态",
+            ),
+        ),
+    ]
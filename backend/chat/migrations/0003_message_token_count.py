@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_message_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="token_count",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="估算令牌数"
+            ),
+        ),
+    ]
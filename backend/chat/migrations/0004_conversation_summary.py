@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_summary(apps, schema_editor):
+    Conversation = apps.get_model("chat", "Conversation")
+    Message = apps.get_model("chat", "Message")
+    messages = Message.objects.filter(conversation=OuterRef("pk")).order_by()
+    latest = Message.objects.filter(conversation=OuterRef("pk")).order_by(
+        "-created_at", "-id"
+    )
+    Conversation.objects.update(
+        message_count=Coalesce(
+            Subquery(
+                messages.values("conversation").annotate(c=Count("id")).values("c")
+            ),
+            0,
+        ),
+        total_tokens=Coalesce(
+            Subquery(
+                messages.values("conversation")
+                .annotate(t=Sum("tokens_used"))
+                .values("t")
+            ),
+            0,
+        ),
+        last_message_preview=Coalesce(
+            Substr(Subquery(latest.values("content")[:1]), 1, 100), Value("")
+        ),
+        last_message_at=Subquery(latest.values("created_at")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0003_message_token_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="最后消息时间"
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_preview",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="最后一条消息预览"
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="消息数"),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="total_tokens",
+            field=models.PositiveIntegerField(default=0, verbose_name="累计使用令牌数"),
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
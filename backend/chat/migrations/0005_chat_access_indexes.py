@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_conversation_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "-updated_at", "-id"], name="chat_conv_user_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "created_at", "id"],
+                name="chat_msg_conv_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0005_chat_access_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="deleted_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="删除时间"
+            ),
+        ),
+    ]
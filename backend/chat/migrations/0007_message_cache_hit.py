@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0006_conversation_soft_delete"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="cache_hit",
+            field=models.BooleanField(default=False, verbose_name="命中缓存"),
+        ),
+    ]
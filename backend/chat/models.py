@@ -1,9 +1,76 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Substr
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from tools.deletion import delete_in_chunks
+from .tokens import estimate_tokens
+
 User = get_user_model()
 
+# 对话列表中最后一条消息预览的最大长度
+PREVIEW_LENGTH = 100
+
+SUMMARY_FIELDS = ['message_count', 'last_message_preview', 'last_message_at', 'total_tokens']
+
+# 分批删除消息时每批的行数
+DELETE_CHUNK_SIZE = getattr(settings, 'CHAT_DELETE_CHUNK_SIZE', 2000)
+
+
+def summary_expressions():
+    """
+    按Message表重新计算对话摘要字段的表达式，用于 Conversation.objects.update(**summary_expressions())
+    """
+    messages = Message.objects.filter(conversation=models.OuterRef('pk')).order_by()
+    latest = Message.objects.filter(conversation=models.OuterRef('pk')).order_by('-created_at', '-id')
+    return {
+        'message_count': Coalesce(
+            models.Subquery(messages.values('conversation').annotate(c=models.Count('id')).values('c')), 0
+        ),
+        'total_tokens': Coalesce(
+            models.Subquery(messages.values('conversation').annotate(t=models.Sum('tokens_used')).values('t')), 0
+        ),
+        'last_message_preview': Coalesce(
+            Substr(models.Subquery(latest.values('content')[:1]), 1, PREVIEW_LENGTH), Value('')
+        ),
+        'last_message_at': models.Subquery(latest.values('created_at')[:1]),
+    }
+
+
+class ConversationQuerySet(models.QuerySet):
+    def soft_delete(self):
+        """
+        软删除：只标记deleted_at，耗时与对话的消息数无关，数据由purge_deleted_conversations命令清理
+        """
+        return self.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+    
+    def purge(self, chunk_size=None, batch_size=500):
+        """
+        物理删除：先分批删除消息，再删除对话，返回 (对话数, 消息数)
+        """
+        chunk_size = chunk_size or DELETE_CHUNK_SIZE
+        ids = list(self.values_list('pk', flat=True))
+        conversations = messages = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            messages += delete_in_chunks(Message.objects.filter(conversation_id__in=batch), chunk_size)
+            # 消息已删除，级联不会再加载任何行
+            _total, deleted = Conversation.all_objects.filter(pk__in=batch).delete()
+            conversations += deleted.get(Conversation._meta.label, 0)
+        return conversations, messages
+
+
+class ActiveConversationManager(models.Manager.from_queryset(ConversationQuerySet)):
+    """
+    默认管理器，排除已软删除的对话
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Conversation(models.Model):
     """对话模型"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations', verbose_name=_('用户'))
@@ -11,13 +78,55 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('创建时间'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('更新时间'))
     
+    # 冗余的摘要字段，写入/删除消息时同步更新，列表查询不再需要读取Message表
+    message_count = models.PositiveIntegerField(default=0, verbose_name=_('消息数'))
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='', verbose_name=_('最后一条消息预览'))
+    last_message_at = models.DateTimeField(null=True, blank=True, verbose_name=_('最后消息时间'))
+    total_tokens = models.PositiveIntegerField(default=0, verbose_name=_('累计使用令牌数'))
+    
+    # 软删除时间，非空的对话对用户不可见，由清理任务物理删除
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name=_('删除时间'))
+    
+    objects = ActiveConversationManager()
+    all_objects = ConversationQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('对话')
         verbose_name_plural = _('对话')
         ordering = ['-updated_at']
+        indexes = [
+            # 侧边栏列表：按用户过滤、按更新时间倒序的游标分页
+            models.Index(fields=['user', '-updated_at', '-id'], name='chat_conv_user_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
+    
+    def refresh_summary(self):
+        """
+        从Message表重新计算摘要字段
+        """
+        Conversation.objects.filter(pk=self.pk).update(**summary_expressions())
+        self.refresh_from_db(fields=SUMMARY_FIELDS)
+    
+    def clear_messages(self, chunk_size=None):
+        """
+        分批删除对话中的全部消息并重新计算摘要字段，返回删除的消息数
+
+        只删除开始清空时已存在的消息，清空期间新写入的消息会保留
+        """
+        last_id = Message.objects.filter(conversation=self).order_by('-id').values_list('id', flat=True).first()
+        if last_id is None:
+            return 0
+        count = delete_in_chunks(
+            Message.objects.filter(conversation=self, id__lte=last_id), chunk_size or DELETE_CHUNK_SIZE
+        )
+        self.refresh_summary()
+        return count
+    
+    def soft_delete(self):
+        Conversation.objects.filter(pk=self.pk).soft_delete()
+        self.deleted_at = timezone.now()
 
 class Message(models.Model):
     """消息模型"""
@@ -27,18 +136,69 @@ class Message(models.Model):
         ('system', _('系统')),
     )
     
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('等待回复')
+        SUCCESS = 'success', _('成功')
+        FAILED = 'failed', _('失败')
+    
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', verbose_name=_('对话'))
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name=_('角色'))
     content = models.TextField(verbose_name=_('内容'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('创建时间'))
     
+    # 用户消息在收到AI回复前为pending，上游调用失败时标记为failed
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.SUCCESS, verbose_name=_('状态'))
+    
     # 用于跟踪API使用情况的字段
     tokens_used = models.IntegerField(null=True, blank=True, verbose_name=_('使用的令牌数'))
+    # 消息内容的估算token数，用于上下文窗口裁剪
+    token_count = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('估算令牌数'))
+    # 回复来自回复缓存（chat.completion_cache），此时tokens_used为0
+    cache_hit = models.BooleanField(default=False, verbose_name=_('命中缓存'))
     
     class Meta:
         verbose_name = _('消息')
         verbose_name_plural = _('消息')
         ordering = ['created_at']
+        indexes = [
+            # 历史消息：按对话过滤、按创建时间排序的游标分页和上下文加载
+            models.Index(fields=['conversation', 'created_at', 'id'], name='chat_msg_conv_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.role}: {self.content[:50]}..." 
\ No newline at end of file
+        return f"{self.role}: {self.content[:50]}..."
+    
+    def save(self, *args, **kwargs):
+        if self.token_count is None:
+            self.token_count = estimate_tokens(self.content)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'token_count'}
+        
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        
+        # 新消息与对话摘要字段在同一事务中更新，计数使用F表达式避免并发写入丢失
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            is_latest = Q(last_message_at__isnull=True) | Q(last_message_at__lte=self.created_at)
+            Conversation.objects.filter(pk=self.conversation_id).update(
+                message_count=F('message_count') + 1,
+                total_tokens=F('total_tokens') + (self.tokens_used or 0),
+                last_message_preview=Case(
+                    When(is_latest, then=Value((self.content or '')[:PREVIEW_LENGTH])),
+                    default=F('last_message_preview')
+                ),
+                last_message_at=Case(
+                    When(is_latest, then=Value(self.created_at)),
+                    default=F('last_message_at')
+                ),
+            )
+    
+    def delete(self, *args, **kwargs):
+        # 删除的可能是最后一条消息，按剩余消息重新计算摘要
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Conversation.objects.filter(pk=self.conversation_id).update(**summary_expressions())
+        return result 
\ No newline at end of file
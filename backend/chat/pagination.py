@@ -0,0 +1,20 @@
+from tools.pagination import KeysetPagination
+
+
+class ConversationPagination(KeysetPagination):
+    """
+    对话列表按最近更新时间倒序分页
+    """
+    ordering = ('-updated_at', '-id')
+
+
+class MessagePagination(KeysetPagination):
+    """
+    对话消息按创建时间分页，descending=True 时从最新的消息开始向前加载
+    """
+    ordering = ('created_at', 'id')
+    page_size = 50
+    max_page_size = 200
+
+    def __init__(self, descending=False):
+        super().__init__(ordering=('-created_at', '-id') if descending else None)
@@ -0,0 +1,232 @@
+"""
+近似提示词的回复缓存（语义缓存，默认关闭）
+
+在精确匹配的回复缓存（chat.completion_cache）之外，最后一轮用户消息意思相近的请求
+（例如只差标点、语气词或个别字的模板化提示词）也直接返回之前的回复：
+
+- 最后一轮用户消息用本地的向量化函数（EMBEDDER，默认 HashedNgramEmbedder：字符n-gram哈希到
+  固定维度，无需模型和网络）转成单位向量，余弦相似度达到 THRESHOLD 才算命中
+- 之前的上下文（历史消息、模型和参数）只做精确匹配：计算上下文指纹，指纹不同的请求不会互相命中
+- 向量保存在预分配的NumPy矩阵中，用随机超平面LSH（TABLES个哈希表，每个BITS位，
+  同时探查相差一位的桶）取候选，只对候选计算相似度；缓存满时淘汰最久未命中的条目
+
+EMBEDDER 可以替换为任何 embed(texts) -> 二维数组 的类，需要输出L2归一化的向量。
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from tools.metrics import Counter
+
+from .completion_cache import normalize_text, normalized_payload
+
+DEFAULT_SEMANTIC_CACHE_SETTINGS = {
+    'ENABLED': False,                     # 是否启用
+    'EMBEDDER': 'chat.semantic_cache.HashedNgramEmbedder',
+    'EMBEDDER_OPTIONS': {},               # 传给EMBEDDER的参数
+    'THRESHOLD': 0.9,                     # 命中需要达到的余弦相似度
+    'TTL': 60 * 60,                       # 缓存有效期（秒）
+    'MAX_ENTRIES': 5000,                  # 最多缓存的回复数
+    'MAX_RESPONSE_CHARS': 8000,           # 超过该长度的回复不缓存
+    'TABLES': 8,                          # LSH哈希表数（越多召回率越高）
+    'BITS': 8,                            # 每个哈希表的超平面数（越多候选越少）
+}
+
+SEMANTIC_LOOKUPS = Counter('chat_semantic_cache_total', '语义缓存查询次数（result: hit/miss/bypass）', ['result'])
+
+
+def semantic_cache_settings():
+    return {**DEFAULT_SEMANTIC_CACHE_SETTINGS, **getattr(settings, 'CHAT_SEMANTIC_CACHE', {})}
+
+
+class HashedNgramEmbedder:
+    """
+    字符n-gram哈希向量化：每个n-gram按crc32哈希到一个维度并带正负号，结果L2归一化
+
+    按字符切分，中文不需要分词；只反映字面相似度，不理解同义词
+    """
+    def __init__(self, dimensions=1024, ngram_range=(1, 3)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def ngrams(self, text):
+        text = normalize_text(text).lower()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in self.ngrams(text):
+                digest = zlib.crc32(gram.encode('utf-8'))
+                vectors[row, digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SemanticIndex:
+    """
+    固定容量的向量索引，LSH分桶取候选后精确计算余弦相似度
+    """
+    def __init__(self, dimensions, max_entries=5000, tables=8, bits=8, ttl=3600, seed=0):
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self.expires = np.zeros(max_entries, dtype=np.float64)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.fingerprints = [None] * max_entries
+        self.contents = [None] * max_entries
+        self.signatures = [None] * max_entries
+        # 随机超平面：planes[t] 是第t个哈希表的 bits 个超平面
+        self.planes = np.random.default_rng(seed).standard_normal((tables, bits, dimensions)).astype(np.float32)
+        self.weights = 1 << np.arange(bits, dtype=np.int64)
+        # 多探针：查询时同时查找与签名相差一位的桶，提高相近向量的召回率
+        self.probes = [0] + [1 << bit for bit in range(bits)]
+        # 每个哈希表：签名 -> 槽位集合
+        self.buckets = [{} for _ in range(tables)]
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def signature(self, vector):
+        bits = (self.planes @ vector) > 0
+        return tuple(int(code) for code in bits.astype(np.int64) @ self.weights)
+
+    def search(self, vector, fingerprint, threshold, now=None):
+        """
+        返回 (回复内容, 相似度)，没有达到阈值的条目时返回 (None, 最高相似度)
+        """
+        now = now or time.monotonic()
+        signature = self.signature(vector)
+        with self.lock:
+            candidates = set()
+            for table, code in zip(self.buckets, signature):
+                for probe in self.probes:
+                    candidates.update(table.get(code ^ probe, ()))
+            slots = [
+                slot for slot in candidates
+                if self.fingerprints[slot] == fingerprint and self.expires[slot] > now
+            ]
+            if not slots:
+                return None, 0.0
+            scores = self.vectors[slots] @ vector
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < threshold:
+                return None, score
+            self.last_used[slots[best]] = now
+            return self.contents[slots[best]], score
+
+    def add(self, vector, fingerprint, content, now=None):
+        now = now or time.monotonic()
+        signature = self.signature(vector)
+        with self.lock:
+            if self.size < self.max_entries:
+                slot = self.size
+                self.size += 1
+            else:
+                # 优先复用已过期的槽位，否则淘汰最久未命中的条目
+                expired = np.flatnonzero(self.expires <= now)
+                slot = int(expired[0]) if len(expired) else int(np.argmin(self.last_used))
+                self._unlink(slot)
+            self.vectors[slot] = vector
+            self.expires[slot] = now + self.ttl
+            self.last_used[slot] = now
+            self.fingerprints[slot] = fingerprint
+            self.contents[slot] = content
+            self.signatures[slot] = signature
+            for table, code in zip(self.buckets, signature):
+                table.setdefault(code, set()).add(slot)
+
+    def _unlink(self, slot):
+        for table, code in zip(self.buckets, self.signatures[slot] or ()):
+            bucket = table.get(code)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del table[code]
+
+    def __len__(self):
+        return self.size
+
+
+def context_fingerprint(messages):
+    """
+    除最后一轮用户消息之外的请求内容（历史消息、模型和参数）的指纹
+    """
+    payload = normalized_payload(messages)
+    payload['input']['messages'] = payload['input']['messages'][:-1]
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, embedder, threshold=0.9, **index_options):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.index = SemanticIndex(embedder.dimensions, **index_options)
+
+    def query(self, messages):
+        """
+        返回 (缓存条目键, 命中的回复)；最后一条不是用户消息时不使用缓存，缓存条目键为None
+        """
+        if not messages or messages[-1].get('role') != 'user' or not normalize_text(messages[-1].get('content')):
+            return None, None
+        vector = self.embedder.embed([messages[-1]['content']])[0]
+        fingerprint = context_fingerprint(messages)
+        content, _score = self.index.search(vector, fingerprint, self.threshold)
+        return (vector, fingerprint), content
+
+    def add(self, entry_key, content):
+        vector, fingerprint = entry_key
+        self.index.add(vector, fingerprint, content)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = semantic_cache_settings()
+                embedder = import_string(config['EMBEDDER'])(**config['EMBEDDER_OPTIONS'])
+                _cache = SemanticCache(
+                    embedder, threshold=config['THRESHOLD'], max_entries=config['MAX_ENTRIES'],
+                    tables=config['TABLES'], bits=config['BITS'], ttl=config['TTL'],
+                )
+    return _cache
+
+
+def lookup(messages):
+    """
+    返回 (缓存条目键, 命中的回复)；未启用或不适用时缓存条目键为None
+    """
+    if not semantic_cache_settings()['ENABLED']:
+        return None, None
+    entry_key, content = get_semantic_cache().query(messages)
+    if entry_key is None:
+        SEMANTIC_LOOKUPS.inc(result='bypass')
+    else:
+        SEMANTIC_LOOKUPS.inc(result='hit' if content is not None else 'miss')
+    return entry_key, content
+
+
+def store(entry_key, api_response):
+    """
+    缓存上游的回复，空回复和过长的回复不缓存
+    """
+    content = api_response.get('content')
+    if entry_key is None or not content or len(content) > semantic_cache_settings()['MAX_RESPONSE_CHARS']:
+        return
+    get_semantic_cache().add(entry_key, content)
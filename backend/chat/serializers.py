@@ -1,44 +1,69 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Conversation, Message
+from .pagination import MessagePagination
+
+# 对话详情内嵌的最近消息数
+DETAIL_MESSAGE_LIMIT = getattr(settings, 'CHAT_DETAIL_MESSAGE_LIMIT', 50)
+
 
 class MessageSerializer(serializers.ModelSerializer):
     """消息序列化器"""
     class Meta:
         model = Message
-        fields = ['id', 'role', 'content', 'created_at', 'tokens_used']
-        read_only_fields = ['id', 'created_at', 'tokens_used']
+        fields = ['id', 'role', 'content', 'created_at', 'tokens_used', 'status', 'cache_hit']
+        read_only_fields = ['id', 'created_at', 'tokens_used', 'status', 'cache_hit']
 
 class ConversationSerializer(serializers.ModelSerializer):
-    """对话序列化器"""
-    messages = MessageSerializer(many=True, read_only=True)
-    message_count = serializers.SerializerMethodField()
+    """
+    对话序列化器
+
+    详情查询只预取最近的消息（recent_messages，按时间倒序），按正序返回；
+    has_more_messages 为真时，用 messages_cursor 调用 messages 子接口（order=desc）加载更早的消息
+    """
+    messages = serializers.SerializerMethodField()
+    has_more_messages = serializers.SerializerMethodField()
+    messages_cursor = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ['id', 'title', 'created_at', 'updated_at', 'messages', 'message_count']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'created_at', 'updated_at', 'messages', 'has_more_messages', 'messages_cursor', 'message_count', 'total_tokens']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'message_count', 'total_tokens']
+    
+    def recent_messages(self, obj):
+        if not hasattr(obj, 'recent_messages'):
+            # 未预取时同样只查询最近的消息，不加载整个对话
+            obj.recent_messages = list(obj.messages.order_by('-created_at', '-id')[:DETAIL_MESSAGE_LIMIT])
+        return obj.recent_messages
     
-    def get_message_count(self, obj):
-        return obj.messages.count()
+    def get_messages(self, obj):
+        return MessageSerializer(reversed(self.recent_messages(obj)), many=True).data
+    
+    def get_has_more_messages(self, obj):
+        return obj.message_count > len(self.recent_messages(obj))
+    
+    def get_messages_cursor(self, obj):
+        if not self.get_has_more_messages(obj):
+            return None
+        return MessagePagination(descending=True).encode_cursor(obj.recent_messages[-1])
 
 class ConversationListSerializer(serializers.ModelSerializer):
-    """对话列表序列化器（不包含完整消息）"""
+    """对话列表序列化器（不包含完整消息，摘要信息来自对话上的冗余字段）"""
     last_message = serializers.SerializerMethodField()
-    message_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ['id', 'title', 'created_at', 'updated_at', 'last_message', 'message_count']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = [
+            'id', 'title', 'created_at', 'updated_at', 'last_message', 'message_count',
+            'last_message_preview', 'last_message_at', 'total_tokens'
+        ]
+        read_only_fields = fields
     
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
-        if last_message:
-            return MessageSerializer(last_message).data
-        return None
-    
-    def get_message_count(self, obj):
-        return obj.messages.count()
+        # 兼容前端的 last_message.content
+        if obj.last_message_at is None:
+            return None
+        return {'content': obj.last_message_preview, 'created_at': obj.last_message_at}
 
 class MessageCreateSerializer(serializers.ModelSerializer):
     """创建消息的序列化器"""
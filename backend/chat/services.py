@@ -0,0 +1,138 @@
+"""
+对话完成流程中的数据库操作
+
+上游大模型调用耗时数秒到数十秒，这里把数据库写入拆成调用前、调用后两个短事务，
+等待模型输出期间不持有数据库连接上的事务和行锁：
+
+1. prepare_completion: 获取或创建对话，保存用户消息（pending）
+2. 调用上游（事务之外）
+3. complete_completion: 保存AI回复并把用户消息标记为success
+   或 fail_completion: 上游失败时把用户消息标记为failed（补偿）
+
+客户端也可以只发送 conversation_id 和新的用户消息（prepare_context_completion），
+历史上下文由 chat.context 从数据库和缓存组装
+"""
+from django.db import transaction
+
+from .models import Conversation, Message
+from .context import load_context, append_to_context
+from .metrics import observe_usage
+
+
+class ConversationNotFound(Exception):
+    """
+    对话不存在或不属于当前用户
+    """
+    def __init__(self, conversation_id):
+        super().__init__(f'对话不存在 (ID: {conversation_id})')
+        self.conversation_id = conversation_id
+
+
+def first_user_content(messages):
+    """
+    返回第一条用户消息的内容，用作对话标题
+    """
+    user_message = next((m for m in messages if m.get('role') == 'user'), None)
+    return user_message.get('content', '新对话') if user_message else None
+
+
+def normalize_user_message(value):
+    """
+    把请求中的message字段规范为 {'role': 'user', 'content': ...}，无效时返回None
+
+    支持纯文本或 {'role': 'user', 'content': '...'} 两种形式
+    """
+    if isinstance(value, str):
+        content = value
+    elif isinstance(value, dict) and value.get('role', 'user') == 'user':
+        content = value.get('content')
+    else:
+        return None
+    if not isinstance(content, str) or not content.strip():
+        return None
+    return {'role': 'user', 'content': content}
+
+
+def prepare_completion(user, messages, conversation_id=None):
+    """
+    第一阶段：获取或创建对话并保存最新的用户消息
+
+    返回 (conversation, user_message)，最新消息不是用户消息时user_message为None
+    """
+    with transaction.atomic():
+        if conversation_id:
+            try:
+                conversation = Conversation.objects.get(id=conversation_id, user=user)
+            except Conversation.DoesNotExist:
+                raise ConversationNotFound(conversation_id)
+        else:
+            # 创建新对话，使用第一条用户消息作为标题
+            title = (first_user_content(messages) or '新对话')[:50]
+            conversation = Conversation.objects.create(user=user, title=title)
+
+        user_message = None
+        latest_message = messages[-1]
+        if latest_message.get('role') == 'user':
+            user_message = Message.objects.create(
+                conversation=conversation,
+                role='user',
+                content=latest_message.get('content'),
+                status=Message.Status.PENDING
+            )
+
+    return conversation, user_message
+
+
+def prepare_context_completion(user, new_message, conversation_id=None):
+    """
+    服务端组装上下文模式的第一阶段：只保存新的用户消息，历史消息从数据库/缓存重建
+
+    返回 (conversation, user_message, messages)，messages为发送给大模型的完整消息列表
+    """
+    conversation, user_message = prepare_completion(user, [new_message], conversation_id)
+    messages = [*load_context(conversation.id), new_message]
+    return conversation, user_message, messages
+
+
+def complete_completion(conversation, user_message, messages, content, usage, cache_hit=False):
+    """
+    第二阶段：保存AI回复，标记用户消息成功，必要时更新对话标题
+
+    cache_hit 为真表示回复来自回复缓存（见chat.completion_cache），没有消耗token
+    """
+    with transaction.atomic():
+        ai_message = Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=content,
+            tokens_used=0 if cache_hit else (usage or {}).get('total_tokens', 0),
+            cache_hit=cache_hit
+        )
+
+        if user_message is not None:
+            Message.objects.filter(pk=user_message.pk).update(status=Message.Status.SUCCESS)
+            user_message.status = Message.Status.SUCCESS
+
+        # 更新对话标题（如果是新对话）
+        if conversation.title == '新对话':
+            title = first_user_content(messages)
+            if title:
+                conversation.title = title[:50]
+                conversation.save(update_fields=['title'])
+
+    # 事务提交后增量更新缓存的上下文
+    new_messages = [user_message, ai_message] if user_message is not None else [ai_message]
+    append_to_context(conversation.id, new_messages)
+    observe_usage(usage)
+
+    return ai_message
+
+
+def fail_completion(user_message):
+    """
+    补偿：上游调用失败时把用户消息标记为failed，避免留下没有回复的孤立消息
+    """
+    if user_message is None:
+        return
+    Message.objects.filter(pk=user_message.pk).update(status=Message.Status.FAILED)
+    user_message.status = Message.Status.FAILED
@@ -0,0 +1,36 @@
+"""
+消息token数估算
+
+不依赖模型分词器的近似估算：中日韩字符按每字1个token计，
+其他字符按每4个字符1个token计。用于上下文窗口裁剪，不用于计费。
+"""
+import math
+import re
+
+
+# 中日韩统一表意文字、假名、全角标点等
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# 每条消息的角色标记等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """
+    估算一段文本的token数
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def message_tokens(message):
+    """
+    估算一条消息（dict）在请求中占用的token数，优先使用已缓存的token_count
+    """
+    count = message.get('token_count')
+    if count is None:
+        count = estimate_tokens(message.get('content') or '')
+    return count + MESSAGE_OVERHEAD_TOKENS
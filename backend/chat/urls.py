@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatCompletionView, ConversationViewSet
+from .views import ChatCompletionView, AsyncChatCompletionView, ConversationViewSet
 
 # 创建路由器并注册视图集
 router = DefaultRouter()
@@ -9,4 +9,6 @@ router.register(r'conversations', ConversationViewSet, basename='conversation')
 urlpatterns = [
     path('', include(router.urls)),
     path('completion/', ChatCompletionView.as_view(), name='chat_completion'),
+    # 原生异步实现，需在ASGI下部署
+    path('completion/async/', AsyncChatCompletionView.as_view(), name='chat_completion_async'),
 ] 
\ No newline at end of file
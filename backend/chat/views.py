@@ -4,21 +4,45 @@ from rest_framework.response import Response
 from rest_framework import status, viewsets, mixins
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-import requests
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+import asyncio
 import json
+import logging
 import os
+import time
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse, JsonResponse, Http404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from django.utils.translation import gettext_lazy as _
 
+from tools.pagination import InvalidCursor
+from tools.timing import atimed_iter, span, timed_iter
+from users.authentication import CachedJWTAuthentication
 from .models import Conversation, Message
+from .pagination import ConversationPagination, MessagePagination
+from .llm_client import get_client
+from .admission import AdmissionRejected, get_admission_controller, hold_for_response
+from .metrics import completion_outcome, observe_completion
+from . import completion_cache, semantic_cache
+from .services import (
+    ConversationNotFound, normalize_user_message,
+    prepare_completion, prepare_context_completion,
+    complete_completion, fail_completion
+)
+from .context import invalidate_context, invalidate_contexts, trim_context
 from .serializers import (
-    ConversationSerializer, ConversationListSerializer,
+    DETAIL_MESSAGE_LIMIT, ConversationSerializer, ConversationListSerializer,
     MessageSerializer, MessageCreateSerializer
 )
 
-# 从环境变量或设置中获取DashScope API密钥
-DASHSCOPE_API_KEY = getattr(settings, 'DASHSCOPE_API_KEY', os.environ.get('DASHSCOPE_API_KEY', ''))
+logger = logging.getLogger(__name__)
 
 # 自定义API响应类
 class ApiResponse:
@@ -26,15 +50,18 @@ class ApiResponse:
     标准化API响应格式
     """
     @staticmethod
-    def success(data=None, message="Success", status_code=200):
+    def success(data=None, message="Success", status_code=200, pagination=None):
         """
-        成功响应
+        成功响应，分页接口额外返回 pagination
         """
-        return Response({
+        body = {
             "code": status_code,
             "message": message,
             "data": data
-        }, status=status_code)
+        }
+        if pagination is not None:
+            body["pagination"] = pagination
+        return Response(body, status=status_code)
     
     @staticmethod
     def error(message="Error", status_code=400, data=None):
@@ -47,22 +74,111 @@ class ApiResponse:
             "data": data
         }, status=status_code)
 
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    SSE渲染器，让 Accept: text/event-stream 的请求通过DRF内容协商，
+    非流式的响应（如参数错误）会被渲染为单个SSE事件
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        code = data.get('code', 200) if isinstance(data, dict) else 200
+        event = 'error' if code >= 400 else 'done'
+        return sse_event(event, data).encode('utf-8')
+
+
+def sse_event(event, data):
+    """
+    构建一条SSE事件文本
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def wants_stream(stream, accept=''):
+    """
+    判断客户端是否请求流式输出：请求体的stream为真（字符串 true/1/yes，不区分大小写），
+    或Accept头包含 text/event-stream
+    """
+    if isinstance(stream, str):
+        stream = stream.strip().lower() in ('true', '1', 'yes')
+    if stream:
+        return True
+    return 'text/event-stream' in (accept or '')
+
+
+def admission_rejected_response(exc, json_response=False):
+    """
+    未获得大模型调用名额时的429响应，Retry-After为建议的等待秒数
+    """
+    data = {'reason': exc.reason, 'retry_after': exc.retry_after}
+    if json_response:
+        response = json_api_response(data, message=str(exc), status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+    else:
+        response = ApiResponse.error(message=str(exc), status_code=status.HTTP_429_TOO_MANY_REQUESTS, data=data)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+def lookup_cached_reply(messages):
+    """
+    依次查询精确匹配的回复缓存和语义缓存，返回 (缓存键, 命中的回复)
+    """
+    key, cached = completion_cache.lookup(messages)
+    if cached is not None:
+        return None, cached
+    semantic_key, cached = semantic_cache.lookup(messages)
+    if cached is not None:
+        logger.debug("命中语义缓存")
+        return None, cached
+    return (key, semantic_key), None
+
+
+def store_cached_reply(keys, api_response):
+    key, semantic_key = keys
+    completion_cache.store(key, api_response)
+    semantic_cache.store(semantic_key, api_response)
+
+
+def json_api_response(data=None, message="Success", status_code=200):
+    """
+    与ApiResponse格式一致的JsonResponse，供不经过DRF的异步视图使用
+    """
+    return JsonResponse({
+        "code": status_code,
+        "message": message,
+        "data": data
+    }, status=status_code, json_dumps_params={'ensure_ascii': False})
+
+
 class ConversationViewSet(viewsets.ModelViewSet):
     """
     对话管理视图集
+
+    列表使用游标分页（?cursor=...&page_size=...），详情只内嵌最近的
+    DETAIL_MESSAGE_LIMIT 条消息，更早的消息通过 messages 子接口分页加载
     """
     permission_classes = [IsAuthenticated]
     serializer_class = ConversationSerializer
+    pagination_class = ConversationPagination
+    
+    DETAIL_MESSAGE_LIMIT = DETAIL_MESSAGE_LIMIT
     
     def get_queryset(self):
         # 只返回当前用户的对话
         queryset = Conversation.objects.filter(user=self.request.user).order_by('-updated_at')
         
-        # 只有在列表查询时才限制为最近10条
-        if self.action == 'list':
-            return queryset[:10]
+        # 详情和修改后的响应只预取最近的消息，避免超长对话的响应过大
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            return queryset.prefetch_related(Prefetch(
+                'messages',
+                queryset=Message.objects.order_by('-created_at', '-id')[:self.DETAIL_MESSAGE_LIMIT],
+                to_attr='recent_messages'
+            ))
         
-        # 其他操作（如retrieve详情查询）返回完整查询集
+        # 列表的消息数、最后一条消息等摘要直接读取对话上的冗余字段，不查询Message表
         return queryset
     
     def get_serializer_class(self):
@@ -74,39 +190,52 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         # 创建对话时自动关联当前用户
         try:
-            print(f"创建新对话: {serializer.validated_data}")
+            logger.debug("创建新对话: %s", serializer.validated_data)
             instance = serializer.save(user=self.request.user)
-            print(f"对话创建成功: id={instance.id}, title={instance.title}")
-        except Exception as e:
-            print(f"创建对话失败: {str(e)}")
+            logger.info("对话创建成功: id=%s", instance.id)
+        except Exception:
+            logger.exception("创建对话失败")
             raise
     
+    def perform_destroy(self, instance):
+        # 软删除立即返回；关闭软删除时分批物理删除，不把消息加载到内存
+        if settings.CHAT_SOFT_DELETE:
+            instance.soft_delete()
+        else:
+            Conversation.objects.filter(pk=instance.pk).purge()
+    
     def list(self, request, *args, **kwargs):
         try:
-            print(f"获取用户 {request.user.username} 的对话列表")
+            logger.debug("获取用户 %s 的对话列表", request.user.pk)
             queryset = self.filter_queryset(self.get_queryset())
-            print(f"找到 {queryset.count()} 个对话")
             
             # 如果需要分页
             page = self.paginate_queryset(queryset)
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
+                with span('serialize'):
+                    data = serializer.data
                 # 不使用分页器的响应格式，直接返回标准格式
                 return ApiResponse.success(
-                    serializer.data,
+                    data,
                     message="成功",
-                    status_code=200
+                    status_code=200,
+                    pagination=self.paginator.get_pagination_data()
                 )
             
             serializer = self.get_serializer(queryset, many=True)
+            with span('serialize'):
+                data = serializer.data
             
             return ApiResponse.success(
-                serializer.data,
+                data,
                 message="成功",
                 status_code=200
             )
+        except InvalidCursor as e:
+            return ApiResponse.error(message=str(e.detail[0]), status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            print(f"获取对话列表失败: {str(e)}")
+            logger.exception("获取对话列表失败")
             return ApiResponse.error(
                 message=f'服务器错误: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -115,15 +244,17 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            print(f"获取对话详情: id={instance.id}, title={instance.title}")
+            logger.debug("获取对话详情: id=%s", instance.id)
             serializer = self.get_serializer(instance)
+            with span('serialize'):
+                data = serializer.data
             return ApiResponse.success(
-                serializer.data,
+                data,
                 message="成功",
                 status_code=200
             )
         except Exception as e:
-            print(f"获取对话详情失败: {str(e)}")
+            logger.exception("获取对话详情失败")
             return ApiResponse.error(
                 message=f'服务器错误: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -131,7 +262,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     def create(self, request, *args, **kwargs):
         try:
-            print(f"创建对话请求: {request.data}")
+            logger.debug("创建对话请求: %s", request.data)
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             self.perform_create(serializer)
@@ -142,7 +273,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 status_code=status.HTTP_201_CREATED
             )
         except Exception as e:
-            print(f"创建对话失败: {str(e)}")
+            logger.exception("创建对话失败")
             return ApiResponse.error(
                 message=f'创建对话失败: {str(e)}',
                 status_code=status.HTTP_400_BAD_REQUEST
@@ -151,20 +282,99 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            print(f"删除对话: id={instance.id}, title={instance.title}")
+            logger.info("删除对话: id=%s", instance.id)
             self.perform_destroy(instance)
+            invalidate_context(instance.id)
             return ApiResponse.success(
                 None,
                 message="对话删除成功",
                 status_code=status.HTTP_200_OK
             )
         except Exception as e:
-            print(f"删除对话失败: {str(e)}")
+            logger.exception("删除对话失败")
             return ApiResponse.error(
                 message=f'删除对话失败: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        批量删除对话
+
+        请求体: {"ids": [1, 2, ...]} 删除指定对话，或 {"all": true} 删除当前用户的全部对话
+        """
+        try:
+            queryset = self.get_queryset()
+            if request.data.get('all') is True:
+                ids = list(queryset.values_list('id', flat=True)[:settings.CHAT_BULK_DELETE_LIMIT])
+            else:
+                ids = request.data.get('ids')
+                if (not isinstance(ids, list) or not ids
+                        or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+                    return ApiResponse.error(
+                        message='请提供要删除的对话ID列表 ids',
+                        status_code=status.HTTP_400_BAD_REQUEST
+                    )
+                if len(ids) > settings.CHAT_BULK_DELETE_LIMIT:
+                    return ApiResponse.error(
+                        message=f'单次最多删除 {settings.CHAT_BULK_DELETE_LIMIT} 个对话',
+                        status_code=status.HTTP_400_BAD_REQUEST
+                    )
+                # 只能删除自己的对话
+                ids = list(queryset.filter(id__in=ids).values_list('id', flat=True))
+            
+            logger.info("批量删除对话: user=%s, count=%d", request.user.pk, len(ids))
+            targets = Conversation.objects.filter(id__in=ids)
+            if settings.CHAT_SOFT_DELETE:
+                deleted = targets.soft_delete()
+            else:
+                deleted, _messages = targets.purge()
+            invalidate_contexts(ids)
+            
+            return ApiResponse.success(
+                {'deleted': deleted},
+                message=f'已删除 {deleted} 个对话',
+                status_code=status.HTTP_200_OK
+            )
+        except Exception as e:
+            logger.exception("批量删除对话失败")
+            return ApiResponse.error(
+                message=f'批量删除对话失败: {str(e)}',
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        分页获取对话消息
+
+        参数: cursor 上一页返回的 next_cursor; page_size 每页条数;
+        order=desc 时从最新的消息开始向前翻页（用于向上滚动加载历史）
+        """
+        try:
+            conversation = self.get_object()
+            paginator = MessagePagination(descending=request.query_params.get('order') == 'desc')
+            page = paginator.paginate_queryset(Message.objects.filter(conversation=conversation), request, view=self)
+            with span('serialize'):
+                data = MessageSerializer(page, many=True).data
+            return ApiResponse.success(
+                data,
+                message="成功",
+                status_code=200,
+                pagination=paginator.get_pagination_data()
+            )
+        except InvalidCursor as e:
+            return ApiResponse.error(message=str(e.detail[0]), status_code=status.HTTP_400_BAD_REQUEST)
+        except Http404:
+            return ApiResponse.error(message='对话不存在', status_code=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.exception("获取对话消息失败")
+            return ApiResponse.error(
+                message=f'服务器错误: {str(e)}',
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
     @action(detail=True, methods=['post'])
     def add_message(self, request, pk=None):
         """
@@ -172,27 +382,27 @@ class ConversationViewSet(viewsets.ModelViewSet):
         """
         try:
             conversation = self.get_object()
-            print(f"向对话添加消息: conversation_id={conversation.id}")
+            logger.debug("向对话添加消息: conversation_id=%s", conversation.id)
             serializer = MessageCreateSerializer(data=request.data)
             
             if serializer.is_valid():
-                print(f"消息数据有效: {serializer.validated_data}")
+                logger.debug("消息数据有效: %s", serializer.validated_data)
                 instance = serializer.save()
-                print(f"消息添加成功: id={instance.id}")
+                logger.debug("消息添加成功: id=%s", instance.id)
                 return ApiResponse.success(
                     serializer.data,
                     message="消息添加成功",
                     status_code=200
                 )
             else:
-                print(f"消息数据无效: {serializer.errors}")
+                logger.info("消息数据无效: %s", serializer.errors)
                 return ApiResponse.error(
                     message="请求参数错误",
                     status_code=status.HTTP_400_BAD_REQUEST,
                     data=serializer.errors
                 )
         except Exception as e:
-            print(f"添加消息失败: {str(e)}")
+            logger.exception("添加消息失败")
             return ApiResponse.error(
                 message=f'添加消息失败: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -205,10 +415,10 @@ class ConversationViewSet(viewsets.ModelViewSet):
         """
         try:
             conversation = self.get_object()
-            print(f"清空对话消息: conversation_id={conversation.id}")
-            count = conversation.messages.count()
-            conversation.messages.all().delete()
-            print(f"已删除 {count} 条消息")
+            logger.info("清空对话消息: conversation_id=%s", conversation.id)
+            count = conversation.clear_messages()
+            invalidate_context(conversation.id)
+            logger.info("已删除 %d 条消息", count)
             
             return ApiResponse.success(
                 None,
@@ -216,7 +426,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 status_code=200
             )
         except Exception as e:
-            print(f"清空消息失败: {str(e)}")
+            logger.exception("清空消息失败")
             return ApiResponse.error(
                 message=f'清空消息失败: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -226,185 +436,415 @@ class ConversationViewSet(viewsets.ModelViewSet):
 class ChatCompletionView(APIView):
     """
     使用阿里云DashScope大模型进行对话
+
+    请求体可以是完整的 messages 列表，也可以只包含 conversation_id 和新的
+    message（文本或 {"role": "user", "content": ...}），后者由服务端组装历史上下文。
+    请求体中 stream=true 或请求头 Accept: text/event-stream 时，
+    以SSE方式逐段返回模型输出，流结束后再保存完整的AI回复。
+    数据库写入分为上游调用前后两个短事务（见chat.services），
+    等待模型输出期间不持有事务
     """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
     
     def post(self, request):
+        self.started = time.perf_counter()
+        # 先获取调用名额（见chat.admission），并发超限时直接返回429
+        try:
+            slot = get_admission_controller().acquire(request.user.id)
+        except AdmissionRejected as e:
+            observe_completion('sync', False, 'rejected', self.started)
+            return admission_rejected_response(e)
+        try:
+            response = self.complete(request)
+        except BaseException:
+            slot.release()
+            observe_completion('sync', False, 'error', self.started)
+            raise
+        # 流式响应的结果在流结束时记录（见stream_events）
+        if not isinstance(response, StreamingHttpResponse):
+            observe_completion('sync', False, completion_outcome(response.status_code), self.started)
+        return hold_for_response(response, slot)
+    
+    def complete(self, request):
         try:
             # 获取用户输入的消息和历史消息
+            # 只提供message时由服务端根据conversation_id组装历史上下文
             messages = request.data.get('messages', [])
+            new_message = normalize_user_message(request.data.get('message'))
             conversation_id = request.data.get('conversation_id')
+            stream = self.wants_stream(request)
             
-            print(f"收到聊天请求: messages={len(messages)}条, conversation_id={conversation_id}")
+            logger.debug("收到聊天请求: messages=%d条, conversation_id=%s, stream=%s", len(messages), conversation_id, stream)
             
-            if not messages:
-                print("错误: 消息为空")
+            if not messages and new_message is None:
+                logger.info("消息为空")
                 return ApiResponse.error(
                     message="消息不能为空",
                     status_code=status.HTTP_400_BAD_REQUEST
                 )
             
-            # 处理对话
-            with transaction.atomic():
-                # 获取或创建对话
-                conversation = None
-                if conversation_id:
-                    try:
-                        conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-                        print(f"找到现有对话: id={conversation.id}, title={conversation.title}")
-                    except Conversation.DoesNotExist:
-                        print(f"错误: 对话不存在, id={conversation_id}")
-                        return ApiResponse.error(
-                            message=f'对话不存在 (ID: {conversation_id})',
-                            status_code=status.HTTP_404_NOT_FOUND
-                        )
+            # 第一阶段：获取或创建对话，保存用户消息
+            try:
+                if messages:
+                    conversation, user_message = prepare_completion(request.user, messages, conversation_id)
                 else:
-                    # 创建新对话，使用第一条用户消息作为标题
-                    user_message = next((m for m in messages if m.get('role') == 'user'), None)
-                    title = user_message.get('content', '新对话')[:50] if user_message else '新对话'
-                    conversation = Conversation.objects.create(
-                        user=request.user,
-                        title=title
-                    )
-                    print(f"创建新对话: id={conversation.id}, title={conversation.title}")
-                
-                # 保存当前消息到数据库
-                latest_message = messages[-1]
-                if latest_message.get('role') == 'user':
-                    user_message = Message.objects.create(
-                        conversation=conversation,
-                        role=latest_message.get('role'),
-                        content=latest_message.get('content')
-                    )
-                    print(f"保存用户消息: id={user_message.id}, content={user_message.content[:50]}...")
-                
-                # 调用DashScope API
-                try:
-                    print("调用DashScope API...")
-                    api_response = self.call_dashscope_api(messages)
-                    print(f"API调用成功, 响应长度: {len(api_response.get('content', ''))}")
-                except Exception as api_error:
-                    print(f"API调用失败: {str(api_error)}")
-                    return ApiResponse.error(
-                        message=f'AI服务调用失败: {str(api_error)}',
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-                    )
-                
-                # 保存AI回复到数据库
-                if 'content' in api_response:
-                    tokens = api_response.get('usage', {}).get('total_tokens', 0)
-                    ai_message = Message.objects.create(
-                        conversation=conversation,
-                        role='assistant',
-                        content=api_response['content'],
-                        tokens_used=tokens
+                    conversation, user_message, messages = prepare_context_completion(
+                        request.user, new_message, conversation_id
                     )
-                    print(f"保存AI回复: id={ai_message.id}, tokens={tokens}")
-                else:
-                    print("警告: API响应中没有content字段")
-                
-                # 更新对话标题（如果是新对话）
-                if conversation and conversation.title == '新对话':
-                    user_message = next((m for m in messages if m.get('role') == 'user'), None)
-                    if user_message:
-                        title = user_message.get('content', '新对话')[:50]
-                        conversation.title = title
-                        conversation.save(update_fields=['title'])
-                        print(f"更新对话标题: {title}")
-                
-                # 构建响应
-                response_data = {
-                    'content': api_response.get('content', ''),
-                    'usage': api_response.get('usage', {}),
-                    'conversation_id': conversation.id
-                }
-                
-                print(f"请求处理成功, 返回响应: conversation_id={conversation.id}")
-                return ApiResponse.success(
-                    response_data,
-                    message="成功",
-                    status_code=200
+            except ConversationNotFound as e:
+                logger.info("对话不存在: id=%s", conversation_id)
+                return ApiResponse.error(
+                    message=str(e),
+                    status_code=status.HTTP_404_NOT_FOUND
                 )
+            logger.debug("对话准备完成: id=%s, user_message=%s", conversation.id, user_message.id if user_message else None)
+            
+            # 按token预算裁剪上下文，裁剪结果通过usage.context返回
+            messages, window = trim_context(messages)
+            
+            # 流式模式：AI回复在流结束后保存
+            if stream:
+                response = StreamingHttpResponse(
+                    self.stream_events(messages, conversation, user_message, window),
+                    content_type='text/event-stream; charset=utf-8'
+                )
+                response['Cache-Control'] = 'no-cache'
+                # 禁止反向代理(如nginx)缓冲SSE输出
+                response['X-Accel-Buffering'] = 'no'
+                return response
+            
+            # 调用DashScope API（不在事务中）
+            try:
+                logger.debug("调用DashScope API")
+                api_response = self.call_dashscope_api(messages)
+                logger.debug("API调用成功, 响应长度: %d", len(api_response.get('content', '')))
+            except Exception as api_error:
+                logger.error("API调用失败: %s", api_error, extra={'conversation_id': conversation.id})
+                fail_completion(user_message)
+                return ApiResponse.error(
+                    message=f'AI服务调用失败: {str(api_error)}',
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            
+            # 第二阶段：保存AI回复到数据库
+            if 'content' in api_response:
+                ai_message = complete_completion(
+                    conversation, user_message, messages,
+                    api_response['content'], api_response.get('usage', {}),
+                    cache_hit=api_response.get('cache_hit', False)
+                )
+                logger.info("保存AI回复: id=%s, tokens=%s", ai_message.id, ai_message.tokens_used,
+                            extra={'conversation_id': conversation.id})
+            else:
+                logger.warning("API响应中没有content字段")
+                fail_completion(user_message)
+            
+            # 构建响应
+            response_data = {
+                'content': api_response.get('content', ''),
+                'usage': {**api_response.get('usage', {}), 'context': window},
+                'conversation_id': conversation.id,
+                'cache_hit': api_response.get('cache_hit', False)
+            }
+            
+            logger.debug("请求处理成功: conversation_id=%s", conversation.id)
+            return ApiResponse.success(
+                response_data,
+                message="成功",
+                status_code=200
+            )
             
         except Exception as e:
-            import traceback
-            print(f"处理请求时出错: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("处理请求时出错")
             return ApiResponse.error(
                 message=f'服务器错误: {str(e)}',
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    def call_dashscope_api(self, messages):
+    def wants_stream(self, request):
+        """
+        判断客户端是否请求流式输出
         """
-        调用DashScope API进行对话
+        return wants_stream(request.data.get('stream', False), request.META.get('HTTP_ACCEPT', ''))
+    
+    def stream_events(self, messages, conversation, user_message, window):
         """
-        if not DASHSCOPE_API_KEY:
-            print("错误: DashScope API密钥未配置")
-            raise ValueError("DashScope API密钥未配置")
+        转发DashScope增量输出为SSE事件，流结束时保存完整的AI回复
+
+        事件顺序: start -> delta(多次) -> done，调用失败时发送 error
+        """
+        parts = []
+        usage = {}
         
-        url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        yield sse_event('start', {'conversation_id': conversation.id})
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DASHSCOPE_API_KEY}"
-        }
+        try:
+            for chunk in self.call_dashscope_api_stream(messages):
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                delta = chunk.get('content', '')
+                if delta:
+                    parts.append(delta)
+                    yield sse_event('delta', {'content': delta})
+        except GeneratorExit:
+            # 客户端中途断开，保留已生成的部分回复
+            logger.info("客户端断开流式连接: conversation_id=%s", conversation.id)
+            if parts:
+                complete_completion(conversation, user_message, messages, ''.join(parts), usage)
+            else:
+                fail_completion(user_message)
+            observe_completion('sync', True, 'disconnected', self.started)
+            raise
+        except Exception as api_error:
+            logger.error("流式API调用失败: %s", api_error, extra={'conversation_id': conversation.id})
+            fail_completion(user_message)
+            observe_completion('sync', True, 'error', self.started)
+            yield sse_event('error', {
+                'code': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                'message': f'AI服务调用失败: {str(api_error)}',
+                'conversation_id': conversation.id
+            })
+            return
         
-        # 转换消息格式以适应DashScope API
-        formatted_messages = []
-        for msg in messages:
-            role = msg.get('role')
-            content = msg.get('content')
-            
-            # DashScope使用system/user/assistant角色
-            if role in ['system', 'user', 'assistant']:
-                formatted_messages.append({
-                    "role": role,
-                    "content": content
-                })
+        ai_message = complete_completion(conversation, user_message, messages, ''.join(parts), usage)
+        logger.info("保存流式AI回复: id=%s, tokens=%s", ai_message.id, ai_message.tokens_used,
+                    extra={'conversation_id': conversation.id})
+        observe_completion('sync', True, 'success', self.started)
         
-        print(f"格式化后的消息数量: {len(formatted_messages)}")
+        yield sse_event('done', {
+            'content': ai_message.content,
+            'usage': {**usage, 'context': window},
+            'conversation_id': conversation.id,
+            'message_id': ai_message.id
+        })
+    
+    def call_dashscope_api(self, messages):
+        """
+        调用DashScope API进行对话（使用chat.llm_client中共享的连接池客户端）
+
+        启用回复缓存（见chat.completion_cache、chat.semantic_cache）时，
+        相同或相近的请求直接返回缓存的回复
+        """
+        keys, cached = lookup_cached_reply(messages)
+        if cached is not None:
+            logger.debug("命中回复缓存")
+            return completion_cache.cached_response(cached)
+        logger.debug("发送请求到DashScope API, 消息数量: %d", len(messages))
+        with span('llm'):
+            api_response = get_client().generate(messages)
+        if not api_response.get('content'):
+            logger.warning("API响应中没有找到内容")
+        store_cached_reply(keys, api_response)
+        return api_response
+    
+    def call_dashscope_api_stream(self, messages):
+        """
+        以SSE方式调用DashScope API，逐段产出 {"content", "usage"}
+        """
+        logger.debug("发送流式请求到DashScope API, 消息数量: %d", len(messages))
+        return timed_iter(get_client().generate_stream(messages), 'llm')
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatCompletionView(View):
+    """
+    原生异步的对话接口，需通过ASGI(core.asgi)部署
+
+    请求/响应格式与ChatCompletionView一致（同样支持stream），
+    上游调用使用httpx异步客户端，等待模型输出期间不占用工作线程，
+    单个进程可同时处理大量生成请求。
+    Django的事务不能在异步上下文中使用，调用前后的两个短事务
+    通过sync_to_async执行chat.services中的同步实现
+    """
+    http_method_names = ['post', 'options']
+    
+    async def post(self, request):
+        user = await self.authenticate(request)
+        if user is None:
+            return json_api_response(
+                message='身份认证信息未提供或无效',
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+        # 与DRF视图一致，让中间件在响应阶段拿到认证后的用户
+        request.user = user
         
-        # 构建请求体
-        payload = {
-            "model": "qwen-max",  # 使用通义千问Max模型
-            "input": {
-                "messages": formatted_messages
-            },
-            "parameters": {
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "result_format": "message"
-            }
-        }
+        self.started = time.perf_counter()
+        try:
+            slot = await get_admission_controller().aacquire(user.id)
+        except AdmissionRejected as e:
+            observe_completion('async', False, 'rejected', self.started)
+            return admission_rejected_response(e, json_response=True)
+        try:
+            response = await self.complete(request, user)
+        except BaseException:
+            slot.release()
+            observe_completion('async', False, 'error', self.started)
+            raise
+        # 流式响应的结果在流结束时记录（见stream_events）
+        if not isinstance(response, StreamingHttpResponse):
+            observe_completion('async', False, completion_outcome(response.status_code), self.started)
+        return hold_for_response(response, slot)
+    
+    async def complete(self, request, user):
+        try:
+            data = json.loads(request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return json_api_response(
+                message='请求体不是有效的JSON',
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
-            # 发送请求
-            print(f"发送请求到DashScope API: {url}")
-            response = requests.post(url, headers=headers, json=payload)
+            messages = data.get('messages', [])
+            new_message = normalize_user_message(data.get('message'))
+            conversation_id = data.get('conversation_id')
+            stream = wants_stream(data.get('stream', False), request.headers.get('Accept', ''))
+            
+            logger.debug("收到异步聊天请求: messages=%d条, conversation_id=%s, stream=%s", len(messages), conversation_id, stream)
+            
+            if not messages and new_message is None:
+                return json_api_response(
+                    message="消息不能为空",
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # 第一阶段：获取或创建对话，保存用户消息
+            try:
+                if messages:
+                    conversation, user_message = await sync_to_async(prepare_completion)(
+                        user, messages, conversation_id
+                    )
+                else:
+                    conversation, user_message, messages = await sync_to_async(prepare_context_completion)(
+                        user, new_message, conversation_id
+                    )
+            except ConversationNotFound as e:
+                return json_api_response(
+                    message=str(e),
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
             
-            if response.status_code != 200:
-                error_message = f"API调用失败: 状态码={response.status_code}, 响应={response.text}"
-                print(error_message)
-                raise Exception(error_message)
+            messages, window = trim_context(messages)
             
-            result = response.json()
-            print("API调用成功，解析响应")
+            if stream:
+                response = StreamingHttpResponse(
+                    self.stream_events(messages, conversation, user_message, window),
+                    content_type='text/event-stream; charset=utf-8'
+                )
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
             
-            # 提取并返回回复内容
-            content = result.get("output", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
-            usage = result.get("usage", {})
+            # 调用DashScope API（不在事务中）
+            try:
+                api_response = await self.call_dashscope_api(messages)
+            except Exception as api_error:
+                logger.error("异步API调用失败: %s", api_error, extra={'conversation_id': conversation.id})
+                await sync_to_async(fail_completion)(user_message)
+                return json_api_response(
+                    message=f'AI服务调用失败: {str(api_error)}',
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
             
-            if not content:
-                print("警告: API响应中没有找到内容")
+            # 第二阶段：保存AI回复到数据库
+            if 'content' in api_response:
+                await sync_to_async(complete_completion)(
+                    conversation, user_message, messages,
+                    api_response['content'], api_response.get('usage', {}),
+                    cache_hit=api_response.get('cache_hit', False)
+                )
+            else:
+                await sync_to_async(fail_completion)(user_message)
             
-            return {
-                "content": content,
-                "usage": usage
-            }
-        except requests.RequestException as e:
-            print(f"请求异常: {str(e)}")
-            raise Exception(f"网络请求失败: {str(e)}")
-        except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {str(e)}")
-            raise Exception(f"响应解析失败: {str(e)}") 
\ No newline at end of file
+            return json_api_response({
+                'content': api_response.get('content', ''),
+                'usage': {**api_response.get('usage', {}), 'context': window},
+                'conversation_id': conversation.id,
+                'cache_hit': api_response.get('cache_hit', False)
+            }, message="成功")
+        except Exception as e:
+            logger.exception("处理异步请求时出错")
+            return json_api_response(
+                message=f'服务器错误: {str(e)}',
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    async def authenticate(self, request):
+        """
+        使用SimpleJWT校验Bearer令牌，返回用户或None
+        """
+        authenticator = CachedJWTAuthentication()
+        try:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+        return result[0] if result else None
+    
+    async def stream_events(self, messages, conversation, user_message, window):
+        """
+        异步转发DashScope增量输出为SSE事件，事件格式与ChatCompletionView相同
+        """
+        parts = []
+        usage = {}
+        
+        yield sse_event('start', {'conversation_id': conversation.id})
+        
+        try:
+            async for chunk in self.call_dashscope_api_stream(messages):
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                delta = chunk.get('content', '')
+                if delta:
+                    parts.append(delta)
+                    yield sse_event('delta', {'content': delta})
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端中途断开，保留已生成的部分回复
+            if parts:
+                await sync_to_async(complete_completion)(
+                    conversation, user_message, messages, ''.join(parts), usage
+                )
+            else:
+                await sync_to_async(fail_completion)(user_message)
+            observe_completion('async', True, 'disconnected', self.started)
+            raise
+        except Exception as api_error:
+            logger.error("异步流式API调用失败: %s", api_error, extra={'conversation_id': conversation.id})
+            await sync_to_async(fail_completion)(user_message)
+            observe_completion('async', True, 'error', self.started)
+            yield sse_event('error', {
+                'code': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                'message': f'AI服务调用失败: {str(api_error)}',
+                'conversation_id': conversation.id
+            })
+            return
+        
+        ai_message = await sync_to_async(complete_completion)(
+            conversation, user_message, messages, ''.join(parts), usage
+        )
+        observe_completion('async', True, 'success', self.started)
+        
+        yield sse_event('done', {
+            'content': ai_message.content,
+            'usage': {**usage, 'context': window},
+            'conversation_id': conversation.id,
+            'message_id': ai_message.id
+        })
+    
+    async def call_dashscope_api(self, messages):
+        """
+        异步调用DashScope API进行对话，回复缓存与ChatCompletionView相同
+        """
+        keys, cached = lookup_cached_reply(messages)
+        if cached is not None:
+            return completion_cache.cached_response(cached)
+        with span('llm'):
+            api_response = await get_client().agenerate(messages)
+        store_cached_reply(keys, api_response)
+        return api_response
+    
+    def call_dashscope_api_stream(self, messages):
+        """
+        以SSE方式异步调用DashScope API，返回逐段产出 {"content", "usage"} 的异步生成器
+        """
+        return atimed_iter(get_client().agenerate_stream(messages), 'llm')
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "tools.timing.server_timing_middleware",  # 请求耗时统计，放在最前面以包含其他中间件的耗时
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS中间件，必须在CommonMiddleware之前
@@ -63,6 +64,56 @@ MIDDLEWARE = [
     "users.middleware.UserLastLoginIPMiddleware",  # 用户最后登录IP记录中间件
 ]
 
+# 认证使用的用户快照缓存时间（秒），快照保存在跨进程的 auth 缓存中，见users.snapshots
+USER_SNAPSHOT_TIMEOUT = 5 * 60
+
+# 应用前面的反向代理层数（如只有nginx时为1）。客户端IP取 X-Forwarded-For 从右数第N个地址，
+# 为0时使用 REMOTE_ADDR；不要大于实际的代理层数，否则客户端可以伪造IP绕过按IP的限流
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+# 用户最后登录IP/最后活跃时间的批量写入配置（见users.activity）
+USER_ACTIVITY = {
+    'FLUSH_INTERVAL': int(os.environ.get('USER_ACTIVITY_FLUSH_INTERVAL', 30)),
+    'LAST_SEEN_RESOLUTION': 60,
+}
+
+# 验证码邮件/短信的发件箱配置（见users.outbox）
+USER_OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 30,
+    # 单独运行 send_outbound_messages 命令时可以关闭web进程内的发送线程
+    'IN_PROCESS_WORKER': os.environ.get('USER_OUTBOX_IN_PROCESS', 'true').lower() in ('1', 'true', 'yes'),
+}
+
+# 日志配置（见tools.log）：日志经内存队列由后台线程写到stderr，请求线程不等待输出
+# LOG_LEVEL 为应用日志级别，DEBUG级别会输出请求数据等调试内容，默认关闭
+# LOG_FORMAT 为 text（可读文本）或 json（每行一条JSON，便于日志系统采集）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'()': 'tools.log.KeyValueFormatter'},
+        'json': {'()': 'tools.log.JsonFormatter'},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'tools.log.QueueStreamHandler',
+            'stream': 'ext://sys.stderr',
+            'formatter': LOG_FORMAT if LOG_FORMAT in ('text', 'json') else 'text',
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        'chat': {'level': LOG_LEVEL},
+        'users': {'level': LOG_LEVEL},
+        'tools': {'level': LOG_LEVEL},
+    },
+}
+
 # CORS设置
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # 开发环境允许所有来源访问
 CORS_ALLOW_CREDENTIALS = True  # 允许携带认证信息
@@ -146,7 +197,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # REST Framework设置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -167,6 +218,7 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.VersionedTokenObtainPairSerializer',
 }
 
 # 自定义用户模型
@@ -227,10 +279,108 @@ FRONTEND_URL = 'http://localhost:5173'
 
 # DashScope API密钥（请替换为您的实际API密钥）
 DASHSCOPE_API_KEY = os.environ.get('DASHSCOPE_API_KEY', '')
-# 缓存配置，用于存储验证码
+# DashScope文本生成接口地址（可指向本地替身服务用于测试）
+DASHSCOPE_API_URL = os.environ.get(
+    'DASHSCOPE_API_URL',
+    'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'
+)
+# DashScope客户端配置（连接池、超时、重试），未配置的项使用chat.llm_client中的默认值
+DASHSCOPE_CLIENT = {
+    'POOL_MAXSIZE': int(os.environ.get('DASHSCOPE_POOL_MAXSIZE', 50)),
+    'CONNECT_TIMEOUT': 5.0,
+    'READ_TIMEOUT': 120.0,
+    'MAX_RETRIES': 3,
+    'RETRY_BUDGET_RATIO': 0.1,
+}
+# 模型采样参数（见chat.llm_client.build_payload），temperature 为0时同一提示词的回复固定
+DASHSCOPE_PARAMETERS = {
+    'temperature': float(os.environ.get('DASHSCOPE_TEMPERATURE', 0.7)),
+    'top_p': 0.8,
+}
+# 服务端组装的对话上下文在缓存中的保留时间（秒）
+CHAT_CONTEXT_CACHE_TIMEOUT = 60 * 60
+# 上下文窗口：发送给大模型的消息token预算及超出时的处理策略（drop/summarize）
+CHAT_CONTEXT_WINDOW = {
+    'TOKEN_BUDGET': int(os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET', 6000)),
+    'STRATEGY': os.environ.get('CHAT_CONTEXT_STRATEGY', 'drop'),
+    'SUMMARY_TOKENS': 400,
+}
+# 大模型调用的准入控制（见chat.admission），按进程计算：
+# GLOBAL_LIMIT 取上游（DashScope）并发配额除以worker进程数
+CHAT_ADMISSION = {
+    'GLOBAL_LIMIT': int(os.environ.get('CHAT_GLOBAL_CONCURRENCY', 20)),
+    'PER_USER_LIMIT': int(os.environ.get('CHAT_USER_CONCURRENCY', 2)),
+    'MAX_QUEUE': 50,
+    'QUEUE_TIMEOUT': 5,
+    'RETRY_AFTER': 5,
+}
+# 相同提示词的回复缓存（见chat.completion_cache），进程内LRU，默认关闭
+CHAT_COMPLETION_CACHE = {
+    'ENABLED': os.environ.get('CHAT_COMPLETION_CACHE', 'false').lower() in ('1', 'true', 'yes'),
+    'TTL': 60 * 60,
+    'MAX_ENTRIES': 1000,
+    # 只缓存 temperature 为0的请求，需要同时设置 DASHSCOPE_TEMPERATURE=0，否则缓存不会生效
+    'DETERMINISTIC_ONLY': False,
+}
+# 相近提示词的语义缓存（见chat.semantic_cache），在精确匹配未命中时查询，默认关闭
+CHAT_SEMANTIC_CACHE = {
+    'ENABLED': os.environ.get('CHAT_SEMANTIC_CACHE', 'false').lower() in ('1', 'true', 'yes'),
+    'EMBEDDER': 'chat.semantic_cache.HashedNgramEmbedder',
+    'THRESHOLD': float(os.environ.get('CHAT_SEMANTIC_CACHE_THRESHOLD', 0.9)),
+}
+# 指标（见tools.metrics，api/v1/metrics/）：多worker部署时设置 METRICS_DIR 为所有worker共享的目录，
+# 每次部署前清空；采集程序使用 METRICS_TOKEN 作为Bearer令牌
+METRICS = {
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_DIR') or None,
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+}
+# Server-Timing 响应头（见tools.timing）：默认只发给工作人员和管理员，
+# 设置 SERVER_TIMING_HEADER=true 后发给所有请求（仅用于调试，会暴露数据库查询次数等内部信息）
+SERVER_TIMING = {
+    'HEADER': os.environ.get('SERVER_TIMING_HEADER', 'false').lower() in ('1', 'true', 'yes'),
+}
+# 删除对话：默认分批物理删除；设置 CHAT_SOFT_DELETE=true 后改为软删除（立即返回），
+# 此时必须定时运行 purge_deleted_conversations 命令物理删除，否则已删除的对话会一直保留
+CHAT_SOFT_DELETE = os.environ.get('CHAT_SOFT_DELETE', 'false').lower() in ('1', 'true', 'yes')
+CHAT_DELETE_CHUNK_SIZE = 2000
+# 批量删除接口单次最多处理的对话数
+CHAT_BULK_DELETE_LIMIT = 5000
+# 缓存配置
+# verification: 短信/邮箱验证码；auth: 认证用的用户快照、令牌版本和权限集合（见users.snapshots、
+# users.permission_cache），禁用用户、撤销令牌和修改权限后要立即对所有worker生效。
+# 这两个缓存都必须在所有worker进程之间共享：
+# *_CACHE_URL 为 redis:// 地址时使用Redis，否则使用本机的SQLite文件（路径可通过该变量指定）
+def _shared_cache(url, name):
+    if url.startswith(('redis://', 'rediss://')):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': url,
+            'KEY_PREFIX': name,
+        }
+    return {
+        'BACKEND': 'tools.sqlite_cache.SQLiteCache',
+        'LOCATION': url or str(BASE_DIR / 'cache' / f'{name}.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+
+
+VERIFICATION_CACHE_URL = os.environ.get('VERIFICATION_CACHE_URL', '')
+VERIFICATION_CACHE = _shared_cache(VERIFICATION_CACHE_URL, 'verification')
+AUTH_CACHE_URL = os.environ.get('AUTH_CACHE_URL', '')
+AUTH_CACHE = _shared_cache(AUTH_CACHE_URL, 'auth')
+
+# 验证码发送频率限制（见users.verification）：按接收方和客户端IP，[(次数, 窗口秒数), ...]
+VERIFICATION_RATE_LIMITS = {
+    'target': [(1, 60), (5, 60 * 60), (10, 24 * 60 * 60)],
+    'ip': [(30, 60 * 60)],
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    'verification': VERIFICATION_CACHE,
+    'auth': AUTH_CACHE,
 }
@@ -22,6 +22,8 @@ from django.conf.urls.static import static
 from rest_framework.documentation import include_docs_urls
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from .views import MetricsView, TimingStatsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     # API文档
@@ -35,6 +37,8 @@ urlpatterns = [
     path("api/v1/", include([
         path("auth/", include("users.urls")),  # 用户认证与权限相关的URL
         path("chat/", include("chat.urls")),   # 聊天相关的URL
+        path("timing/", TimingStatsView.as_view(), name="timing-stats"),  # 请求耗时统计（工作人员）
+        path("metrics/", MetricsView.as_view(), name="metrics"),  # Prometheus指标
         # 这里可以添加其他应用的URL
     ])),
 ]
@@ -0,0 +1,62 @@
+import hmac
+
+from django.http import HttpResponse
+from rest_framework.permissions import BasePermission
+from rest_framework.views import APIView
+
+from tools.metrics import CONTENT_TYPE, REGISTRY, metrics_settings
+from tools.timing import get_histograms
+from users.permissions import IsStaffOrAdmin
+from users.views import ApiResponse
+
+
+class TimingStatsView(APIView):
+    """
+    当前进程内按路由统计的请求耗时直方图（单位毫秒），仅工作人员和管理员可访问
+
+    GET 返回 {路由: {阶段: {count, avg_ms, max_ms, p50_ms, p95_ms, p99_ms, buckets}}}，
+    阶段包括 total、db、auth、serialize、llm、llm_ttfb；DELETE 清空统计。
+    多进程部署时每个worker进程分别统计。
+    """
+    permission_classes = [IsStaffOrAdmin]
+
+    def get(self, request):
+        return ApiResponse.success(get_histograms().snapshot(), message="成功")
+
+    def delete(self, request):
+        get_histograms().reset()
+        return ApiResponse.success(message="已清空")
+
+
+class HasMetricsToken(BasePermission):
+    """
+    请求头 Authorization: Bearer <METRICS['TOKEN']> 与配置的令牌一致
+    """
+    def has_permission(self, request, view):
+        token = metrics_settings()['TOKEN']
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not token or not header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(header[len('Bearer '):].encode(), token.encode())
+
+
+class MetricsView(APIView):
+    """
+    Prometheus文本格式的指标（多进程时合并所有worker，见tools.metrics）
+
+    采集程序使用 METRICS['TOKEN'] 作为Bearer令牌访问；工作人员和管理员也可以直接查看
+    """
+    permission_classes = [HasMetricsToken | IsStaffOrAdmin]
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.token_authorized = HasMetricsToken().has_permission(request, self)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_authenticators(self):
+        # 采集令牌不是JWT，携带采集令牌时不做JWT认证
+        if self.token_authorized:
+            return []
+        return super().get_authenticators()
+
+    def get(self, request):
+        return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
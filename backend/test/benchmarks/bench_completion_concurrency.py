@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+对话接口同步/异步并发能力对比基准
+
+启动一个本地DashScope替身服务（固定延迟返回DashScope格式的响应），
+分别用两种方式发起同样数量的生成请求：
+
+- sync:  ChatCompletionView.call_dashscope_api，运行在固定大小的线程池中，
+         模拟WSGI部署下每个工作线程同时只能处理一个请求
+- async: AsyncChatCompletionView.call_dashscope_api，全部请求在一个事件循环中并发
+
+数据库读写在两种实现中完全相同，这里只比较上游等待阶段的并发能力。
+
+用法：
+    python bench_completion_concurrency.py --requests 400 --workers 16 --latency 1.0
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, project_root)
+
+
+class StandInState:
+    """
+    替身服务的并发统计
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def reset(self):
+        with self.lock:
+            self.peak = self.in_flight
+
+
+def make_handler(state, latency):
+    class DashScopeStandIn(BaseHTTPRequestHandler):
+        """
+        模拟DashScope文本生成接口：等待latency秒后返回固定回复
+        """
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            state.enter()
+            try:
+                time.sleep(latency)
+            finally:
+                state.leave()
+            body = json.dumps({
+                'output': {'choices': [{'message': {'role': 'assistant', 'content': '替身回复'}}]},
+                'usage': {'input_tokens': 8, 'output_tokens': 4, 'total_tokens': 12},
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return DashScopeStandIn
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认backlog只有5，高并发连接时会出现SYN重传，影响测量
+    request_queue_size = 2048
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(mode, latencies, elapsed, peak):
+    print(
+        f"{mode:<6} requests={len(latencies):<5} wall={elapsed:7.2f}s "
+        f"throughput={len(latencies) / elapsed:8.1f} req/s "
+        f"p50={statistics.median(latencies):6.2f}s p95={percentile(latencies, 95):6.2f}s "
+        f"peak_upstream_concurrency={peak}"
+    )
+
+
+def run_sync(view, messages, total, workers):
+    latencies = []
+    lock = threading.Lock()
+
+    def one_call():
+        started = time.perf_counter()
+        view.call_dashscope_api(messages)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(one_call) for _ in range(total)]:
+            future.result()
+    return latencies, time.perf_counter() - started
+
+
+async def run_async(view, messages, total):
+    async def one_call():
+        started = time.perf_counter()
+        await view.call_dashscope_api(messages)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one_call() for _ in range(total)))
+    return list(latencies), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对话接口同步/异步并发能力对比')
+    parser.add_argument('--requests', type=int, default=200, help='每种模式发起的请求总数')
+    parser.add_argument('--workers', type=int, default=16, help='同步模式的工作线程数')
+    parser.add_argument('--latency', type=float, default=1.0, help='替身服务的响应延迟(秒)')
+    args = parser.parse_args()
+
+    state = StandInState()
+    server = StandInServer(('127.0.0.1', 0), make_handler(state, args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 必须在Django初始化前设置，chat.views在导入时读取这些配置
+    os.environ['DASHSCOPE_API_URL'] = f'http://127.0.0.1:{server.server_port}/generation'
+    os.environ['DASHSCOPE_API_KEY'] = 'bench-key'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+    from chat.views import ChatCompletionView, AsyncChatCompletionView
+
+    messages = [{'role': 'user', 'content': '你好'}]
+    print(f"替身服务: {os.environ['DASHSCOPE_API_URL']}, 延迟={args.latency}s")
+
+    state.reset()
+    latencies, elapsed = run_sync(ChatCompletionView(), messages, args.requests, args.workers)
+    report('sync', latencies, elapsed, state.peak)
+
+    state.reset()
+    latencies, elapsed = asyncio.run(run_async(AsyncChatCompletionView(), messages, args.requests))
+    report('async', latencies, elapsed, state.peak)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+对话列表/历史消息查询基准
+
+为一个基准用户批量写入大量对话和消息（默认1万个对话、100万条消息），
+然后输出 ConversationViewSet 各接口底层查询的执行计划（EXPLAIN），
+并统计接口的响应延迟：
+
+- list:           对话列表第一页
+- list_deep:      对话列表靠后的一页（游标分页，不随深度变慢）
+- retrieve:       对话详情（只内嵌最近的消息）
+- messages:       历史消息第一页
+- messages_desc:  从最新的消息向前翻页
+
+数据写入 DJANGO_SETTINGS_MODULE 指向的数据库，请勿在生产库上运行。
+
+用法：
+    python bench_conversation_queries.py --seed --conversations 10000 --messages 1000000
+    python bench_conversation_queries.py --iterations 50          # 复用已写入的数据
+    python bench_conversation_queries.py --cleanup                # 删除基准用户及其数据
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from contextlib import contextmanager
+from datetime import timedelta
+
+# 添加项目根目录到Python路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, project_root)
+
+BENCH_USERNAME = 'bench_chat_user'
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@contextmanager
+def manual_timestamps(*fields):
+    """
+    批量写入时临时关闭auto_now/auto_now_add，让时间戳按给定值分布
+    """
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def seed(user, conversations, messages, batch_size):
+    from django.db import transaction
+    from django.utils import timezone
+    from chat.models import Conversation, Message, summary_expressions
+    from chat.tokens import estimate_tokens
+
+    per_conversation = max(1, messages // conversations)
+    start = timezone.now() - timedelta(days=365)
+    content = '这是一条用于基准测试的消息，包含一些中文和 some English words.'
+    token_count = estimate_tokens(content)
+
+    timestamp_fields = [
+        Conversation._meta.get_field('created_at'),
+        Conversation._meta.get_field('updated_at'),
+        Message._meta.get_field('created_at'),
+    ]
+    started = time.perf_counter()
+    with manual_timestamps(*timestamp_fields):
+        for offset in range(0, conversations, batch_size):
+            count = min(batch_size, conversations - offset)
+            with transaction.atomic():
+                created = Conversation.objects.bulk_create([
+                    Conversation(
+                        user=user, title=f'基准对话 {offset + i}',
+                        created_at=start + timedelta(minutes=offset + i),
+                        updated_at=start + timedelta(minutes=offset + i, seconds=30),
+                    )
+                    for i in range(count)
+                ])
+            # bulk_create在MySQL上不回填主键，按id取回刚写入的对话
+            if created and created[0].pk is None:
+                created = list(Conversation.objects.filter(user=user).order_by('-id')[:count])[::-1]
+
+            rows = []
+            for conversation in created:
+                for n in range(per_conversation):
+                    rows.append(Message(
+                        conversation_id=conversation.pk,
+                        role='user' if n % 2 == 0 else 'assistant',
+                        content=content,
+                        token_count=token_count,
+                        tokens_used=None if n % 2 == 0 else 20,
+                        created_at=conversation.created_at + timedelta(seconds=n),
+                    ))
+                    if len(rows) >= batch_size * 10:
+                        Message.objects.bulk_create(rows)
+                        rows = []
+            if rows:
+                Message.objects.bulk_create(rows)
+            print(f"已写入 {offset + count}/{conversations} 个对话", end='\r', flush=True)
+
+    Conversation.objects.filter(user=user).update(**summary_expressions())
+    print(f"\n写入完成: {conversations} 个对话, {conversations * per_conversation} 条消息, "
+          f"耗时 {time.perf_counter() - started:.1f}s")
+
+
+def explain(label, queryset):
+    print(f"--- {label}")
+    print(queryset.explain())
+
+
+def report_plans(user):
+    from chat.models import Conversation, Message
+    from chat.pagination import ConversationPagination, MessagePagination
+
+    conversations = Conversation.objects.filter(user=user)
+    deep = conversations.order_by('-updated_at', '-id')[conversations.count() // 2]
+    conversation_paginator = ConversationPagination()
+    values = [deep.updated_at, deep.id]
+    explain('list', conversations.order_by(*ConversationPagination.ordering)[:11])
+    explain('list_deep', conversations.filter(conversation_paginator.cursor_filter(values))
+            .order_by(*ConversationPagination.ordering)[:11])
+
+    messages = Message.objects.filter(conversation=deep)
+    explain('messages', messages.order_by(*MessagePagination.ordering)[:51])
+    desc = MessagePagination(descending=True)
+    explain('messages_desc', messages.order_by(*desc.ordering)[:51])
+
+
+def bench_endpoints(user, iterations):
+    from rest_framework.test import APIClient
+    from chat.models import Conversation
+    from chat.pagination import ConversationPagination, MessagePagination
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    conversations = Conversation.objects.filter(user=user).order_by('-updated_at', '-id')
+    middle = conversations[conversations.count() // 2]
+    deep_cursor = ConversationPagination().encode_cursor(middle)
+    latest_message = middle.messages.order_by('-created_at', '-id').first()
+    desc_cursor = MessagePagination(descending=True).encode_cursor(latest_message) if latest_message else None
+
+    cases = [
+        ('list', '/api/v1/chat/conversations/', {}),
+        ('list_deep', '/api/v1/chat/conversations/', {'cursor': deep_cursor}),
+        ('retrieve', f'/api/v1/chat/conversations/{middle.id}/', {}),
+        ('messages', f'/api/v1/chat/conversations/{middle.id}/messages/', {}),
+        ('messages_desc', f'/api/v1/chat/conversations/{middle.id}/messages/',
+         {'order': 'desc', **({'cursor': desc_cursor} if desc_cursor else {})}),
+    ]
+    for label, url, params in cases:
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(url, params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+        print(
+            f"{label:<14} p50={statistics.median(latencies):7.2f}ms "
+            f"p95={percentile(latencies, 95):7.2f}ms max={max(latencies):7.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对话列表/历史消息查询基准')
+    parser.add_argument('--seed', action='store_true', help='先写入基准数据（会删除已有的基准用户数据）')
+    parser.add_argument('--conversations', type=int, default=10000, help='写入的对话数')
+    parser.add_argument('--messages', type=int, default=1000000, help='写入的消息总数')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的对话数')
+    parser.add_argument('--iterations', type=int, default=30, help='每个接口的请求次数')
+    parser.add_argument('--cleanup', action='store_true', help='删除基准用户及其数据后退出')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from chat.models import Conversation
+
+    User = get_user_model()
+    if args.cleanup or args.seed:
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        if args.cleanup:
+            print('已删除基准数据')
+            return
+
+    user, _created = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'email': 'bench@example.com'})
+    if args.seed:
+        seed(user, args.conversations, args.messages, args.batch_size)
+    elif not Conversation.objects.filter(user=user).exists():
+        parser.error('没有基准数据，请先使用 --seed 写入')
+
+    # 允许测试客户端的 testserver 主机名
+    setup_test_environment()
+    print(f"数据库: {connection.vendor}")
+    report_plans(user)
+    bench_endpoints(user, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,7 +30,9 @@ def run_tests():
     test_runner = DiscoverRunner(verbosity=2)
     failures = test_runner.run_tests([
         'test_chats.test_conversations',
-        'test_chats.test_chat_completion'
+        'test_chats.test_chat_completion',
+        'test_chats.test_llm_client',
+        'test_chats.test_context_window'
     ])
     
     if failures:
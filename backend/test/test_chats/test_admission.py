@@ -0,0 +1,140 @@
+import os
+import sys
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from chat.admission import AdmissionController, AdmissionRejected
+from chat.models import Conversation
+
+User = get_user_model()
+
+
+class AdmissionControllerTestCase(SimpleTestCase):
+    """
+    测试准入控制的用户并发、全局并发、排队和超时
+    """
+
+    def test_per_user_limit(self):
+        controller = AdmissionController(global_limit=10, per_user_limit=2)
+        first = controller.acquire(1)
+        controller.acquire(1)
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire(1)
+        self.assertEqual(context.exception.reason, 'user')
+        # 其他用户不受影响
+        controller.acquire(2).release()
+
+        first.release()
+        first.release()
+        controller.acquire(1)
+        self.assertEqual(controller.stats()['in_flight'], 2)
+
+    def test_queue_in_order(self):
+        controller = AdmissionController(global_limit=1, per_user_limit=5, queue_timeout=5)
+        slot = controller.acquire(1)
+        order = []
+
+        def worker(user_id):
+            with controller.acquire(user_id):
+                order.append(user_id)
+
+        threads = []
+        for user_id in (2, 3, 4):
+            thread = threading.Thread(target=worker, args=(user_id,))
+            thread.start()
+            threads.append(thread)
+            # 保证按顺序进入队列
+            while controller.stats()['queued'] < len(threads):
+                time.sleep(0.01)
+
+        slot.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, [2, 3, 4])
+        self.assertEqual(controller.stats(), {'in_flight': 0, 'queued': 0, 'users': 0})
+
+    def test_queue_full_and_timeout(self):
+        controller = AdmissionController(global_limit=1, per_user_limit=5, max_queue=0, queue_timeout=0.05)
+        controller.acquire(1)
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire(2)
+        self.assertEqual(context.exception.reason, 'busy')
+
+        controller.max_queue = 1
+        with self.assertRaises(AdmissionRejected) as context:
+            controller.acquire(2)
+        self.assertEqual(context.exception.reason, 'timeout')
+        self.assertEqual(controller.stats(), {'in_flight': 1, 'queued': 0, 'users': 1})
+
+    def test_async_acquire(self):
+        controller = AdmissionController(global_limit=1, per_user_limit=5, queue_timeout=5)
+
+        async def scenario():
+            slot = await controller.aacquire(1)
+            waiting = asyncio.ensure_future(controller.aacquire(2))
+            await asyncio.sleep(0.01)
+            self.assertEqual(controller.stats()['queued'], 1)
+            slot.release()
+            (await waiting).release()
+
+        asyncio.run(scenario())
+        self.assertEqual(controller.stats()['in_flight'], 0)
+
+
+class CompletionAdmissionTestCase(TestCase):
+    """
+    测试对话接口在并发超限时返回429，流式响应结束后释放名额
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admission', password='password123')
+        self.conversation = Conversation.objects.create(user=self.user, title='准入测试')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.controller = AdmissionController(global_limit=5, per_user_limit=1, retry_after=7)
+        patcher = patch('chat.views.get_admission_controller', return_value=self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data = {'messages': [{'role': 'user', 'content': '你好'}], 'conversation_id': self.conversation.id}
+
+    def test_rejected_with_retry_after(self):
+        slot = self.controller.acquire(self.user.id)
+        response = self.client.post('/api/v1/chat/completion/', self.data, format='json')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.data['data']['reason'], 'user')
+        # 被拒绝的请求不写入消息
+        self.assertFalse(self.conversation.messages.exists())
+        slot.release()
+
+    @patch('chat.views.ChatCompletionView.call_dashscope_api')
+    def test_slot_released_after_response(self, mock_api_call):
+        mock_api_call.return_value = {'content': '回复', 'usage': {'total_tokens': 3}}
+        for _ in range(2):
+            response = self.client.post('/api/v1/chat/completion/', self.data, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
+
+    @patch('chat.views.ChatCompletionView.call_dashscope_api_stream')
+    def test_stream_holds_slot_until_finished(self, mock_stream_call):
+        mock_stream_call.return_value = iter([{'content': '你好', 'usage': {'total_tokens': 2}}])
+        response = self.client.post('/api/v1/chat/completion/', {**self.data, 'stream': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.controller.stats()['in_flight'], 1)
+        b''.join(response.streaming_content)
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
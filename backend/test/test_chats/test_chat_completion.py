@@ -2,7 +2,7 @@ import os
 import sys
 import json
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # 首先导入测试配置
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -14,7 +14,9 @@ except ImportError:
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from chat.models import Conversation, Message
 
@@ -148,6 +150,167 @@ class ChatCompletionAPITestCase(TestCase):
         
         # 验证是否在现有对话中添加了消息
         self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 2)
+        
+        # 收到回复后用户消息状态为成功
+        user_message = Message.objects.get(conversation=self.conversation, role='user')
+        self.assertEqual(user_message.status, Message.Status.SUCCESS)
+    
+    @patch('chat.views.ChatCompletionView.call_dashscope_api')
+    def test_chat_completion_server_side_context(self, mock_api_call):
+        """
+        测试聊天完成API - 只发送conversation_id和新消息，由服务端组装上下文
+        """
+        cache.clear()
+        Message.objects.create(conversation=self.conversation, role='user', content='第一个问题')
+        Message.objects.create(conversation=self.conversation, role='assistant', content='第一个回答')
+        # 失败的消息不进入上下文
+        Message.objects.create(
+            conversation=self.conversation, role='user', content='失败的问题',
+            status=Message.Status.FAILED
+        )
+        mock_api_call.return_value = {'content': '第二个回答', 'usage': {'total_tokens': 30}}
+        
+        url = '/api/v1/chat/completion/'
+        response = self.client.post(url, {
+            'conversation_id': self.conversation.id,
+            'message': '第二个问题'
+        }, format='json')
+        
+        self.assertEqual(response.json()['data']['content'], '第二个回答')
+        sent = [(m['role'], m['content']) for m in mock_api_call.call_args.args[0]]
+        self.assertEqual(sent, [
+            ('user', '第一个问题'),
+            ('assistant', '第一个回答'),
+            ('user', '第二个问题'),
+        ])
+        
+        # 下一轮使用增量更新后的缓存上下文，包含上一轮的问答
+        mock_api_call.return_value = {'content': '第三个回答', 'usage': {'total_tokens': 40}}
+        self.client.post(url, {
+            'conversation_id': self.conversation.id,
+            'message': {'role': 'user', 'content': '第三个问题'}
+        }, format='json')
+        
+        sent = [m['content'] for m in mock_api_call.call_args.args[0]]
+        self.assertEqual(sent, ['第一个问题', '第一个回答', '第二个问题', '第二个回答', '第三个问题'])
+    
+    @patch('chat.views.ChatCompletionView.call_dashscope_api')
+    def test_chat_completion_api_failure(self, mock_api_call):
+        """
+        测试聊天完成API - 上游调用失败时用户消息被标记为失败
+        """
+        mock_api_call.side_effect = Exception('状态码=503')
+        
+        url = '/api/v1/chat/completion/'
+        data = {
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': '这条消息不会得到回复'
+                }
+            ],
+            'conversation_id': self.conversation.id
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        # 检查错误响应
+        data = response.json()
+        self.assertEqual(data['code'], 500)
+        self.assertIn('AI服务调用失败', data['message'])
+        
+        # 用户消息已保存但标记为失败，没有AI回复
+        messages = Message.objects.filter(conversation=self.conversation)
+        self.assertEqual(messages.count(), 1)
+        self.assertEqual(messages[0].role, 'user')
+        self.assertEqual(messages[0].status, Message.Status.FAILED)
+    
+    @patch('chat.views.ChatCompletionView.call_dashscope_api_stream')
+    def test_chat_completion_stream(self, mock_stream_call):
+        """
+        测试聊天完成API - 流式输出
+        """
+        # 模拟增量输出，最后一段携带usage
+        mock_stream_call.return_value = iter([
+            {'content': '你好', 'usage': {}},
+            {'content': '，我是AI助手。', 'usage': {'total_tokens': 12}},
+        ])
+        
+        url = '/api/v1/chat/completion/'
+        data = {
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': '你好'
+                }
+            ],
+            'conversation_id': self.conversation.id,
+            'stream': True
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        # 检查响应类型
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/event-stream'))
+        
+        # 解析SSE事件
+        body = b''.join(response.streaming_content).decode('utf-8')
+        events = []
+        for block in body.strip().split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((lines['event'], json.loads(lines['data'])))
+        
+        self.assertEqual([e[0] for e in events], ['start', 'delta', 'delta', 'done'])
+        self.assertEqual(events[-1][1]['content'], '你好，我是AI助手。')
+        self.assertEqual(events[-1][1]['conversation_id'], self.conversation.id)
+        
+        # 验证流结束后保存了完整的AI回复
+        ai_message = Message.objects.filter(conversation=self.conversation, role='assistant').get()
+        self.assertEqual(ai_message.content, '你好，我是AI助手。')
+        self.assertEqual(ai_message.tokens_used, 12)
+    
+    @patch('chat.views.AsyncChatCompletionView.call_dashscope_api', new_callable=AsyncMock)
+    async def test_async_chat_completion(self, mock_api_call):
+        """
+        测试异步聊天完成API
+        """
+        mock_api_call.return_value = {
+            'content': '这是异步接口的回复。',
+            'usage': {'total_tokens': 18}
+        }
+        
+        url = '/api/v1/chat/completion/async/'
+        data = {
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': '异步测试问题'
+                }
+            ],
+            'conversation_id': self.conversation.id
+        }
+        token = str(RefreshToken.for_user(self.user).access_token)
+        
+        response = await self.async_client.post(
+            url, data, content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        
+        # 检查响应格式与同步接口一致
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['code'], 200)
+        self.assertEqual(data['data']['content'], '这是异步接口的回复。')
+        self.assertEqual(data['data']['conversation_id'], self.conversation.id)
+        
+        # 验证消息已写入数据库
+        self.assertEqual(await Message.objects.filter(conversation=self.conversation).acount(), 2)
+        
+        # 未携带令牌时返回401
+        response = await self.async_client.post(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
     
     def test_chat_completion_invalid_request(self):
         """
@@ -220,6 +383,18 @@ class ChatCompletionAPITestCase(TestCase):
         
         # 检查响应状态码是否为401未授权
         self.assertEqual(response.status_code, 401)
+    
+    def test_wants_stream(self):
+        """
+        测试同步和异步接口共用的流式输出判断
+        """
+        from chat.views import wants_stream
+        for value in (True, 1, 'true', 'TRUE', 'Yes', '1'):
+            self.assertTrue(wants_stream(value), value)
+        for value in (False, 0, None, '', 'false', '0', 'no'):
+            self.assertFalse(wants_stream(value), value)
+        self.assertTrue(wants_stream(False, 'text/event-stream'))
+        self.assertFalse(wants_stream(None, 'application/json'))
 
 if __name__ == '__main__':
     # 如果要单独运行此测试文件，取消以下注释并运行此脚本
@@ -0,0 +1,117 @@
+import os
+import sys
+from unittest.mock import patch
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from chat import completion_cache
+from chat.completion_cache import CompletionCache, cache_key, normalized_payload
+from chat.models import Conversation, Message
+
+User = get_user_model()
+
+
+class CompletionCacheUnitTestCase(SimpleTestCase):
+    """
+    测试缓存键的规范化和LRU/TTL淘汰
+    """
+
+    def test_key_normalization(self):
+        key = cache_key(normalized_payload([{'role': 'user', 'content': ' 你好 '}]))
+        self.assertEqual(key, cache_key(normalized_payload([{'role': 'user', 'content': '你好'}])))
+        # 全角字符按NFKC规范化
+        self.assertEqual(
+            cache_key(normalized_payload([{'role': 'user', 'content': 'ＡＢＣ'}])),
+            cache_key(normalized_payload([{'role': 'user', 'content': 'ABC'}])),
+        )
+        self.assertNotEqual(key, cache_key(normalized_payload([{'role': 'user', 'content': '您好'}])))
+
+    def test_lru_and_ttl(self):
+        cache = CompletionCache(ttl=10, max_entries=2, max_chars=100)
+        cache.set('a', 'A', now=1)
+        cache.set('b', 'B', now=1)
+        self.assertEqual(cache.get('a', now=2), 'A')
+        cache.set('c', 'C', now=2)
+        # b最久未使用，被淘汰
+        self.assertIsNone(cache.get('b', now=2))
+        self.assertEqual(cache.get('a', now=2), 'A')
+        self.assertIsNone(cache.get('a', now=11))
+
+        cache.set('d', 'x' * 100, now=3)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.chars, 100)
+
+
+@override_settings(CHAT_COMPLETION_CACHE={'ENABLED': True})
+class CompletionCacheViewTestCase(TestCase):
+    """
+    测试对话接口命中缓存时不调用上游，并记录tokens_used=0的消息
+    """
+
+    def setUp(self):
+        completion_cache._cache = None
+        self.addCleanup(setattr, completion_cache, '_cache', None)
+        self.user = User.objects.create_user(username='cache', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @patch('chat.views.get_client')
+    def test_identical_prompt_hits_cache(self, mock_get_client):
+        mock_get_client.return_value.generate.return_value = {'content': '你好！', 'usage': {'total_tokens': 9}}
+        for _ in range(2):
+            conversation = Conversation.objects.create(user=self.user, title='新对话')
+            response = self.client.post('/api/v1/chat/completion/', {
+                'messages': [{'role': 'user', 'content': '你好'}],
+                'conversation_id': conversation.id,
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(mock_get_client.return_value.generate.call_count, 1)
+        self.assertTrue(response.data['data']['cache_hit'])
+        self.assertEqual(response.data['data']['content'], '你好！')
+        replies = Message.objects.filter(role='assistant').order_by('id')
+        self.assertEqual([(m.tokens_used, m.cache_hit) for m in replies], [(9, False), (0, True)])
+
+    @patch('chat.views.get_client')
+    @override_settings(CHAT_COMPLETION_CACHE={'ENABLED': True, 'DETERMINISTIC_ONLY': True})
+    def test_sampled_requests_bypass(self, mock_get_client):
+        mock_get_client.return_value.generate.return_value = {'content': '你好！', 'usage': {'total_tokens': 9}}
+        conversation = Conversation.objects.create(user=self.user, title='新对话')
+        for _ in range(2):
+            self.client.post('/api/v1/chat/completion/', {
+                'messages': [{'role': 'user', 'content': '你好'}],
+                'conversation_id': conversation.id,
+            }, format='json')
+        self.assertEqual(mock_get_client.return_value.generate.call_count, 2)
+
+    @patch('chat.views.get_client')
+    @override_settings(CHAT_COMPLETION_CACHE={'ENABLED': True, 'DETERMINISTIC_ONLY': True},
+                       DASHSCOPE_PARAMETERS={'temperature': 0})
+    def test_deterministic_requests_cached(self, mock_get_client):
+        mock_get_client.return_value.generate.return_value = {'content': '你好！', 'usage': {'total_tokens': 9}}
+        conversation = Conversation.objects.create(user=self.user, title='新对话')
+        for _ in range(2):
+            self.client.post('/api/v1/chat/completion/', {
+                'messages': [{'role': 'user', 'content': '你好'}],
+                'conversation_id': conversation.id,
+            }, format='json')
+        self.assertEqual(mock_get_client.return_value.generate.call_count, 1)
+        self.assertEqual(normalized_payload([])['parameters']['temperature'], 0)
+
+    @override_settings(CHAT_COMPLETION_CACHE={'ENABLED': True, 'DETERMINISTIC_ONLY': True},
+                       DASHSCOPE_PARAMETERS={'temperature': 0.7})
+    def test_warns_when_cache_never_used(self):
+        with self.assertLogs('chat.completion_cache', 'WARNING') as logs:
+            completion_cache.lookup([{'role': 'user', 'content': '你好'}])
+            completion_cache.lookup([{'role': 'user', 'content': '你好'}])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('DETERMINISTIC_ONLY', logs.output[0])
@@ -0,0 +1,83 @@
+import os
+import sys
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.context import trim_context
+from chat.tokens import estimate_tokens
+
+
+def make_history(turns):
+    """
+    构造多轮对话，每条消息约100个token
+    """
+    messages = [{'role': 'system', 'content': '你是一个乐于助人的助手。'}]
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f'问题{i}' + '问' * 100})
+        messages.append({'role': 'assistant', 'content': f'回答{i}' + '答' * 100})
+    messages.append({'role': 'user', 'content': '最新的问题'})
+    return messages
+
+
+class ContextWindowTestCase(SimpleTestCase):
+    """
+    测试按token预算裁剪上下文
+    """
+    
+    def test_estimate_tokens(self):
+        """
+        测试中英文token估算
+        """
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('你好世界'), 4)
+        self.assertEqual(estimate_tokens('hello world!'), 3)
+    
+    def test_within_budget_unchanged(self):
+        """
+        测试未超出预算时消息不变
+        """
+        messages = make_history(2)
+        result, info = trim_context(messages, budget=10000)
+        
+        self.assertEqual(result, messages)
+        self.assertEqual(info['dropped_messages'], 0)
+    
+    @override_settings(CHAT_CONTEXT_WINDOW={'STRATEGY': 'drop'})
+    def test_drop_oldest_turns(self):
+        """
+        测试超出预算时丢弃最早的轮次，保留system消息和最新输入
+        """
+        messages = make_history(10)
+        result, info = trim_context(messages, budget=500)
+        
+        self.assertEqual(result[0]['role'], 'system')
+        self.assertEqual(result[-1]['content'], '最新的问题')
+        # 保留的历史以用户消息开头，且是最新的轮次
+        self.assertEqual(result[1]['role'], 'user')
+        self.assertTrue(result[-2]['content'].startswith('回答9'))
+        
+        self.assertLessEqual(info['estimated_tokens'], 500)
+        self.assertEqual(info['input_messages'], len(messages))
+        self.assertEqual(info['kept_messages'], len(result))
+        self.assertEqual(info['dropped_messages'], len(messages) - len(result))
+    
+    @override_settings(CHAT_CONTEXT_WINDOW={'STRATEGY': 'summarize', 'SUMMARY_TOKENS': 150})
+    def test_summarize_oldest_turns(self):
+        """
+        测试summarize策略把被裁掉的轮次压缩为摘要消息
+        """
+        messages = make_history(10)
+        result, info = trim_context(messages, budget=600)
+        
+        summary = result[1]
+        self.assertEqual(summary['role'], 'system')
+        self.assertIn('摘要', summary['content'])
+        self.assertGreater(info['summarized_messages'], 0)
+        self.assertLessEqual(info['estimated_tokens'], 600)
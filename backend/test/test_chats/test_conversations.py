@@ -1,5 +1,6 @@
 import os
 import sys
+from unittest.mock import patch
 import json
 
 # 首先导入测试配置
@@ -9,7 +10,7 @@ try:
 except ImportError:
     print("无法导入conftest模块")
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
@@ -97,6 +98,142 @@ class ConversationAPITestCase(TestCase):
             self.assertIn('updated_at', conversation)
             self.assertIn('message_count', conversation)
     
+    def test_list_conversations_query_count(self):
+        """
+        测试对话列表的查询次数固定，不随对话数量增长
+        """
+        for i in range(8):
+            conversation = Conversation.objects.create(user=self.user, title=f"批量对话{i}")
+            for j in range(3):
+                Message.objects.create(conversation=conversation, role="user", content=f"消息{j}")
+        
+        url = '/api/v1/chat/conversations/'
+        # 游标分页不需要计数查询，摘要来自冗余字段，不再查询Message表
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        
+        data = response.json()['data']
+        self.assertEqual(len(data), 10)
+        
+        # 冗余字段与逐个查询的结果一致
+        for item in data:
+            conversation = Conversation.objects.get(id=item['id'])
+            self.assertEqual(item['message_count'], conversation.messages.count())
+            last_message = conversation.messages.last()
+            if last_message:
+                self.assertEqual(item['last_message']['content'], last_message.content)
+            else:
+                self.assertIsNone(item['last_message'])
+    
+    def test_conversation_summary_maintained_on_write(self):
+        """
+        测试写入、删除、清空消息时对话摘要字段同步更新，管理命令可以修复
+        """
+        from io import StringIO
+        from django.core.management import call_command
+        
+        conversation = Conversation.objects.create(user=self.user, title="摘要对话")
+        first = Message.objects.create(conversation=conversation, role="user", content="第一条")
+        last = Message.objects.create(conversation=conversation, role="assistant", content="第二条", tokens_used=30)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 2)
+        self.assertEqual(conversation.total_tokens, 30)
+        self.assertEqual(conversation.last_message_preview, "第二条")
+        self.assertEqual(conversation.last_message_at, last.created_at)
+        
+        last.delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 1)
+        self.assertEqual(conversation.total_tokens, 0)
+        self.assertEqual(conversation.last_message_preview, "第一条")
+        self.assertEqual(conversation.last_message_at, first.created_at)
+        
+        self.assertEqual(conversation.clear_messages(), 1)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 0)
+        self.assertIsNone(conversation.last_message_at)
+        
+        # 绕过模型写入导致不一致后，由管理命令修复
+        Conversation.objects.filter(pk=self.conversation1.pk).update(message_count=99, last_message_preview='')
+        out = StringIO()
+        call_command('rebuild_conversation_summary', '--check', stdout=out)
+        self.assertIn(f'对话 {self.conversation1.id}', out.getvalue())
+        
+        call_command('rebuild_conversation_summary', stdout=StringIO())
+        self.conversation1.refresh_from_db()
+        self.assertEqual(self.conversation1.message_count, self.conversation1.messages.count())
+        self.assertEqual(self.conversation1.last_message_preview, self.conversation1.messages.last().content[:100])
+    
+    def test_list_conversations_cursor_pagination(self):
+        """
+        测试对话列表游标分页可以翻到全部对话，且不重复
+        """
+        for i in range(23):
+            Conversation.objects.create(user=self.user, title=f"分页对话{i}")
+        
+        url = '/api/v1/chat/conversations/'
+        seen = []
+        params = {'page_size': 10}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(item['id'] for item in body['data'])
+            if not body['pagination']['has_more']:
+                self.assertIsNone(body['pagination']['next_cursor'])
+                break
+            params['cursor'] = body['pagination']['next_cursor']
+        
+        expected = list(
+            Conversation.objects.filter(user=self.user).order_by('-updated_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        
+        response = self.client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_conversation_messages_pagination(self):
+        """
+        测试详情只返回最近的消息，更早的消息通过messages子接口分页加载
+        """
+        from chat.views import ConversationViewSet
+        
+        conversation = Conversation.objects.create(user=self.user, title="长对话")
+        for i in range(7):
+            Message.objects.create(conversation=conversation, role="user", content=f"消息{i}")
+        
+        url = f'/api/v1/chat/conversations/{conversation.id}/messages/'
+        response = self.client.get(url, {'page_size': 5})
+        body = response.json()
+        self.assertEqual([m['content'] for m in body['data']], [f"消息{i}" for i in range(5)])
+        self.assertTrue(body['pagination']['has_more'])
+        
+        response = self.client.get(url, {'page_size': 5, 'cursor': body['pagination']['next_cursor']})
+        body = response.json()
+        self.assertEqual([m['content'] for m in body['data']], ["消息5", "消息6"])
+        self.assertFalse(body['pagination']['has_more'])
+        
+        original_limit = ConversationViewSet.DETAIL_MESSAGE_LIMIT
+        ConversationViewSet.DETAIL_MESSAGE_LIMIT = 3
+        try:
+            detail = self.client.get(f'/api/v1/chat/conversations/{conversation.id}/').json()['data']
+        finally:
+            ConversationViewSet.DETAIL_MESSAGE_LIMIT = original_limit
+        self.assertEqual([m['content'] for m in detail['messages']], ["消息4", "消息5", "消息6"])
+        self.assertTrue(detail['has_more_messages'])
+        
+        # 从详情返回的游标向前加载更早的消息
+        response = self.client.get(url, {'order': 'desc', 'cursor': detail['messages_cursor']})
+        self.assertEqual([m['content'] for m in response.json()['data']], [f"消息{i}" for i in range(3, -1, -1)])
+        
+        # 修改标题的响应同样只包含最近的消息
+        with patch('chat.serializers.DETAIL_MESSAGE_LIMIT', 3), patch.object(ConversationViewSet, 'DETAIL_MESSAGE_LIMIT', 3):
+            updated = self.client.patch(
+                f'/api/v1/chat/conversations/{conversation.id}/', {'title': '新标题'}, format='json'
+            ).json()
+        self.assertEqual([m['content'] for m in updated['messages']], ["消息4", "消息5", "消息6"])
+        self.assertTrue(updated['has_more_messages'])
+    
     def test_create_conversation(self):
         """
         测试创建新对话
@@ -193,6 +330,60 @@ class ConversationAPITestCase(TestCase):
         # 验证对话中的消息数量
         self.assertEqual(Message.objects.filter(conversation=self.conversation1).count(), 0)
     
+    def test_bulk_delete_without_soft_delete(self):
+        """
+        测试默认（未开启软删除）时批量删除直接物理删除对话和消息
+        """
+        response = self.client.post(
+            '/api/v1/chat/conversations/bulk_delete/', {'ids': [self.conversation1.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Conversation.all_objects.filter(id=self.conversation1.id).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=self.conversation1.id).exists())
+    
+    @override_settings(CHAT_SOFT_DELETE=True)
+    def test_bulk_delete_and_purge_conversations(self):
+        """
+        测试批量软删除对话，以及清理命令分批物理删除对话和消息
+        """
+        from io import StringIO
+        from django.core.management import call_command
+        
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='password123')
+        other_conversation = Conversation.objects.create(user=other_user, title="别人的对话")
+        
+        url = '/api/v1/chat/conversations/bulk_delete/'
+        response = self.client.post(
+            url, {'ids': [self.conversation1.id, self.conversation2.id, other_conversation.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        # 不能删除其他用户的对话
+        self.assertEqual(response.json()['data']['deleted'], 2)
+        self.assertFalse(Conversation.objects.filter(user=self.user).exists())
+        self.assertTrue(Conversation.objects.filter(id=other_conversation.id).exists())
+        
+        # 软删除后消息仍在，由清理命令物理删除
+        self.assertEqual(Message.objects.filter(conversation=self.conversation1).count(), 2)
+        call_command('purge_deleted_conversations', '--chunk-size', '1', stdout=StringIO())
+        self.assertFalse(Conversation.all_objects.filter(user=self.user).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=self.conversation1.id).exists())
+        
+        response = self.client.post(url, {'ids': 'all'}, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_clear_messages_in_chunks(self):
+        """
+        测试分批清空消息后摘要字段被重置
+        """
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation1, role="user", content=f"消息{i}")
+        
+        self.assertEqual(self.conversation1.clear_messages(chunk_size=2), 7)
+        self.conversation1.refresh_from_db()
+        self.assertEqual(self.conversation1.message_count, 0)
+        self.assertEqual(self.conversation1.last_message_preview, '')
+        self.assertFalse(Message.objects.filter(conversation=self.conversation1).exists())
+    
     def test_unauthorized_access(self):
         """
         测试未授权访问
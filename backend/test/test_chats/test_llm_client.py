@@ -0,0 +1,128 @@
+import os
+import sys
+from unittest.mock import patch, MagicMock
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+import httpx
+from django.test import SimpleTestCase
+
+from chat.llm_client import DashScopeClient, LLMError
+from tools.timing import RequestTimer, _current_timer
+
+
+def fake_response(status_code, payload=None, headers=None):
+    """
+    构造模拟的requests响应
+    """
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = payload or {}
+    response.text = str(payload)
+    return response
+
+
+OK_PAYLOAD = {
+    'output': {'choices': [{'message': {'role': 'assistant', 'content': '你好'}}]},
+    'usage': {'total_tokens': 10}
+}
+
+
+class DashScopeClientTestCase(SimpleTestCase):
+    """
+    测试DashScope客户端的重试与统计
+    """
+    
+    def make_client(self, **options):
+        options.setdefault('BACKOFF_BASE', 0)
+        return DashScopeClient(api_key='test-key', url='http://dashscope.test/generation', **options)
+    
+    def test_retry_on_server_error(self):
+        """
+        测试5xx后按退避重试并最终成功
+        """
+        client = self.make_client()
+        with patch.object(client.session, 'post', side_effect=[
+            fake_response(503), fake_response(200, OK_PAYLOAD)
+        ]) as mock_post:
+            result = client.generate([{'role': 'user', 'content': '你好'}])
+        
+        self.assertEqual(result['content'], '你好')
+        self.assertEqual(mock_post.call_count, 2)
+        
+        # 每次请求都带有连接/读取超时
+        self.assertIn('timeout', mock_post.call_args.kwargs)
+        
+        stats = client.stats.snapshot()
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['status_codes'], {200: 1})
+    
+    def test_client_error_not_retried(self):
+        """
+        测试4xx（429除外）不重试
+        """
+        client = self.make_client()
+        with patch.object(client.session, 'post', return_value=fake_response(400)) as mock_post:
+            with self.assertRaises(LLMError) as ctx:
+                client.generate([{'role': 'user', 'content': '你好'}])
+        
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(client.stats.snapshot()['errors'], 1)
+    
+    def test_retry_budget_exhausted(self):
+        """
+        测试重试预算耗尽后不再重试
+        """
+        client = self.make_client(RETRY_BUDGET_RATIO=0, RETRY_BUDGET_MIN_PER_SECOND=0.1)
+        client.retry_budget.tokens = 1
+        with patch.object(client.session, 'post', return_value=fake_response(429)) as mock_post:
+            with self.assertRaises(LLMError):
+                client.generate([{'role': 'user', 'content': '你好'}])
+        
+        # 首次请求 + 预算内的一次重试
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(client.stats.snapshot()['budget_exhausted'], 1)
+
+    def run_timed(self, func, *args):
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        try:
+            return func(*args), timer
+        finally:
+            _current_timer.reset(token)
+
+    def test_non_stream_records_ttfb(self):
+        """
+        测试非流式调用在收到响应头时记录 llm_ttfb，响应体随后读取
+        """
+        client = self.make_client()
+        with patch.object(client.session, 'post', return_value=fake_response(200, OK_PAYLOAD)) as mock_post:
+            result, timer = self.run_timed(client.generate, [{'role': 'user', 'content': '你好'}])
+
+        self.assertEqual(result['content'], '你好')
+        self.assertTrue(mock_post.call_args.kwargs['stream'])
+        self.assertEqual(timer.spans['llm_ttfb'][1], 1)
+
+    async def test_async_non_stream_records_ttfb(self):
+        client = self.make_client()
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json=OK_PAYLOAD))
+        async_client = httpx.AsyncClient(transport=transport)
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        try:
+            with patch.object(client, 'async_client', return_value=async_client):
+                result = await client.agenerate([{'role': 'user', 'content': '你好'}])
+        finally:
+            _current_timer.reset(token)
+            await async_client.aclose()
+
+        self.assertEqual(result['content'], '你好')
+        self.assertEqual(timer.spans['llm_ttfb'][1], 1)
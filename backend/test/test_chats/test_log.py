@@ -0,0 +1,49 @@
+import os
+import sys
+import io
+import json
+import logging
+import threading
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase
+
+from tools.log import JsonFormatter, QueueStreamHandler
+
+
+class QueueStreamHandlerTestCase(SimpleTestCase):
+    """
+    测试日志消息和异常堆栈在调用线程中生成
+    """
+
+    def test_message_rendered_in_calling_thread(self):
+        threads = []
+
+        class Model:
+            def __str__(self):
+                threads.append(threading.get_ident())
+                return 'model'
+
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger = logging.Logger('test_log')
+        logger.addHandler(handler)
+        instance = Model()
+        try:
+            raise ValueError('失败')
+        except ValueError:
+            logger.exception("保存 %s 失败", instance, extra={'conversation_id': 1})
+        handler.close()
+
+        self.assertEqual(threads, [threading.get_ident()])
+        data = json.loads(stream.getvalue())
+        self.assertEqual(data['message'], '保存 model 失败')
+        self.assertEqual(data['conversation_id'], 1)
+        self.assertIn('ValueError: 失败', data['exc_info'])
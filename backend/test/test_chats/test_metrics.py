@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import tempfile
+from unittest.mock import patch
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from chat.models import Conversation
+from tools.metrics import Counter, Gauge, Histogram, Registry
+
+User = get_user_model()
+
+
+class RegistryTestCase(SimpleTestCase):
+    """
+    测试指标的文本格式和多进程合并
+    """
+
+    def setUp(self):
+        self.registry = Registry()
+        self.requests = Counter('test_requests_total', '请求数', ['outcome'], registry=self.registry)
+        self.in_flight = Gauge('test_in_flight', '进行中', registry=self.registry)
+        self.latency = Histogram('test_latency_seconds', '耗时', registry=self.registry, buckets=(0.1, 1))
+
+    def test_render(self):
+        self.requests.inc(outcome='success')
+        self.requests.inc(2, outcome='error')
+        self.in_flight.set_function(lambda: 3)
+        self.latency.observe(0.05)
+        self.latency.observe(0.5)
+        self.latency.observe(5)
+        text = self.registry.render()
+
+        self.assertIn('# TYPE test_requests_total counter', text)
+        self.assertIn('test_requests_total{outcome="error"} 2', text)
+        self.assertIn('test_in_flight 3', text)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count 3', text)
+        self.assertIn('test_latency_seconds_sum 5.55', text)
+
+        with self.assertRaises(ValueError):
+            self.requests.inc(status='200')
+
+    def test_multiprocess_merge(self):
+        directory = tempfile.mkdtemp()
+        self.requests.inc(outcome='success')
+        self.in_flight.set(1)
+        self.latency.observe(0.05)
+        # 模拟已退出的worker写入的文件：计数保留，Gauge不计入
+        exited_pid = 2 ** 22 + 12345
+        with open(os.path.join(directory, f'{exited_pid}.json'), 'w') as f:
+            json.dump({
+                'test_requests_total': {'type': 'counter', 'values': [[['success'], 4]]},
+                'test_in_flight': {'type': 'gauge', 'values': [[[], 7]]},
+                'test_latency_seconds': {'type': 'histogram', 'values': [[[], [0, 1, 0, 0.5]]]},
+            }, f)
+
+        with override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+            text = self.registry.render()
+        self.assertIn('test_requests_total{outcome="success"} 5', text)
+        self.assertIn('test_in_flight 1', text)
+        self.assertIn('test_latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('test_latency_seconds_count 2', text)
+
+
+class MetricsEndpointTestCase(TestCase):
+    """
+    测试指标接口的访问控制和对话指标
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='metrics', password='password123')
+        self.conversation = Conversation.objects.create(user=self.user, title='指标测试')
+        self.client = APIClient()
+
+    @override_settings(METRICS={'TOKEN': 'scrape-secret'})
+    def test_access(self):
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        response = self.client.get('/api/v1/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+        self.client.credentials()
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, 403)
+        self.user.role = User.Role.STAFF
+        self.user.save()
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, 200)
+
+    @patch('chat.views.ChatCompletionView.call_dashscope_api')
+    @override_settings(METRICS={'TOKEN': 'scrape-secret'})
+    def test_completion_metrics(self, mock_api_call):
+        mock_api_call.return_value = {'content': '回复', 'usage': {'input_tokens': 5, 'output_tokens': 3}}
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/v1/chat/completion/', {
+            'messages': [{'role': 'user', 'content': '你好'}],
+            'conversation_id': self.conversation.id,
+        }, format='json')
+        self.client.force_authenticate(user=None)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        text = self.client.get('/api/v1/metrics/').content.decode()
+
+        self.assertIn('chat_completion_requests_total{view="sync",stream="false",outcome="success"}', text)
+        self.assertIn('llm_tokens_total{type="input"}', text)
+        self.assertIn('chat_completions_in_flight 0', text)
+        self.assertIn('http_request_db_queries_bucket{route="POST api/v1/chat/completion/",le="+Inf"}', text)
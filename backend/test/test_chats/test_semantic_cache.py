@@ -0,0 +1,99 @@
+import os
+import sys
+from unittest.mock import patch
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from chat import semantic_cache
+from chat.models import Conversation, Message
+from chat.semantic_cache import HashedNgramEmbedder, SemanticCache, SemanticIndex
+
+User = get_user_model()
+
+PROMPT = '请帮我写一封请假邮件，说明明天因为身体不适需要请假一天'
+SIMILAR = '请帮我写一封请假邮件，说明明天因为身体不舒服需要请假一天。'
+UNRELATED = '用Python写一个快速排序并解释时间复杂度'
+
+
+class SemanticCacheUnitTestCase(SimpleTestCase):
+    """
+    测试向量化、相似度阈值、上下文指纹和淘汰
+    """
+
+    def setUp(self):
+        self.embedder = HashedNgramEmbedder(dimensions=512)
+
+    def test_embedder(self):
+        vectors = self.embedder.embed([PROMPT, SIMILAR, UNRELATED, ''])
+        self.assertEqual(vectors.shape, (4, 512))
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        self.assertGreater(float(vectors[0] @ vectors[1]), 0.85)
+        self.assertLess(float(vectors[0] @ vectors[2]), 0.3)
+        self.assertEqual(float(np.linalg.norm(vectors[3])), 0.0)
+
+    def test_query_requires_same_context(self):
+        cache = SemanticCache(self.embedder, threshold=0.85, max_entries=10)
+        messages = [{'role': 'user', 'content': PROMPT}]
+        key, cached = cache.query(messages)
+        self.assertIsNone(cached)
+        cache.add(key, '回复')
+
+        self.assertEqual(cache.query([{'role': 'user', 'content': SIMILAR}])[1], '回复')
+        self.assertIsNone(cache.query([{'role': 'user', 'content': UNRELATED}])[1])
+        # 历史上下文不同时不命中
+        history = [{'role': 'user', 'content': '你好'}, {'role': 'assistant', 'content': '你好！'}]
+        self.assertIsNone(cache.query([*history, {'role': 'user', 'content': SIMILAR}])[1])
+        # 最后一条不是用户消息时不使用缓存
+        self.assertEqual(cache.query([{'role': 'assistant', 'content': PROMPT}]), (None, None))
+
+    def test_eviction_and_ttl(self):
+        index = SemanticIndex(dimensions=512, max_entries=2, ttl=10)
+        vectors = self.embedder.embed(['第一个问题是什么', '第二个问题是什么呢', '第三个完全不同的提示词'])
+        index.add(vectors[0], 'ctx', 'A', now=1)
+        index.add(vectors[1], 'ctx', 'B', now=2)
+        self.assertEqual(index.search(vectors[0], 'ctx', 0.99, now=3)[0], 'A')
+        # B最久未命中，被淘汰
+        index.add(vectors[2], 'ctx', 'C', now=4)
+        self.assertIsNone(index.search(vectors[1], 'ctx', 0.99, now=5)[0])
+        self.assertEqual(index.search(vectors[2], 'ctx', 0.99, now=5)[0], 'C')
+        self.assertIsNone(index.search(vectors[2], 'ctx', 0.99, now=20)[0])
+
+
+@override_settings(CHAT_SEMANTIC_CACHE={'ENABLED': True, 'THRESHOLD': 0.85})
+class SemanticCacheViewTestCase(TestCase):
+    """
+    测试相近的提示词命中语义缓存
+    """
+
+    def setUp(self):
+        semantic_cache._cache = None
+        self.addCleanup(setattr, semantic_cache, '_cache', None)
+        self.user = User.objects.create_user(username='semantic', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @patch('chat.views.get_client')
+    def test_similar_prompt_hits_cache(self, mock_get_client):
+        mock_get_client.return_value.generate.return_value = {'content': '请假邮件如下', 'usage': {'total_tokens': 30}}
+        for prompt in (PROMPT, SIMILAR):
+            conversation = Conversation.objects.create(user=self.user, title='新对话')
+            response = self.client.post('/api/v1/chat/completion/', {
+                'messages': [{'role': 'user', 'content': prompt}],
+                'conversation_id': conversation.id,
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(mock_get_client.return_value.generate.call_count, 1)
+        self.assertTrue(response.data['data']['cache_hit'])
+        reply = Message.objects.filter(role='assistant').latest('id')
+        self.assertEqual((reply.content, reply.tokens_used, reply.cache_hit), ('请假邮件如下', 0, True))
@@ -0,0 +1,116 @@
+import os
+import sys
+from unittest.mock import patch
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from chat.models import Conversation
+from tools.timing import Histograms, RequestTimer, get_histograms, span
+
+User = get_user_model()
+
+
+class TimingUnitTestCase(SimpleTestCase):
+    """
+    测试阶段计时、Server-Timing格式和直方图统计
+    """
+
+    def test_span_outside_request_is_noop(self):
+        with span('db'):
+            pass
+
+    def test_header_and_histogram(self):
+        timer = RequestTimer()
+        timer.record('db', 0.002)
+        timer.record('db', 0.003)
+        header = timer.header(total=0.02)
+        self.assertEqual(header, 'db;dur=5.0;desc="2 queries", total;dur=20.0')
+
+        histograms = Histograms(buckets=(10, 100))
+        for _ in range(9):
+            histograms.observe_timer('GET x/', timer, 0.02)
+        histograms.observe('GET x/', 'total', 0.5)
+        stats = histograms.snapshot()['GET x/']
+        self.assertEqual(stats['db']['count'], 9)
+        self.assertEqual(stats['db']['buckets'], {'le_10': 9, 'le_100': 0, 'le_inf': 0})
+        self.assertEqual(stats['total']['p50_ms'], 100)
+        self.assertIsNone(stats['total']['p99_ms'])
+
+
+class ServerTimingTestCase(TestCase):
+    """
+    测试Server-Timing响应头和工作人员的耗时统计接口
+    """
+
+    def setUp(self):
+        get_histograms().reset()
+        self.user = User.objects.create_user(username='timing', password='password123')
+        Conversation.objects.create(user=self.user, title='计时测试')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header(self):
+        # 普通用户默认不输出 Server-Timing 头，但仍计入直方图
+        response = self.client.get('/api/v1/chat/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertIn('GET api/v1/chat/conversations/', get_histograms().snapshot())
+
+        self.user.role = User.Role.STAFF
+        self.user.save()
+        response = self.client.get('/api/v1/chat/conversations/')
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('queries"', header)
+        self.assertIn('serialize;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    @override_settings(SERVER_TIMING={'HEADER': True})
+    def test_header_enabled_for_everyone(self):
+        response = self.client.get('/api/v1/chat/conversations/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        response = APIClient().get('/api/v1/chat/conversations/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING={'HEADER': True})
+    @patch('chat.llm_client.DashScopeClient.generate_stream')
+    def test_stream_recorded_after_finished(self, mock_stream):
+        mock_stream.return_value = iter([{'content': '你好', 'usage': {'total_tokens': 2}}])
+        conversation = Conversation.objects.get(user=self.user)
+        response = self.client.post('/api/v1/chat/completion/', {
+            'messages': [{'role': 'user', 'content': '你好'}],
+            'conversation_id': conversation.id,
+            'stream': True,
+        }, format='json')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual(get_histograms().snapshot(), {})
+
+        b''.join(response.streaming_content)
+        stats = get_histograms().snapshot()['POST api/v1/chat/completion/']
+        self.assertEqual(stats['llm']['count'], 1)
+        self.assertEqual(stats['llm_ttfb']['count'], 1)
+
+    def test_stats_requires_staff(self):
+        self.client.get('/api/v1/chat/conversations/')
+        response = self.client.get('/api/v1/timing/')
+        self.assertEqual(response.status_code, 403)
+
+        self.user.role = User.Role.STAFF
+        self.user.save()
+        response = self.client.get('/api/v1/timing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET api/v1/chat/conversations/', response.data['data'])
+
+        self.client.delete('/api/v1/timing/')
+        # 清空之后只剩清空请求本身
+        self.assertEqual(list(get_histograms().snapshot()), ['DELETE api/v1/timing/'])
@@ -0,0 +1,104 @@
+import os
+import sys
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.conf import settings
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from users.authentication import VersionedRefreshToken
+from users.snapshots import auth_cache, get_user_snapshot, snapshot_cache_key
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    """
+    测试从缓存的用户快照完成JWT认证
+    """
+
+    def setUp(self):
+        auth_cache().clear()
+        self.user = User.objects.create_user(username='snapuser', email='snap@example.com', password='password123')
+        self.admin = User.objects.create_user(
+            username='snapadmin', email='admin@example.com', password='password123', role=User.Role.ADMIN
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {VersionedRefreshToken.for_user(self.user).access_token}'
+        )
+
+    def test_snapshot_removes_user_query(self):
+        url = '/api/v1/chat/conversations/'
+        # 首次请求加载快照 + 对话列表
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # 之后只查询对话列表
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_snapshot_user_loads_remaining_fields_once(self):
+        from users.snapshots import user_from_snapshot
+        
+        user = user_from_snapshot(get_user_snapshot(self.user.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(user.username, 'snapuser')
+            self.assertTrue(user.is_active)
+        # 访问快照之外的字段时一次加载其余全部字段
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'snap@example.com')
+            self.assertEqual(user.bio, '')
+            self.assertTrue(user.check_password('password123'))
+
+    def test_token_endpoint_issues_versioned_token(self):
+        response = self.client.post(
+            '/api/v1/auth/token/', {'username': 'snapuser', 'password': 'password123'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.revoke_tokens()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.assertEqual(client.get('/api/v1/chat/conversations/').status_code, 401)
+
+    def test_deactivation_invalidates_snapshot(self):
+        url = '/api/v1/chat/conversations/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=self.admin)
+        response = admin_client.patch(
+            f'/api/v1/auth/users/{self.user.id}/status/', {'isActive': False}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        # 重新启用后旧令牌已随版本号失效，需要重新登录
+        self.user.refresh_from_db()
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {VersionedRefreshToken.for_user(self.user).access_token}'
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_snapshot_shared_between_workers(self):
+        # 快照在进程间共享：其他worker（另一个缓存连接）能看到快照，撤销令牌后同样看不到
+        self.assertNotIn('LocMemCache', settings.CACHES['auth']['BACKEND'])
+        other_worker = caches.create_connection('auth')
+        key = snapshot_cache_key(self.user.id)
+        get_user_snapshot(self.user.id)
+        self.assertEqual(other_worker.get(key)['token_version'], 0)
+
+        self.user.revoke_tokens()
+        self.assertIsNone(other_worker.get(key))
+        self.assertEqual(get_user_snapshot(self.user.id)['token_version'], 1)
+        self.assertEqual(other_worker.get(key)['token_version'], 1)
@@ -0,0 +1,169 @@
+import os
+import sys
+from io import StringIO
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.normalization import normalize_email, normalize_phone
+from users.serializers import SendEmailCodeSerializer, UserCreateSerializer, UserProfileSerializer
+from users.snapshots import get_user_snapshot, user_from_snapshot
+from users.views import UserViewSet
+
+User = get_user_model()
+
+
+class ContactNormalizationTestCase(TestCase):
+    """
+    测试邮箱/手机号的规范化列、唯一约束和按规范化值查找
+    """
+
+    def test_normalize(self):
+        self.assertEqual(normalize_email('  Foo@Example.COM '), 'foo@example.com')
+        self.assertIsNone(normalize_email(''))
+        self.assertEqual(normalize_phone('+86 138-0000-0000'), '13800000000')
+        self.assertEqual(normalize_phone('8613800000000'), '13800000000')
+        self.assertEqual(normalize_phone('(0086)13800000000'), '13800000000')
+        self.assertIsNone(normalize_phone(' '))
+
+    def test_save_fills_normalized_columns(self):
+        user = User.objects.create_user(username='alice', email='Alice@Example.com', password='password123',
+                                        phone='+86 13800000001')
+        self.assertEqual(user.email_normalized, 'alice@example.com')
+        self.assertEqual(user.phone_normalized, '13800000001')
+
+        user.email = 'ALICE2@example.com'
+        user.save(update_fields=['email'])
+        user.refresh_from_db()
+        self.assertEqual(user.email_normalized, 'alice2@example.com')
+
+        # 没有邮箱/手机号的用户不冲突
+        User.objects.create_user(username='bob', password='password123')
+        User.objects.create_user(username='carol', password='password123')
+
+    def test_unique_constraint(self):
+        User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='alice2', email=' ALICE@example.com', password='password123')
+
+    def test_lookup_uses_single_query(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='password123',
+                                        phone='13800000001')
+        with self.assertNumQueries(1):
+            self.assertTrue(User.with_email('Alice@Example.com').exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(User.with_phone('+86 13800000001').get(), user)
+        with self.assertNumQueries(0):
+            self.assertFalse(User.with_email('').exists())
+
+        self.assertTrue(SendEmailCodeSerializer(data={'email': 'ALICE@example.com'}).is_valid())
+        serializer = UserCreateSerializer(data={'username': 'alice3', 'email': 'Alice@example.com',
+                                                'password': 'password123'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('email', serializer.errors)
+
+
+class DedupeUserContactsTestCase(TestCase):
+    """
+    测试回填规范化列和清理重复邮箱/手机号的管理命令
+    """
+
+    def setUp(self):
+        self.first = User.objects.create_user(username='first', email='dup@example.com', password='password123',
+                                              phone='13800000001')
+        self.second = User.objects.create_user(username='second', password='password123')
+        self.third = User.objects.create_user(username='third', email='third@example.com', password='password123')
+        # 模拟迁移前的数据：大小写/格式不同的重复值，规范化列为空
+        User.objects.filter(pk=self.second.pk).update(
+            email='DUP@example.com ', phone='+86 138 0000 0001', email_normalized=None, phone_normalized=None
+        )
+        User.objects.filter(pk=self.third.pk).update(email_normalized=None)
+
+    def test_unresolved_duplicates_still_usable(self):
+        # 未清理的重复用户：修改其他字段后保存不违反唯一约束
+        second = User.objects.get(pk=self.second.pk)
+        second.first_name = '二'
+        second.save()
+        second.refresh_from_db()
+        self.assertIsNone(second.email_normalized)
+        self.assertIsNone(second.phone_normalized)
+
+        # 按原始写法仍能找到重复的用户
+        User.objects.filter(pk=self.second.pk).update(email='Dup@Example.com', phone='+8613800000001')
+        self.assertEqual(set(User.with_email('dup@example.com')), {self.first, self.second})
+        self.assertEqual(set(User.with_phone('13800000001')), {self.first, self.second})
+
+        # 修改为新的邮箱时重新计算规范化列
+        second = User.objects.get(pk=self.second.pk)
+        second.email = 'second@example.com'
+        second.save(update_fields=['email'])
+        self.assertEqual(User.with_email('SECOND@example.com').get(), self.second)
+
+    def test_snapshot_user_profile_save(self):
+        # 认证快照构造的用户邮箱/手机号为延迟字段，修改其他资料时不重新计算规范化列
+        second = user_from_snapshot(get_user_snapshot(self.second.pk))
+        serializer = UserProfileSerializer(second, {'nickname': '二号'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+        second = User.objects.get(pk=self.second.pk)
+        self.assertEqual(second.nickname, '二号')
+        self.assertIsNone(second.email_normalized)
+        self.assertIsNone(second.phone_normalized)
+
+        # 延迟加载后再保存同样保留
+        second = user_from_snapshot(get_user_snapshot(self.second.pk))
+        self.assertEqual(second.email, 'DUP@example.com ')
+        second.bio = '简介'
+        second.save()
+        self.assertIsNone(User.objects.get(pk=self.second.pk).phone_normalized)
+
+    def test_profile_rejects_taken_contacts(self):
+        view = UserViewSet.as_view({'patch': 'me'})
+        factory = APIRequestFactory()
+        for data in ({'phone': '+8613800000001'}, {'email': 'DUP@Example.com'}):
+            request = factory.patch('/users/me/', data, format='json')
+            force_authenticate(request, user=self.third)
+            response = view(request)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn(next(iter(data)), response.data['data'])
+
+        # 自己当前的邮箱不算冲突
+        request = factory.patch('/users/me/', {'email': 'Third@example.com'}, format='json')
+        force_authenticate(request, user=self.third)
+        self.assertEqual(view(request).status_code, 200)
+
+    def test_report_duplicates(self):
+        out = StringIO()
+        call_command('dedupe_user_contacts', stdout=out)
+
+        self.assertIn('dup@example.com', out.getvalue())
+        self.assertIn('13800000001', out.getvalue())
+        self.third.refresh_from_db()
+        self.assertEqual(self.third.email_normalized, 'third@example.com')
+        self.second.refresh_from_db()
+        self.assertIsNone(self.second.email_normalized)
+        self.assertEqual(self.second.email, 'DUP@example.com ')
+
+    def test_clear_duplicates(self):
+        call_command('dedupe_user_contacts', '--clear-duplicates', stdout=StringIO())
+
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.email, '')
+        self.assertEqual(self.second.phone, '')
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.email_normalized, 'dup@example.com')
+
+        out = StringIO()
+        call_command('dedupe_user_contacts', stdout=out)
+        self.assertIn('没有重复', out.getvalue())
@@ -0,0 +1,168 @@
+import os
+import sys
+from datetime import timedelta
+from unittest import mock
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users import outbox
+from users.models import OutboundMessage
+from users.views import UserViewSet
+
+User = get_user_model()
+
+OUTBOX_SETTINGS = {'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 60, 'IN_PROCESS_WORKER': False}
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'outbox-default'},
+    'verification': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'outbox-codes'},
+}
+
+
+@override_settings(USER_OUTBOX=OUTBOX_SETTINGS, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTestCase(TestCase):
+    """
+    测试发件箱的批量发送、重试和领取
+    """
+
+    def test_send_email_batch(self):
+        for i in range(3):
+            outbox.enqueue_email(f'user{i}@example.com', '主题', '内容', html_body='<p>内容</p>')
+
+        result = outbox.process_batch()
+
+        self.assertEqual(result, {'sent': 3, 'retry': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(OutboundMessage.objects.exclude(status=OutboundMessage.Status.SENT).exists())
+        self.assertEqual(outbox.process_batch(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+    def test_retry_then_fail(self):
+        message = outbox.enqueue_sms('13800000001', '验证码123456')
+        failing = mock.Mock(side_effect=lambda messages: {m.id: '短信服务不可用' for m in messages})
+
+        with mock.patch.dict(outbox.SENDERS, {'sms': failing}):
+            self.assertEqual(outbox.process_batch()['retry'], 1)
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboundMessage.Status.PENDING)
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.next_attempt_at, timezone.now())
+
+            # 退避时间未到，不会再次发送
+            self.assertEqual(sum(outbox.process_batch().values()), 0)
+
+            OutboundMessage.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.process_batch()['failed'], 1)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundMessage.Status.FAILED)
+        self.assertEqual(message.last_error, '短信服务不可用')
+        self.assertEqual(failing.call_count, 2)
+
+    def test_claim_once_and_reclaim_stale(self):
+        outbox.enqueue_sms('13800000001', '验证码')
+
+        claimed = outbox.claim_batch(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        # 领取后超时未完成（worker退出），可以被重新领取
+        OutboundMessage.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+
+    def test_reclaimed_messages_not_sent_or_updated(self):
+        first = outbox.enqueue_sms('13800000001', '验证码1')
+        second = outbox.enqueue_sms('13800000002', '验证码2')
+        delivered = []
+
+        def slow_sender(messages):
+            for message in messages:
+                delivered.append(message.id)
+                # 发送过程中超时，两条消息都被另一个worker重新领取
+                OutboundMessage.objects.update(claim_token='other-worker')
+            return {}
+
+        with mock.patch.dict(outbox.SENDERS, {'sms': slow_sender}):
+            result = outbox.process_batch()
+
+        # 第二条发送前续期失败，不再发送；第一条的发送结果也不覆盖新worker的领取
+        self.assertEqual(delivered, [first.id])
+        self.assertEqual(result, {'sent': 0, 'retry': 0, 'failed': 0})
+        for message in (first, second):
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboundMessage.Status.SENDING)
+            self.assertEqual(message.claim_token, 'other-worker')
+            self.assertEqual(message.attempts, 0)
+
+    def test_sender_error_only_retries_undispatched(self):
+        messages = [outbox.enqueue_sms(f'1380000000{i}', f'验证码{i}') for i in range(3)]
+
+        def broken_sender(messages):
+            iterator = iter(messages)
+            next(iterator)
+            next(iterator)
+            raise RuntimeError('短信客户端异常')
+
+        with mock.patch.dict(outbox.SENDERS, {'sms': broken_sender}):
+            result = outbox.process_batch()
+
+        # 已交给发送函数的两条可能已经发出，不再重试；第三条还没交出，等待重试
+        self.assertEqual(result, {'sent': 2, 'retry': 1, 'failed': 0})
+        statuses = dict(OutboundMessage.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[messages[0].id], OutboundMessage.Status.SENT)
+        self.assertEqual(statuses[messages[1].id], OutboundMessage.Status.SENT)
+        self.assertEqual(statuses[messages[2].id], OutboundMessage.Status.PENDING)
+
+    def test_claim_renewed_before_each_send(self):
+        outbox.enqueue_sms('13800000001', '验证码')
+        OutboundMessage.objects.update(
+            status=OutboundMessage.Status.SENDING, claim_token='dead-worker',
+            claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        seen = []
+
+        def sender(messages):
+            for message in messages:
+                seen.append(OutboundMessage.objects.get(id=message.id).claimed_at)
+            return {}
+
+        with mock.patch.dict(outbox.SENDERS, {'sms': sender}):
+            self.assertEqual(outbox.process_batch()['sent'], 1)
+        self.assertGreater(seen[0], timezone.now() - timedelta(minutes=1))
+
+
+@override_settings(USER_OUTBOX=OUTBOX_SETTINGS, CACHES=LOCMEM_CACHES,
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendCodeEnqueuesTestCase(TestCase):
+    """
+    测试发送验证码接口只写入发件箱，不在请求中发送
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        self.factory = APIRequestFactory()
+
+    def test_send_email_code(self):
+        view = UserViewSet.as_view({'post': 'send_email_code'}, **UserViewSet.send_email_code.kwargs)
+        request = self.factory.post('/send-email-code/', {'email': 'alice@example.com'}, format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.recipient, 'alice@example.com')
+        self.assertEqual(message.status, OutboundMessage.Status.PENDING)
+
+        outbox.process_batch()
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,84 @@
+import os
+import sys
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+
+from users import permission_cache
+from users.snapshots import auth_cache
+
+User = get_user_model()
+
+
+class PermissionCacheTestCase(TestCase):
+    """
+    测试用户权限集合的缓存与失效
+    """
+
+    def setUp(self):
+        auth_cache().clear()
+        self.user = User.objects.create_user(username='permuser', email='perm@example.com', password='password123')
+        self.view_permission = Permission.objects.get(codename='view_conversation')
+        self.delete_permission = Permission.objects.get(codename='delete_conversation')
+        self.groups = [Group.objects.create(name=f'组{i}') for i in range(5)]
+        self.groups[-1].permissions.add(self.view_permission)
+        self.user.groups.add(*self.groups)
+
+    def fresh_user(self):
+        # 模拟新请求中的用户对象
+        return User.objects.get(pk=self.user.pk)
+
+    def fresh_user_has(self, codename):
+        return self.fresh_user().has_permission(codename)
+
+    def test_permissions_resolved_with_single_query(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.has_permission('view_conversation'))
+            self.assertFalse(user.has_permission('delete_conversation'))
+        # 缓存命中后不再查询，与用户组数量无关
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_permission('view_conversation'))
+
+    def test_invalidation_on_group_and_user_changes(self):
+        self.assertFalse(self.fresh_user_has('delete_conversation'))
+
+        # 用户组权限变化
+        self.groups[0].permissions.add(self.delete_permission)
+        self.assertTrue(self.fresh_user_has('delete_conversation'))
+
+        # 用户退出用户组
+        self.user.groups.remove(self.groups[0])
+        self.assertFalse(self.fresh_user_has('delete_conversation'))
+
+        # 直接授予用户权限
+        self.user.user_permissions.add(self.delete_permission)
+        self.assertTrue(self.fresh_user_has('delete_conversation'))
+
+        # 从用户组一侧移除用户
+        self.groups[-1].custom_user_set.remove(self.user)
+        self.assertFalse(self.fresh_user_has('view_conversation'))
+
+    def test_revocation_visible_to_other_workers(self):
+        self.assertTrue(self.fresh_user_has('view_conversation'))
+        # 另一个worker（另一个缓存连接）缓存了同一个权限集合
+        other_worker = caches.create_connection('auth')
+        key = permission_cache.permission_cache_key(self.user.pk)
+        self.assertIn('view_conversation', other_worker.get(key))
+
+        # 撤销用户组的权限后版本号在所有worker上同时变化
+        self.groups[-1].permissions.remove(self.view_permission)
+        version = other_worker.get(permission_cache.VERSION_KEY)
+        self.assertEqual(version, permission_cache.permissions_version())
+        self.assertIsNone(other_worker.get(permission_cache.permission_cache_key(self.user.pk, version)))
+        self.assertFalse(self.fresh_user_has('view_conversation'))
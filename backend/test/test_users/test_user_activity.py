@@ -0,0 +1,65 @@
+import os
+import sys
+from datetime import timedelta
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.activity import ActivityBuffer
+
+User = get_user_model()
+
+
+class UserActivityBufferTestCase(TestCase):
+    """
+    测试最后登录IP/活跃时间的延迟批量写入
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='activeuser', email='active@example.com', password='password123')
+        self.other = User.objects.create_user(username='otheruser', email='other@example.com', password='password123')
+        self.buffer = ActivityBuffer(flush_interval=3600)
+        self.buffer.ensure_worker = lambda: None
+
+    def test_updates_are_coalesced_and_flushed_in_bulk(self):
+        now = timezone.now()
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.1', now))
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.2', now + timedelta(seconds=1)))
+        self.assertTrue(self.buffer.record(self.other, '10.0.0.3', now))
+
+        # 记录时不写数据库
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login_ip)
+        self.assertEqual(len(self.buffer.pending), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 2)
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.last_login_ip, '10.0.0.2')
+        self.assertIsNotNone(user.last_seen)
+        self.assertEqual(User.objects.get(pk=self.other.pk).last_login_ip, '10.0.0.3')
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_unchanged_activity_is_skipped(self):
+        now = timezone.now()
+        self.user.last_login_ip = '10.0.0.1'
+        self.user.last_seen = now
+        self.assertFalse(self.buffer.record(self.user, '10.0.0.1', now + timedelta(seconds=10)))
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.1', now + timedelta(seconds=120)))
+
+    def test_middleware_does_not_write_on_request(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = client.get('/api/v1/chat/conversations/', REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login_ip)
@@ -0,0 +1,83 @@
+import os
+import sys
+from datetime import timedelta
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+class UserManagementListTestCase(TestCase):
+    """
+    测试管理后台用户列表的预取、筛选、搜索和游标分页
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='listadmin', email='listadmin@example.com', password='password123', role=User.Role.ADMIN
+        )
+        self.groups = [Group.objects.create(name=f'列表组{i}') for i in range(3)]
+        for i in range(12):
+            user = User.objects.create_user(
+                username=f'member{i:02d}', email=f'member{i:02d}@example.com', password='password123',
+                phone=f'1380000{i:04d}', is_active=i % 3 != 0,
+                role=User.Role.STAFF if i % 4 == 0 else User.Role.USER
+            )
+            user.groups.add(self.groups[i % 3])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/v1/auth/users/'
+
+    def test_list_query_count_is_constant(self):
+        # 用户列表 + 预取用户组
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'page_size': 50})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(len(data), 13)
+        member = next(item for item in data if item['username'] == 'member04')
+        self.assertEqual(member['role']['id'], self.groups[1].id)
+
+    def test_filters_and_search(self):
+        response = self.client.get(self.url, {'role': 'staff', 'is_active': 'false'})
+        usernames = {item['username'] for item in response.json()['data']}
+        self.assertEqual(usernames, {'member00'})
+
+        response = self.client.get(self.url, {'group': self.groups[2].id})
+        self.assertEqual(len(response.json()['data']), 4)
+
+        response = self.client.get(self.url, {'search': 'MEMBER1'})
+        self.assertEqual({item['username'] for item in response.json()['data']}, {'member10', 'member11'})
+
+        response = self.client.get(self.url, {'search': '13800000005'})
+        self.assertEqual([item['username'] for item in response.json()['data']], ['member05'])
+
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        response = self.client.get(self.url, {'date_joined_after': tomorrow})
+        self.assertEqual(response.json()['data'], [])
+
+        self.assertEqual(self.client.get(self.url, {'role': 'owner'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'date_joined_before': 'yesterday'}).status_code, 400)
+
+    def test_cursor_pagination(self):
+        seen = []
+        params = {'page_size': 5}
+        while True:
+            body = self.client.get(self.url, params).json()
+            seen.extend(item['id'] for item in body['data'])
+            if not body['pagination']['has_more']:
+                break
+            params['cursor'] = body['pagination']['next_cursor']
+        expected = list(User.objects.order_by('-date_joined', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
@@ -0,0 +1,156 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from unittest import mock
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from tools.sqlite_cache import SQLiteCache
+from users.verification import consume_code, consume_email_bind, email_bind_key, sms_code_key, store_code
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 在独立的Python进程中使用同一个缓存文件，模拟多个worker进程
+WORKER_SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, {backend_dir!r})
+    from django.conf import settings
+    settings.configure(CACHES={{
+        'default': {{'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        'verification': {{'BACKEND': 'tools.sqlite_cache.SQLiteCache', 'LOCATION': {location!r}}},
+    }})
+    from users.verification import consume_code, store_code
+    action, key, code = sys.argv[1:4]
+    if action == 'store':
+        store_code(key, code)
+        print('stored')
+    else:
+        print('ok' if consume_code(key, code) else 'fail')
+""")
+
+
+class SQLiteCacheTestCase(SimpleTestCase):
+    """
+    测试SQLite缓存后端的基本语义
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(os.path.join(self.tmpdir.name, 'cache.sqlite3'), {})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_basic_operations(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 1))
+        self.assertEqual(self.cache.incr('new', 5), 6)
+        self.assertTrue(self.cache.delete('key'))
+        self.assertFalse(self.cache.delete('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('key')
+
+    def test_expiry(self):
+        self.cache.set('short', 'value', 0.2)
+        self.assertTrue(self.cache.has_key('short'))
+        time.sleep(0.3)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertFalse(self.cache.delete('short'))
+        self.assertTrue(self.cache.add('short', 'again'))
+
+    def test_cull(self):
+        cache = SQLiteCache(os.path.join(self.tmpdir.name, 'small.sqlite3'),
+                            {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'CULL_EVERY': 1}})
+        for i in range(30):
+            cache.set(f'key{i}', i)
+        count = cache._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        self.assertLessEqual(count, 11)
+        self.assertEqual(cache.get('key29'), 29)
+
+    def test_cull_every_nth_write(self):
+        cache = SQLiteCache(os.path.join(self.tmpdir.name, 'periodic.sqlite3'),
+                            {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_EVERY': 5}})
+        with mock.patch.object(cache, '_cull', wraps=cache._cull) as cull:
+            for i in range(12):
+                cache.set(f'key{i}', i)
+            cache.add('extra', 1)
+            cache.incr('extra')
+            cache.get('key0')
+        # 13次 add/set 只在第5、10次时清理
+        self.assertEqual(cull.call_count, 2)
+
+
+class VerificationCodeAcrossProcessesTestCase(SimpleTestCase):
+    """
+    测试验证码在多个进程之间共享，并且同一验证码只能成功校验一次
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmpdir.name, 'verification.sqlite3')
+        self.script = WORKER_SCRIPT.format(backend_dir=BACKEND_DIR, location=self.location)
+        caches = {
+            **settings.CACHES,
+            'verification': {'BACKEND': 'tools.sqlite_cache.SQLiteCache', 'LOCATION': self.location},
+        }
+        self.override = override_settings(CACHES=caches)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmpdir.cleanup()
+
+    def run_worker(self, *args):
+        result = subprocess.run([sys.executable, '-c', self.script, *args],
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip()
+
+    def test_code_issued_in_another_process(self):
+        key = sms_code_key('13800000001')
+        self.assertEqual(self.run_worker('store', key, '123456'), 'stored')
+
+        self.assertFalse(consume_code(key, '000000'))
+        self.assertTrue(consume_code(key, '123456'))
+        self.assertFalse(consume_code(key, '123456'))
+
+    def test_code_consumed_in_another_process(self):
+        key = sms_code_key('13800000002')
+        store_code(key, '654321')
+        self.assertEqual(self.run_worker('consume', key, '654321'), 'ok')
+        self.assertFalse(consume_code(key, '654321'))
+
+    def test_concurrent_consume_single_winner(self):
+        key = sms_code_key('13800000003')
+        store_code(key, '111111')
+        workers = [
+            subprocess.Popen([sys.executable, '-c', self.script, 'consume', key, '111111'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for _ in range(6)
+        ]
+        results = []
+        for worker in workers:
+            stdout, stderr = worker.communicate(timeout=60)
+            self.assertEqual(worker.returncode, 0, stderr)
+            results.append(stdout.strip())
+        self.assertEqual(results.count('ok'), 1)
+
+    def test_email_bind_token(self):
+        store_code(email_bind_key('a@example.com'), {'user_id': 1, 'email': 'a@example.com', 'token': 'abc'})
+        self.assertIsNone(consume_email_bind('a@example.com', 'wrong'))
+        self.assertEqual(consume_email_bind('a@example.com', 'abc')['user_id'], 1)
+        self.assertIsNone(consume_email_bind('a@example.com', 'abc'))
@@ -0,0 +1,144 @@
+import os
+import sys
+from io import StringIO
+
+# 首先导入测试配置
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import conftest
+except ImportError:
+    print("无法导入conftest模块")
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tools.ratelimit import SlidingWindowRateLimiter
+from users.activity import get_client_ip
+from users.models import OutboundMessage
+from users.verification import RateLimited, consume_code, email_code_key, issuance_stats, issue_code
+from users.views import UserViewSet
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rl-default'},
+    'verification': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rl-codes'},
+}
+RATE_LIMITS = {'target': [(2, 60)], 'ip': [(3, 3600)]}
+
+
+class SlidingWindowRateLimiterTestCase(TestCase):
+    """
+    测试滑动窗口计数
+    """
+
+    def setUp(self):
+        self.cache = caches.create_connection('default')
+        self.cache.clear()
+        self.limiter = SlidingWindowRateLimiter(self.cache, 'test', limit=2, window=60)
+
+    def test_limit_within_window(self):
+        self.assertEqual(self.limiter.hit('a', now=600), (True, 0))
+        self.assertEqual(self.limiter.hit('a', now=610), (True, 0))
+        allowed, retry_after = self.limiter.hit('a', now=620)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 40)
+        # 其他标识不受影响
+        self.assertTrue(self.limiter.hit('b', now=620)[0])
+
+    def test_previous_window_is_weighted(self):
+        for identity in ('a', 'b'):
+            self.limiter.hit(identity, now=650)
+            self.limiter.hit(identity, now=655)
+        # 下一个窗口刚开始时，上一窗口的计数几乎全部有效
+        self.assertFalse(self.limiter.hit('a', now=662)[0])
+        # 窗口过去大半后，上一窗口的权重足够小
+        self.assertTrue(self.limiter.hit('b', now=715)[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, VERIFICATION_RATE_LIMITS=RATE_LIMITS,
+                   USER_OUTBOX={'IN_PROCESS_WORKER': False})
+class IssueCodeTestCase(TestCase):
+    """
+    测试验证码发送的限流、重发和统计
+    """
+
+    def setUp(self):
+        caches['verification'].clear()
+        self.codes = iter(['111111', '222222', '333333', '444444'])
+
+    def generate(self):
+        return next(self.codes)
+
+    def test_reuse_unexpired_code(self):
+        key = email_code_key('a@example.com')
+        self.assertEqual(issue_code('email', key, 'a@example.com', self.generate), ('111111', False))
+        self.assertEqual(issue_code('email', key, 'A@example.com', self.generate), ('111111', True))
+        # 限额按规范化后的邮箱计算
+        with self.assertRaises(RateLimited) as context:
+            issue_code('email', key, 'a@Example.com', self.generate)
+        self.assertEqual(context.exception.scope, 'target')
+
+        self.assertTrue(consume_code(key, '111111'))
+        stats = issuance_stats(['email'])['email']
+        self.assertEqual(stats, {'issued': 1, 'reused': 1, 'limited': 1})
+
+    def test_ip_limit(self):
+        for i in range(3):
+            issue_code('email', email_code_key(f'u{i}@example.com'), f'u{i}@example.com', self.generate, ip='10.0.0.1')
+        with self.assertRaises(RateLimited) as context:
+            issue_code('email', email_code_key('u9@example.com'), 'u9@example.com', self.generate, ip='10.0.0.1')
+        self.assertEqual(context.exception.scope, 'ip')
+        self.assertGreater(context.exception.retry_after, 0)
+
+    def test_send_email_code_returns_429(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        view = UserViewSet.as_view({'post': 'send_email_code'}, **UserViewSet.send_email_code.kwargs)
+        responses = []
+        for _ in range(3):
+            request = APIRequestFactory().post('/send-email-code/', {'email': 'alice@example.com'}, format='json')
+            force_authenticate(request, user=user)
+            responses.append(view(request))
+
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertIn('Retry-After', responses[2])
+        self.assertEqual(responses[2].data['data']['field'], 'email')
+        # 第二次请求重发的是同一个验证码
+        bodies = list(OutboundMessage.objects.values_list('body', flat=True))
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(bodies[0], bodies[1])
+
+        out = StringIO()
+        call_command('verification_stats', stdout=out)
+        self.assertIn('被限流 1', out.getvalue())
+
+    def test_spoofed_forwarded_for_does_not_reset_ip_limit(self):
+        view = UserViewSet.as_view({'post': 'send_email_code'}, **UserViewSet.send_email_code.kwargs)
+        statuses = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'user{i}', email=f'u{i}@example.com', password='password123')
+            # 每次伪造不同的 X-Forwarded-For，按IP的限额仍然累计
+            request = APIRequestFactory().post('/send-email-code/', {'email': f'u{i}@example.com'}, format='json',
+                                               HTTP_X_FORWARDED_FOR=f'203.0.113.{i}', REMOTE_ADDR='10.0.0.2')
+            force_authenticate(request, user=user)
+            response = view(request)
+            statuses.append(response.status_code)
+        # 每个邮箱只发送一次，第4次是按连接地址 REMOTE_ADDR 限流
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        with self.assertRaises(RateLimited) as context:
+            issue_code('email', email_code_key('u9@example.com'), 'u9@example.com', self.generate, ip='10.0.0.2')
+        self.assertEqual(context.exception.scope, 'ip')
+
+    def test_client_ip_behind_trusted_proxies(self):
+        request = APIRequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7, 10.0.0.5',
+                                          REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(get_client_ip(request), '10.0.0.9')
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(get_client_ip(request), '10.0.0.5')
+        with self.settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(get_client_ip(request), '203.0.113.7')
+        with self.settings(TRUSTED_PROXY_COUNT=5):
+            self.assertEqual(get_client_ip(request), '10.0.0.9')
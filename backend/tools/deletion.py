@@ -0,0 +1,28 @@
+"""
+分批删除
+
+一次 DELETE 大量行会长时间持有行锁、产生很大的undo日志，
+这里按主键分批删除，每批一个短事务，批次之间其他请求可以正常读写。
+"""
+from django.db import transaction
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def delete_in_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按主键分批删除queryset中的行，返回删除的行数（不含级联删除的行）
+
+    每批先取出一批主键再按主键删除（MySQL不支持 DELETE ... IN (带LIMIT的子查询)），
+    没有信号和级联时Django会直接执行DELETE，不会把行加载到内存
+    """
+    model = queryset.model
+    queryset = queryset.order_by('pk')
+    total = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return total
+        with transaction.atomic(using=queryset.db):
+            _count, deleted = model._base_manager.using(queryset.db).filter(pk__in=ids).delete()
+        total += deleted.get(model._meta.label, 0)
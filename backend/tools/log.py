@@ -0,0 +1,115 @@
+"""
+结构化日志
+
+- QueueStreamHandler：请求线程只把日志记录放入内存队列，由后台线程格式化并写出，
+  不在请求路径上格式化大对象、也不会因为stdout管道写满而阻塞；队列满时丢弃并计数
+- JsonFormatter：每条日志一行JSON，extra中的字段作为独立的键输出
+- KeyValueFormatter：可读的文本格式，extra中的字段以 key=value 追加在行尾
+
+代码中使用标准库的 logging.getLogger(__name__)，参数使用%格式的延迟格式化：
+    logger.info("保存AI回复: id=%s", message.id, extra={'conversation_id': conversation.id})
+级别和格式在 settings.LOGGING 中配置（LOG_LEVEL / LOG_FORMAT 环境变量）。
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# LogRecord自带的属性，其余属性来自extra
+RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def record_extra(record):
+    return {key: value for key, value in record.__dict__.items() if key not in RESERVED_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **record_extra(record),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # QueueStreamHandler在调用线程中已渲染好异常堆栈
+            data['exc_info'] = record.exc_text
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    def __init__(self, fmt='%(asctime)s %(levelname)s %(name)s %(message)s', datefmt=None, style='%'):
+        super().__init__(fmt, datefmt, style)
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        extra = record_extra(record)
+        if extra:
+            message += ' ' + ' '.join(f'{key}={value}' for key, value in extra.items())
+        return message
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    非阻塞的日志处理器，由后台线程写入stream（默认stderr）
+
+    setFormatter设置的是后台写出时使用的格式；日志消息和异常堆栈在调用线程中生成，
+    格式化输出在后台线程中进行
+    """
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self._start()
+        # gunicorn等预加载应用后fork时，子进程中没有后台线程，需要重新启动
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+        atexit.register(self.close)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        self.queue = queue.Queue(self.maxsize)
+        self._start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # 在调用线程中合并 msg % args、渲染异常堆栈：参数可能是模型实例（__str__会查询数据库）
+        # 或之后会被修改的对象，不能留到后台线程；JSON/key=value等格式化仍在后台线程中进行
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            # 写出队列中剩余的日志
+            listener.stop()
+        self.target.flush()
+        super().close()
@@ -0,0 +1,289 @@
+"""
+进程内的指标注册表，以Prometheus文本格式输出
+
+    REQUESTS = Counter('chat_completion_requests_total', '对话请求数', ['outcome'])
+    REQUESTS.inc(outcome='success')
+
+支持 Counter、Gauge（可用 set_function 在采集时取值）和 Histogram。
+
+多进程部署（gunicorn多个worker）时设置 METRICS['MULTIPROCESS_DIR']：
+每个进程的后台线程每隔 FLUSH_INTERVAL 秒把本进程的指标写入该目录下的 <pid>.json，
+采集接口读取目录中所有进程的文件并与本进程的实时值合并：
+- Counter 和 Histogram 累加所有进程（包括已退出的进程，计数不会因worker重启而回退）
+- Gauge 只累加仍在运行的进程
+因此其他进程的值最多延迟 FLUSH_INTERVAL 秒；重新部署时应清空该目录。
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_METRICS_SETTINGS = {
+    'MULTIPROCESS_DIR': None,    # 多进程共享的指标目录，为空时只输出本进程的指标
+    'FLUSH_INTERVAL': 5,         # 写入共享目录的间隔（秒）
+    'TOKEN': None,               # 采集接口的Bearer令牌，为空时只允许工作人员/管理员访问
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_settings():
+    return {**DEFAULT_METRICS_SETTINGS, **getattr(settings, 'METRICS', {})}
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # 标签值元组 -> 值
+        self.values = {}
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counter只能增加")
+        key = self.key(labels)
+        self.registry.ensure_flusher()
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = None
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        self.registry.ensure_flusher()
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.registry.ensure_flusher()
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """
+        采集时调用function取值，function返回数值（无标签）或 {标签值元组: 数值}
+        """
+        self.function = function
+
+    def collect(self):
+        if self.function is None:
+            return super().collect()
+        value = self.function()
+        return dict(value) if isinstance(value, dict) else {(): value}
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.registry.ensure_flusher()
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # 各桶（非累计）的计数 + [+Inf桶]，最后一项为总和
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def collect(self):
+        with self.lock:
+            return {key: list(entry) for key, entry in self.values.items()}
+
+
+def merge(target, metric_type, values, alive=True):
+    """
+    把一个进程的值合并到target（{标签值元组: 值}）
+    """
+    if metric_type == 'gauge' and not alive:
+        return
+    for key, value in values.items():
+        if metric_type == 'histogram':
+            current = target.get(key)
+            target[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')) for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.flusher_pid = None
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self.metrics[metric.name] = metric
+
+    def dump(self):
+        """
+        本进程的指标：{指标名: {'type', 'values': [[标签值列表, 值], ...]}}
+        """
+        return {
+            name: {'type': metric.type, 'values': [[list(key), value] for key, value in metric.collect().items()]}
+            for name, metric in list(self.metrics.items())
+        }
+
+    def flush(self, directory):
+        """
+        把本进程的指标写入共享目录（先写临时文件再替换，读取方不会读到写了一半的文件）
+        """
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temp = f'{path}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.dump(), f)
+        os.replace(temp, path)
+
+    def ensure_flusher(self):
+        """
+        启动定期写入共享目录的后台线程，每个进程首次更新指标时调用（fork出的子进程会启动自己的线程）
+        """
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            directory = metrics_settings()['MULTIPROCESS_DIR']
+            if not directory:
+                return
+            os.makedirs(directory, exist_ok=True)
+            self.flusher = threading.Thread(
+                target=self.run_flusher, args=(directory, metrics_settings()['FLUSH_INTERVAL']),
+                name='metrics-flusher', daemon=True,
+            )
+            self.flusher.start()
+            atexit.register(self.flush, directory)
+
+    def run_flusher(self, directory, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush(directory)
+            except OSError:
+                pass
+
+    def collect(self):
+        """
+        合并所有进程后的指标：{指标名: (metric, {标签值元组: 值})}
+        """
+        self.ensure_flusher()
+        result = {name: (metric, metric.collect()) for name, metric in list(self.metrics.items())}
+        directory = metrics_settings()['MULTIPROCESS_DIR']
+        if not directory or not os.path.isdir(directory):
+            return result
+
+        for filename in os.listdir(directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = pid_alive(int(pid))
+            for name, item in data.items():
+                if name not in result:
+                    continue
+                metric, values = result[name]
+                merge(values, metric.type, {tuple(key): value for key, value in item['values']}, alive)
+        return result
+
+    def render(self):
+        """
+        Prometheus文本格式
+        """
+        lines = []
+        for name, (metric, values) in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(values.items()):
+                if metric.type != 'histogram':
+                    lines.append(f'{name}{format_labels(metric.labelnames, key)} {format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), value[:-1]):
+                    cumulative += count
+                    labels = format_labels(metric.labelnames, key, ('le', format_value(float(bound))))
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                labels = format_labels(metric.labelnames, key)
+                lines.append(f'{name}_sum{labels} {format_value(value[-1])}')
+                lines.append(f'{name}_count{labels} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,136 @@
+"""
+键集（游标）分页
+
+按 ordering 中的字段组合定位下一页的起点（WHERE (a, id) < (?, ?)），
+不使用OFFSET，翻到很深的页也只扫描一页的数据，并且翻页期间有新数据写入时不会重复或遗漏。
+ordering 的最后一个字段必须唯一（通常是id），保证排序稳定。
+
+游标是上一页最后一行排序字段值的base64编码JSON，对客户端不透明。
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class InvalidCursor(ValidationError):
+    default_detail = '无效的分页游标'
+    default_code = 'invalid_cursor'
+
+
+class KeysetPagination(BasePagination):
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE or 10
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        self.has_more = False
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.cursor_filter(self.decode_cursor(cursor, queryset.model)))
+
+        # 多取一行判断是否还有下一页
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_more else None
+        return rows
+
+    def get_pagination_data(self):
+        return {
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_more,
+            'page_size': self.page_size,
+        }
+
+    def get_paginated_response(self, data):
+        return Response({
+            'code': 200,
+            'message': '成功',
+            'data': data,
+            'pagination': self.get_pagination_data(),
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'code': {'type': 'integer'},
+                'message': {'type': 'string'},
+                'data': schema,
+                'pagination': {
+                    'type': 'object',
+                    'properties': {
+                        'next_cursor': {'type': 'string', 'nullable': True},
+                        'has_more': {'type': 'boolean'},
+                        'page_size': {'type': 'integer'},
+                    },
+                },
+            },
+        }
+
+    def cursor_filter(self, values):
+        """
+        (a, b, id) 在 (va, vb, vid) 之后的条件：
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)，降序字段用 <
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            lookup = 'lt' if self.is_descending(field) else 'gt'
+            name = field.lstrip('-')
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def is_descending(field):
+        return field.startswith('-')
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise InvalidCursor()
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except InvalidCursor:
+            raise
+        except (binascii.Error, ValueError, TypeError, LookupError, ValidationError, DjangoValidationError):
+            raise InvalidCursor()
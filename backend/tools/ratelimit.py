@@ -0,0 +1,54 @@
+"""
+基于共享缓存的滑动窗口限流
+
+按固定窗口计数，判断时用上一个窗口的计数按剩余比例加权（滑动窗口计数法）：
+    估计次数 = 上一窗口次数 * (1 - 当前窗口已过去的比例) + 当前窗口次数
+每个标识每个窗口只占两个缓存键，计数使用缓存的原子incr，多个进程共享同一个缓存时限流是全局的。
+"""
+import math
+import time
+
+
+class SlidingWindowRateLimiter:
+    def __init__(self, cache, prefix, limit, window):
+        self.cache = cache
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+
+    def _key(self, identity, index):
+        return f"{self.prefix}:{self.window}:{identity}:{index}"
+
+    def _increment(self, key):
+        # 窗口键保留两个窗口长度，计算下一个窗口的估计次数时还要用到
+        if self.cache.add(key, 1, self.window * 2):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # add和incr之间键刚好过期
+            self.cache.set(key, 1, self.window * 2)
+            return 1
+
+    def hit(self, identity, now=None):
+        """
+        记录一次请求，返回 (是否允许, 需要等待的秒数)
+
+        被拒绝的请求同样计数，持续超限的调用方会一直被限制
+        """
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        current = self._increment(self._key(identity, index))
+        previous = self.cache.get(self._key(identity, index - 1), 0)
+
+        elapsed = now - index * self.window
+        remaining = (self.window - elapsed) / self.window
+        if previous * remaining + current <= self.limit:
+            return True, 0
+
+        # 估计次数降到限额以内需要的时间：当前窗口次数已超限时要等到下一个窗口
+        if current > self.limit or not previous:
+            wait = self.window - elapsed
+        else:
+            wait = (self.window - elapsed) - (self.limit - current) * self.window / previous
+        return False, max(1, math.ceil(wait))
@@ -0,0 +1,172 @@
+"""
+基于SQLite文件的Django缓存后端
+
+同一台机器上的多个进程（gunicorn/uwsgi的多个worker）共享同一个文件，
+不需要额外部署Redis即可在进程之间共享验证码等数据。
+
+每个值一行，写操作在 BEGIN IMMEDIATE 事务中执行，add/incr/delete 在多进程下是原子的，
+delete 返回是否真的删除了该键，多个进程同时删除同一个键时只有一个返回True。
+
+清理过期条目和按 MAX_ENTRIES 淘汰需要扫描整个表，每个进程每 CULL_EVERY 次写入（add/set）才执行一次，
+因此条目数可能短暂超过 MAX_ENTRIES（最多多出 进程数 * CULL_EVERY 条）；过期条目在读取时同样视为不存在。
+
+配置示例:
+    CACHES = {
+        'verification': {
+            'BACKEND': 'tools.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/lib/app/verification.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_EVERY': 100},
+        }
+    }
+"""
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# 等待其他进程释放写锁的最长时间（秒）
+BUSY_TIMEOUT = 5
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._cull_every = max(int(params.get('OPTIONS', {}).get('CULL_EVERY', 100)), 1)
+        # itertools.count 的 next() 在多线程下是原子的
+        self._writes = itertools.count(1)
+
+    def _connection(self):
+        # 连接不能跨线程、也不能在fork之后继续使用，按线程和进程号分别创建
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _alive(expires, now=None):
+        return expires is None or expires > (now or time.time())
+
+    def _get_row(self, conn, key):
+        row = conn.execute('SELECT value, expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or not self._alive(row[1]):
+            return None
+        return row
+
+    def _store(self, conn, key, value, expires):
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires),
+        )
+
+    def _maybe_cull(self, conn):
+        if next(self._writes) % self._cull_every == 0:
+            self._cull(conn)
+
+    def _cull(self, conn):
+        now = time.time()
+        conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            # 与Django自带后端一致，超出上限时删除 1/CULL_FREQUENCY 的条目（最先过期的优先）
+            limit = count // self._cull_frequency if self._cull_frequency else count
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (limit,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            if self._get_row(conn, key) is not None:
+                return False
+            self._maybe_cull(conn)
+            self._store(conn, key, value, self.get_backend_timeout(timeout))
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._get_row(self._connection(), key)
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        with self._write() as conn:
+            if not self._alive(expires):
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                return
+            self._maybe_cull(conn)
+            self._store(conn, key, value, expires)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            if self._get_row(conn, key) is None:
+                return False
+            conn.execute(
+                'UPDATE cache_entries SET expires = ? WHERE key = ?', (self.get_backend_timeout(timeout), key)
+            )
+        return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            cursor = conn.execute(
+                'DELETE FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+            )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._get_row(self._connection(), key) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as conn:
+            row = self._get_row(conn, key)
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            self._store(conn, key, value, row[1])
+        return value
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute('DELETE FROM cache_entries')
+
+    def close(self, **kwargs):
+        # 每个请求结束时Django会调用close，连接保留给同一线程的后续请求复用
+        pass
@@ -0,0 +1,368 @@
+"""
+请求耗时分解
+
+server_timing_middleware 为每个请求创建一个 RequestTimer（保存在contextvar中），
+请求处理过程中用 span()/record() 记录各阶段耗时：
+    with span('serialize'):
+        data = serializer.data
+数据库查询通过连接的 execute_wrapper 自动计入 db（次数和总耗时），
+sync_to_async 执行的查询同样会计入（contextvar随调用传递）。
+
+请求结束时：
+- 按 路由 + 阶段 累计到进程内的直方图（get_histograms），供工作人员通过接口查看
+- 各阶段耗时写入 Server-Timing 响应头（浏览器开发者工具可直接查看）。响应头会暴露数据库查询次数等
+  内部信息，默认只发给 STAFF_ROLES 中角色的已认证用户；设置 SERVER_TIMING['HEADER'] 后发给所有请求
+流式响应的响应头在流开始前就已发出，其中只包含此前的阶段；流结束后的完整耗时只进入直方图。
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import StreamingHttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import LazyObject, empty
+
+from .metrics import Histogram
+
+DEFAULT_SERVER_TIMING_SETTINGS = {
+    'HEADER': False,                   # 所有响应都带 Server-Timing 头（调试用）
+    'STAFF_ROLES': ('admin', 'staff'),  # 这些角色的用户始终带 Server-Timing 头
+}
+
+# 直方图的桶上限（毫秒），最后一个桶为 +Inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_current_timer = ContextVar('request_timer', default=None)
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', '请求耗时（流式响应到流结束）', ['route'])
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', '每个请求的数据库查询次数', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # 阶段名 -> [总耗时(秒), 次数]，按首次记录的顺序
+        self.spans = {}
+
+    def record(self, name, duration):
+        entry = self.spans.setdefault(name, [0.0, 0])
+        entry[0] += duration
+        entry[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self, total=None):
+        """
+        Server-Timing 响应头，例如: db;dur=3.2;desc="4 queries", total;dur=25.0
+        """
+        parts = []
+        for name, (duration, count) in self.spans.items():
+            part = f'{name};dur={duration * 1000:.1f}'
+            if name == 'db':
+                part += f';desc="{count} queries"'
+            parts.append(part)
+        parts.append(f'total;dur={(self.elapsed() if total is None else total) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def server_timing_settings():
+    return {**DEFAULT_SERVER_TIMING_SETTINGS, **getattr(settings, 'SERVER_TIMING', {})}
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+def record(name, duration):
+    """
+    把一段耗时（秒）计入当前请求，不在请求中时忽略
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, duration)
+
+
+@contextmanager
+def span(name):
+    """
+    记录with块的耗时
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.record(name, time.perf_counter() - started)
+
+
+def db_timing_wrapper(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.record('db', time.perf_counter() - started)
+
+
+def install_db_timing(connection, **kwargs):
+    if db_timing_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_timing_wrapper)
+
+
+class Histograms:
+    """
+    进程内按 (路由, 阶段) 累计的耗时直方图
+    """
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def observe(self, route, name, duration):
+        ms = duration * 1000
+        index = next((i for i, bound in enumerate(self.buckets) if ms <= bound), len(self.buckets))
+        with self.lock:
+            entry = self.data.get((route, name))
+            if entry is None:
+                entry = self.data[(route, name)] = {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                                    'buckets': [0] * (len(self.buckets) + 1)}
+            entry['count'] += 1
+            entry['sum'] += ms
+            entry['max'] = max(entry['max'], ms)
+            entry['buckets'][index] += 1
+
+    def observe_timer(self, route, timer, total):
+        for name, (duration, _count) in list(timer.spans.items()):
+            self.observe(route, name, duration)
+        self.observe(route, 'total', total)
+
+    def percentile(self, buckets, count, q):
+        """
+        按桶估计分位数（返回所在桶的上限，毫秒），落在最后一个桶时返回None
+        """
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """
+        {路由: {阶段: {count, avg_ms, max_ms, p50_ms, p95_ms, p99_ms, buckets}}}
+        """
+        with self.lock:
+            data = {key: {**entry, 'buckets': list(entry['buckets'])} for key, entry in self.data.items()}
+        result = {}
+        labels = [f'le_{bound}' for bound in self.buckets] + ['le_inf']
+        for (route, name), entry in sorted(data.items()):
+            count = entry['count']
+            result.setdefault(route, {})[name] = {
+                'count': count,
+                'avg_ms': round(entry['sum'] / count, 2),
+                'max_ms': round(entry['max'], 2),
+                'p50_ms': self.percentile(entry['buckets'], count, 0.5),
+                'p95_ms': self.percentile(entry['buckets'], count, 0.95),
+                'p99_ms': self.percentile(entry['buckets'], count, 0.99),
+                'buckets': dict(zip(labels, entry['buckets'])),
+            }
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.data.clear()
+
+
+histograms = Histograms()
+
+
+def get_histograms():
+    return histograms
+
+
+def request_route(request):
+    """
+    直方图按 请求方法 + URL路由模式 分组（如 GET api/v1/chat/conversations/(?P<pk>[^/.]+)/），
+    不按具体的id分散；未匹配路由的请求归为 unmatched
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # DRF路由器生成的是正则路由，去掉其中的 ^ 和 $
+    route = re.sub(r'(^|/)\^', r'\1', match.route).rstrip('$')
+    return f'{request.method} {route}'
+
+
+def observe(route, timer, total):
+    """
+    请求结束时计入直方图和指标（见tools.metrics）
+    """
+    histograms.observe_timer(route, timer, total)
+    REQUEST_DURATION.observe(total, route=route)
+    REQUEST_DB_QUERIES.observe(timer.spans.get('db', (0, 0))[1], route=route)
+
+
+class _TimedIterator:
+    """
+    迭代流式内容时恢复请求的timer，流结束时把完整耗时计入直方图
+    """
+    def __init__(self, content, timer, route):
+        self.content = content
+        self.timer = timer
+        self.route = route
+        self.finished = False
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            observe(self.route, self.timer, self.timer.elapsed())
+
+    def __iter__(self):
+        iterator = iter(self.content)
+        try:
+            while True:
+                token = _current_timer.set(self.timer)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current_timer.reset(token)
+                yield chunk
+        finally:
+            self.finish()
+
+    def close(self):
+        self.finish()
+
+
+class _TimedAsyncIterator(_TimedIterator):
+    def __iter__(self):
+        raise TypeError('异步流式内容只能异步迭代')
+
+    async def __aiter__(self):
+        iterator = self.content.__aiter__()
+        try:
+            while True:
+                token = _current_timer.set(self.timer)
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_timer.reset(token)
+                yield chunk
+        finally:
+            self.finish()
+
+
+def sends_header(request):
+    """
+    是否在响应中输出 Server-Timing 头
+
+    DRF认证后会把用户写回 request.user；会话中间件的惰性用户未被视图读取过时不再加载
+    （异步请求中加载会查询数据库），按未认证处理
+    """
+    config = server_timing_settings()
+    if config['HEADER']:
+        return True
+    user = getattr(request, 'user', None)
+    if user is None or (isinstance(user, LazyObject) and user._wrapped is empty):
+        return False
+    return user.is_authenticated and getattr(user, 'role', None) in config['STAFF_ROLES']
+
+
+def _finish(request, response, timer):
+    route = request_route(request)
+    header = sends_header(request)
+    if isinstance(response, StreamingHttpResponse):
+        if header:
+            response['Server-Timing'] = timer.header()
+        wrapper = _TimedAsyncIterator if response.is_async else _TimedIterator
+        response.streaming_content = wrapper(response.streaming_content, timer, route)
+        return response
+    total = timer.elapsed()
+    if header:
+        response['Server-Timing'] = timer.header(total)
+    observe(route, timer, total)
+    return response
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    """
+    记录请求总耗时和各阶段耗时，累计直方图并按需输出 Server-Timing 响应头
+    """
+    connection_created.connect(install_db_timing, dispatch_uid='tools.timing.install_db_timing')
+    for connection in connections.all(initialized_only=True):
+        install_db_timing(connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timer = RequestTimer()
+            token = _current_timer.set(timer)
+            try:
+                response = await get_response(request)
+            finally:
+                _current_timer.reset(token)
+            return _finish(request, response, timer)
+    else:
+        def middleware(request):
+            # 当前线程的连接可能在中间件创建前已经建立
+            install_db_timing(connections['default'])
+            timer = RequestTimer()
+            token = _current_timer.set(timer)
+            try:
+                response = get_response(request)
+            finally:
+                _current_timer.reset(token)
+            return _finish(request, response, timer)
+    return middleware
+
+
+def timed_iter(iterable, name):
+    """
+    迭代上游的流式输出，把首个分块的等待时间计入 {name}_ttfb，整个流的耗时计入 name
+    """
+    started = time.perf_counter()
+    first = True
+    try:
+        for item in iterable:
+            if first:
+                first = False
+                record(f'{name}_ttfb', time.perf_counter() - started)
+            yield item
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+async def atimed_iter(iterable, name):
+    """
+    timed_iter 的异步版本
+    """
+    started = time.perf_counter()
+    first = True
+    try:
+        async for item in iterable:
+            if first:
+                first = False
+                record(f'{name}_ttfb', time.perf_counter() - started)
+            yield item
+    finally:
+        record(name, time.perf_counter() - started)
@@ -0,0 +1,161 @@
+"""
+用户活跃信息（最后登录IP、最后活跃时间）的延迟批量写入
+
+请求处理中只把变化记录到进程内缓冲区（同一用户的多次更新合并为一条），
+由后台线程每隔 FLUSH_INTERVAL 秒用一条 bulk_update 批量写入数据库，
+请求路径上不再执行同步UPDATE。
+
+last_seen 只在与数据库中的值相差超过 LAST_SEEN_RESOLUTION 秒时才记录，
+活跃用户的每次请求不会都产生写入。进程退出时会尝试写入剩余的记录，
+异常退出时最多丢失一个刷新周期内的活跃信息。
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .snapshots import invalidate_user_snapshots
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACTIVITY_SETTINGS = {
+    'FLUSH_INTERVAL': 30,          # 后台刷新间隔（秒）
+    'LAST_SEEN_RESOLUTION': 60,    # last_seen的精度（秒）
+    'MAX_PENDING': 10000,          # 缓冲的用户数超过该值时立即刷新
+    'BATCH_SIZE': 500,             # 每条bulk_update包含的用户数
+}
+
+
+def activity_settings():
+    return {**DEFAULT_ACTIVITY_SETTINGS, **getattr(settings, 'USER_ACTIVITY', {})}
+
+
+def get_client_ip(request):
+    """
+    获取客户端IP
+
+    X-Forwarded-For 中靠前的地址可以由客户端任意填写，只信任最后 TRUSTED_PROXY_COUNT 个
+    （自己部署的代理）追加的地址，取从右数第 TRUSTED_PROXY_COUNT 个；
+    没有配置代理或地址个数不足时使用 REMOTE_ADDR
+    """
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+class ActivityBuffer:
+    """
+    按用户合并的活跃信息缓冲区
+    """
+    def __init__(self, flush_interval=30, last_seen_resolution=60, max_pending=10000, batch_size=500):
+        self.flush_interval = flush_interval
+        self.last_seen_resolution = timedelta(seconds=last_seen_resolution)
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.worker = None
+
+    def record(self, user, ip, now):
+        """
+        记录一次请求的活跃信息，user为本次请求已加载的用户对象，返回是否需要写入
+        """
+        ip_changed = bool(ip) and user.last_login_ip != ip
+        seen_stale = user.last_seen is None or now - user.last_seen >= self.last_seen_resolution
+        if not ip_changed and not seen_stale:
+            return False
+
+        with self.lock:
+            entry = self.pending.setdefault(user.pk, {})
+            entry['last_seen'] = now
+            if ip:
+                entry['last_login_ip'] = ip
+            pending = len(self.pending)
+
+        # 同一进程中后续请求加载的可能是同一个用户对象（如缓存），同步更新避免重复记录
+        user.last_seen = now
+        if ip:
+            user.last_login_ip = ip
+
+        self.ensure_worker()
+        if pending >= self.max_pending:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        把缓冲区中的记录批量写入数据库，返回写入的用户数
+        """
+        from .models import User
+
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return 0
+
+            # 同一批中的用户必须更新相同的字段，按是否包含IP分成两组
+            groups = {}
+            for user_id, entry in pending.items():
+                groups.setdefault(tuple(sorted(entry)), []).append(User(pk=user_id, **entry))
+            try:
+                for fields, users in groups.items():
+                    User.objects.bulk_update(users, list(fields), batch_size=self.batch_size)
+                # 快照中包含活跃信息，写入后重建
+                invalidate_user_snapshots(list(pending))
+            except Exception as e:
+                logger.warning("写入用户活跃信息失败: %s", e)
+                # 放回缓冲区，下个周期重试；期间的新记录优先
+                with self.lock:
+                    for user_id, entry in pending.items():
+                        self.pending[user_id] = {**entry, **self.pending.get(user_id, {})}
+                return 0
+            return len(pending)
+
+    def ensure_worker(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is not None and self.worker.is_alive():
+                return
+            self.worker = threading.Thread(target=self.run, name='user-activity-flush', daemon=True)
+            self.worker.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_activity_buffer():
+    """
+    返回进程内共享的缓冲区，首次调用时按 settings.USER_ACTIVITY 创建
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = activity_settings()
+                _buffer = ActivityBuffer(
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    last_seen_resolution=config['LAST_SEEN_RESOLUTION'],
+                    max_pending=config['MAX_PENDING'],
+                    batch_size=config['BATCH_SIZE'],
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
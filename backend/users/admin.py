@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import User
+from .models import OutboundMessage, User
 
 
 class CustomUserAdmin(UserAdmin):
@@ -34,5 +34,15 @@ class CustomUserAdmin(UserAdmin):
     ordering = ('username',)
 
 
+class OutboundMessageAdmin(admin.ModelAdmin):
+    """待发送消息（发件箱）管理界面，用于查看发送状态"""
+    list_display = ('id', 'channel', 'recipient', 'purpose', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('channel', 'status', 'purpose')
+    search_fields = ('recipient',)
+    readonly_fields = [field.name for field in OutboundMessage._meta.fields]
+    ordering = ('-id',)
+
+
 # 注册模型和管理类
 admin.site.register(User, CustomUserAdmin)
+admin.site.register(OutboundMessage, OutboundMessageAdmin)
@@ -0,0 +1,51 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from tools.timing import span
+
+from .snapshots import get_user_snapshot, user_from_snapshot
+
+# 令牌中记录签发时用户令牌版本的claim
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    在令牌中写入用户当前的令牌版本，用户的 token_version 增加后旧令牌全部失效
+    """
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT认证，从缓存的用户快照构造request.user，不再每个请求查询完整的用户行
+    """
+    def authenticate(self, request):
+        with span('auth'):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('令牌中没有可识别的用户信息'))
+
+        snapshot = get_user_snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed(_('用户不存在'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not snapshot['is_active']:
+            raise AuthenticationFailed(_('用户已被禁用'), code='user_inactive')
+
+        # 没有版本claim的旧令牌视为版本0签发
+        if validated_token.get(TOKEN_VERSION_CLAIM, 0) != snapshot['token_version']:
+            raise AuthenticationFailed(_('令牌已失效，请重新登录'), code='token_revoked')
+
+        return user_from_snapshot(snapshot)
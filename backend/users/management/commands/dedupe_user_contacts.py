@@ -0,0 +1,52 @@
+"""
+回填用户的规范化邮箱/手机号列，并报告或清理重复的邮箱/手机号
+
+同一邮箱/手机号被多个用户使用时，id最小（最早注册）的用户保留，其余用户视为重复。
+
+用法:
+    python manage.py dedupe_user_contacts                      # 回填并列出重复
+    python manage.py dedupe_user_contacts --clear-duplicates   # 同时清空重复用户的邮箱/手机号
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import User
+from users.normalization import backfill_normalized_contacts
+from users.snapshots import invalidate_user_snapshots
+
+
+class Command(BaseCommand):
+    help = '回填规范化邮箱/手机号列，报告或清理重复的邮箱/手机号'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear-duplicates', action='store_true',
+                            help='清空重复用户的邮箱/手机号（保留最早注册的用户）')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        duplicates = backfill_normalized_contacts(User, batch_size=options['batch_size'])
+
+        total = 0
+        for field, values in duplicates.items():
+            for value, user_ids in values.items():
+                total += len(user_ids)
+                self.stdout.write(f'重复的{field} {value}: 用户 {", ".join(map(str, user_ids))}')
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS('没有重复的邮箱/手机号'))
+            return
+
+        if not options['clear_duplicates']:
+            self.stdout.write(self.style.WARNING(
+                f'{total} 个用户的邮箱/手机号与其他用户重复，使用 --clear-duplicates 清空'
+            ))
+            return
+
+        cleared_ids = set()
+        with transaction.atomic():
+            for field, values in duplicates.items():
+                user_ids = [user_id for ids in values.values() for user_id in ids]
+                User.objects.filter(id__in=user_ids).update(**{field: ''})
+                cleared_ids.update(user_ids)
+        invalidate_user_snapshots(cleared_ids)
+        self.stdout.write(self.style.SUCCESS(f'已清空 {total} 个重复的邮箱/手机号'))
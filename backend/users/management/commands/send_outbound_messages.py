@@ -0,0 +1,47 @@
+"""
+发送发件箱中待发送的邮件/短信（见users.outbox）
+
+用法:
+    python manage.py send_outbound_messages            # 持续运行
+    python manage.py send_outbound_messages --once     # 发送当前到期的消息后退出（适合cron）
+
+单独运行该命令时，可以设置 USER_OUTBOX_IN_PROCESS=false 关闭web进程内的发送线程。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.outbox import drain, outbox_settings
+
+
+class Command(BaseCommand):
+    help = '发送发件箱中待发送的邮件/短信'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='发送当前到期的消息后退出')
+        parser.add_argument('--batch-size', type=int, default=None, help='每批领取的消息数')
+        parser.add_argument('--interval', type=float, default=None, help='没有消息时的轮询间隔（秒）')
+
+    def handle(self, *args, **options):
+        config = outbox_settings()
+        batch_size = options['batch_size'] or config['BATCH_SIZE']
+        interval = options['interval'] or config['POLL_INTERVAL']
+
+        if options['once']:
+            sent = drain(batch_size)
+            self.stdout.write(self.style.SUCCESS(f'处理了 {sent} 条消息'))
+            return
+
+        self.stdout.write(f'开始发送待发送消息，轮询间隔 {interval} 秒')
+        try:
+            while True:
+                try:
+                    drain(batch_size)
+                except Exception as e:
+                    self.stderr.write(f'发送待发送消息失败: {str(e)}')
+                finally:
+                    close_old_connections()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write('已停止')
@@ -0,0 +1,28 @@
+"""
+查看最近一段时间验证码的发送统计（见users.verification）
+
+用法:
+    python manage.py verification_stats              # 最近60分钟
+    python manage.py verification_stats --minutes 1440
+"""
+from django.core.management.base import BaseCommand
+
+from users.verification import STATS_OUTCOMES, issuance_stats, verification_cache
+
+KINDS = ('sms', 'email')
+OUTCOME_LABELS = {'issued': '新发出', 'reused': '重发旧验证码', 'limited': '被限流'}
+
+
+class Command(BaseCommand):
+    help = '查看最近一段时间验证码的发送统计'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help='统计最近多少分钟（最多1560）')
+
+    def handle(self, *args, **options):
+        minutes = max(1, min(options['minutes'], 1560))
+        stats = issuance_stats(KINDS, minutes)
+        self.stdout.write(f'最近 {minutes} 分钟的验证码发送统计（缓存: {type(verification_cache()).__name__}）')
+        for kind in KINDS:
+            counts = '，'.join(f'{OUTCOME_LABELS[outcome]} {stats[kind][outcome]}' for outcome in STATS_OUTCOMES)
+            self.stdout.write(f'  {kind}: {counts}')
@@ -1,26 +1,29 @@
+import logging
+
+from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 
+from .activity import get_activity_buffer, get_client_ip
+
+logger = logging.getLogger(__name__)
+
 class UserLastLoginIPMiddleware(MiddlewareMixin):
     """
-    中间件：记录用户最后登录IP
+    中间件：记录用户最后登录IP和最后活跃时间
+
+    在响应阶段处理，此时DRF的JWT认证已经把用户写回request.user；
+    变化只写入进程内缓冲区，由后台线程批量写入数据库（见users.activity）
     """
-    def process_request(self, request):
-        """处理请求，获取用户IP并保存"""
+    def process_response(self, request, response):
+        """处理响应，记录已认证用户的IP和活跃时间"""
+        user = getattr(request, 'user', None)
         # 仅处理已认证用户
-        if not request.user.is_authenticated:
-            return None
-        
-        # 获取客户端IP
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            # 如果通过代理，取第一个IP
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        
-        # 如果IP发生变化，则更新用户的last_login_ip字段
-        if request.user.last_login_ip != ip:
-            request.user.last_login_ip = ip
-            request.user.save(update_fields=['last_login_ip'])
-        
-        return None 
\ No newline at end of file
+        if user is None or not user.is_authenticated:
+            return response
+
+        try:
+            get_activity_buffer().record(user, get_client_ip(request), timezone.now())
+        except Exception:
+            logger.exception("记录用户活跃信息失败")
+
+        return response
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_user_address_user_birthday_user_city_user_country_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="last_seen",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="最后活跃时间"
+            ),
+        ),
+    ]
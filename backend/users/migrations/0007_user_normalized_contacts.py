@@ -0,0 +1,127 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:15
+
+import logging
+import re
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# 规范化和回填逻辑复制自迁移编写时的 users.normalization，
+# 之后对该模块的修改不影响本迁移的行为
+_PHONE_SEPARATORS = re.compile(r"[\s\-()（）]")
+
+
+def normalize_email(value):
+    value = (value or "").strip().lower()
+    return value or None
+
+
+def normalize_phone(value):
+    value = _PHONE_SEPARATORS.sub("", value or "")
+    for prefix in ("+86", "0086"):
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+            break
+    else:
+        if len(value) == 13 and value.startswith("86"):
+            value = value[2:]
+    return value or None
+
+
+CONTACT_FIELDS = (
+    ("email", "email_normalized", normalize_email),
+    ("phone", "phone_normalized", normalize_phone),
+)
+
+
+def backfill_contacts(apps, schema_editor, batch_size=1000):
+    """
+    同一个规范化值分配给id最小的用户，其余重复的用户规范化列保持为空
+    """
+    User = apps.get_model("users", "User")
+    owners = {field: set() for field, _n, _f in CONTACT_FIELDS}
+    duplicates = {field: 0 for field, _n, _f in CONTACT_FIELDS}
+    changed = []
+
+    queryset = User.objects.order_by("id").values("id", *(field for field, _n, _f in CONTACT_FIELDS))
+    for row in queryset.iterator(chunk_size=batch_size):
+        desired = {}
+        for field, normalized_field, normalize in CONTACT_FIELDS:
+            value = normalize(row[field])
+            if value and value in owners[field]:
+                duplicates[field] += 1
+                continue
+            if value:
+                owners[field].add(value)
+                desired[normalized_field] = value
+        if desired:
+            changed.append(User(id=row["id"], **desired))
+
+    User.objects.bulk_update(
+        changed, [normalized_field for _f, normalized_field, _n in CONTACT_FIELDS], batch_size=batch_size
+    )
+    for field, count in duplicates.items():
+        if count:
+            logger.warning(
+                "%d 个用户的%s与其他用户重复，规范化列未填充，请运行 manage.py dedupe_user_contacts 处理",
+                count, field,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_user_list_indexes"),
+    ]
+
+    operations = [
+        # 先添加非唯一列并回填，重复值处理完后再加唯一约束
+        migrations.AddField(
+            model_name="user",
+            name="email_normalized",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=254,
+                null=True,
+                verbose_name="规范化邮箱",
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="phone_normalized",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=20,
+                null=True,
+                verbose_name="规范化手机号",
+            ),
+        ),
+        migrations.RunPython(backfill_contacts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="user",
+            name="email_normalized",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=254,
+                null=True,
+                unique=True,
+                verbose_name="规范化邮箱",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="phone_normalized",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=20,
+                null=True,
+                unique=True,
+                verbose_name="规范化手机号",
+            ),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_user_normalized_contacts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboundMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "channel",
+                    models.CharField(
+                        choices=[("email", "邮件"), ("sms", "短信")],
+                        max_length=10,
+                        verbose_name="渠道",
+                    ),
+                ),
+                ("recipient", models.CharField(max_length=254, verbose_name="接收方")),
+                (
+                    "subject",
+                    models.CharField(blank=True, max_length=200, verbose_name="主题"),
+                ),
+                ("body", models.TextField(verbose_name="内容")),
+                ("html_body", models.TextField(blank=True, verbose_name="HTML内容")),
+                (
+                    "purpose",
+                    models.CharField(blank=True, max_length=30, verbose_name="用途"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "待发送"),
+                            ("sending", "发送中"),
+                            ("sent", "已发送"),
+                            ("failed", "发送失败"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="状态",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="发送次数"
+                    ),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="最近错误")),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="下次发送时间"
+                    ),
+                ),
+                (
+                    "claim_token",
+                    models.CharField(
+                        blank=True, max_length=32, verbose_name="领取标识"
+                    ),
+                ),
+                (
+                    "claimed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="领取时间"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="发送时间"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "待发送消息",
+                "verbose_name_plural": "待发送消息",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="users_outbox_due_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,7 +1,13 @@
 from django.contrib.auth.models import AbstractUser, Group, Permission
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .normalization import CONTACT_FIELDS, normalize_email, normalize_phone, phone_variants
+from .permission_cache import get_permission_codenames
+from .snapshots import invalidate_user_snapshot
+
 
 class User(AbstractUser):
     """
@@ -22,6 +28,9 @@ class User(AbstractUser):
     
     # 额外用户信息字段
     phone = models.CharField(_('电话号码'), max_length=15, blank=True)
+    # 规范化后的邮箱/手机号，保存时根据email/phone自动生成，用于唯一约束和查找
+    email_normalized = models.CharField(_('规范化邮箱'), max_length=254, unique=True, null=True, blank=True, editable=False)
+    phone_normalized = models.CharField(_('规范化手机号'), max_length=20, unique=True, null=True, blank=True, editable=False)
     nickname = models.CharField(_('昵称'), max_length=7, blank=True)
     avatar = models.ImageField(_('头像'), upload_to='avatars/', blank=True, null=True)
     role = models.CharField(
@@ -51,6 +60,9 @@ class User(AbstractUser):
     
     # 登录相关信息
     last_login_ip = models.GenericIPAddressField(_('上次登录IP'), blank=True, null=True)
+    last_seen = models.DateTimeField(_('最后活跃时间'), blank=True, null=True)
+    # 令牌版本，增加后之前签发的JWT全部失效
+    token_version = models.PositiveIntegerField(_('令牌版本'), default=0)
     date_modified = models.DateTimeField(_('修改日期'), auto_now=True)
     
     # 用于权限管理的groups和user_permissions字段
@@ -73,9 +85,103 @@ class User(AbstractUser):
         verbose_name = _('用户')
         verbose_name_plural = _('用户')
         ordering = ['-date_joined']
+        indexes = [
+            # 管理后台用户列表：按注册时间倒序的游标分页及角色/状态筛选
+            models.Index(fields=['-date_joined', '-id'], name='users_joined_idx'),
+            models.Index(fields=['role', '-date_joined', '-id'], name='users_role_joined_idx'),
+            models.Index(fields=['is_active', '-date_joined', '-id'], name='users_active_joined_idx'),
+            # 邮箱、手机号前缀搜索
+            models.Index(fields=['email'], name='users_email_idx'),
+            models.Index(fields=['phone'], name='users_phone_idx'),
+        ]
 
     def __str__(self):
         return self.username
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_contacts()
+        return instance
+
+    def _remember_contacts(self):
+        # 记录从数据库加载时的邮箱/手机号（延迟加载的字段不记录），save时据此判断是否修改过
+        self._loaded_contacts = {
+            field: self.__dict__[field] for field, _n, _f in CONTACT_FIELDS if field in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_contacts', {})
+        deferred = self.get_deferred_fields()
+        changed = []
+        for field, normalized_field, normalize in CONTACT_FIELDS:
+            if update_fields is not None and field not in update_fields:
+                continue
+            # 仍是延迟字段（如认证快照构造的用户）说明没有赋值过，不会被保存
+            if field in deferred:
+                continue
+            # 邮箱/手机号没有修改时保留现有的规范化值：迁移回填时重复的用户规范化列为空，
+            # 重新计算会违反唯一约束
+            if field in loaded and loaded[field] == getattr(self, field):
+                continue
+            setattr(self, normalized_field, normalize(getattr(self, field)))
+            changed.append(normalized_field)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *changed}
+        super().save(*args, **kwargs)
+        self._remember_contacts()
+        # 资料、角色、启用状态等变化后删除认证快照；提交后再删一次，避免并发请求在提交前缓存旧值
+        invalidate_user_snapshot(self.pk)
+        transaction.on_commit(lambda: invalidate_user_snapshot(self.pk))
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # 来自认证快照的用户访问其他字段时，一次加载全部延迟字段，而不是每个字段查询一次
+        if fields is not None and getattr(self, '_from_snapshot', False):
+            deferred = self.get_deferred_fields()
+            if deferred and set(fields) <= deferred:
+                fields = deferred
+                self._from_snapshot = False
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # 之后加载的邮箱/手机号同样记录为加载时的值
+        loaded = self.__dict__.setdefault('_loaded_contacts', {})
+        for field, _n, _f in CONTACT_FIELDS:
+            if (fields is None or field in fields) and field in self.__dict__:
+                loaded[field] = self.__dict__[field]
+
+    @classmethod
+    def with_email(cls, email):
+        """
+        按规范化邮箱查找用户（唯一索引），空邮箱不匹配任何用户
+
+        回填时重复的用户规范化列为空，按原始邮箱（不区分大小写）同样能找到
+        """
+        value = normalize_email(email)
+        if not value:
+            return cls.objects.none()
+        return cls.objects.filter(Q(email_normalized=value) | Q(email_normalized__isnull=True, email__iexact=value))
+
+    @classmethod
+    def with_phone(cls, phone):
+        """
+        按规范化手机号查找用户（唯一索引），空手机号不匹配任何用户
+
+        回填时重复的用户规范化列为空，按常见写法（带/不带+86等前缀）的原始手机号同样能找到
+        """
+        value = normalize_phone(phone)
+        if not value:
+            return cls.objects.none()
+        return cls.objects.filter(
+            Q(phone_normalized=value) | Q(phone_normalized__isnull=True, phone__in=phone_variants(value))
+        )
+
+    def revoke_tokens(self):
+        """
+        使之前签发的全部JWT失效
+        """
+        self.token_version = models.F('token_version') + 1
+        self.save(update_fields=['token_version'])
+        self.refresh_from_db(fields=['token_version'])
         
     def get_full_name(self):
         """
@@ -97,19 +203,57 @@ class User(AbstractUser):
     def has_permission(self, permission_name):
         """
         检查用户是否拥有特定权限
-        根据角色或用户权限检查
+        根据角色或用户权限检查，用户权限和用户组权限合并后缓存（见users.permission_cache）
         """
         # 管理员拥有所有权限
         if self.is_admin:
             return True
-            
-        # 检查用户权限
-        if self.user_permissions.filter(codename=permission_name).exists():
-            return True
-            
-        # 检查用户组权限
-        for group in self.groups.all():
-            if group.permissions.filter(codename=permission_name).exists():
-                return True
-                
-        return False
+        
+        return permission_name in get_permission_codenames(self)
+
+
+class OutboundMessage(models.Model):
+    """
+    待发送的邮件/短信（发件箱）
+
+    接口只把消息写入该表，由后台worker批量发送（见users.outbox），
+    发送失败时按退避时间重试，超过最大次数后标记为失败。
+    """
+    class Channel(models.TextChoices):
+        EMAIL = 'email', _('邮件')
+        SMS = 'sms', _('短信')
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('待发送')
+        SENDING = 'sending', _('发送中')
+        SENT = 'sent', _('已发送')
+        FAILED = 'failed', _('发送失败')
+
+    channel = models.CharField(_('渠道'), max_length=10, choices=Channel.choices)
+    recipient = models.CharField(_('接收方'), max_length=254)
+    subject = models.CharField(_('主题'), max_length=200, blank=True)
+    body = models.TextField(_('内容'))
+    html_body = models.TextField(_('HTML内容'), blank=True)
+    purpose = models.CharField(_('用途'), max_length=30, blank=True)
+    status = models.CharField(_('状态'), max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(_('发送次数'), default=0)
+    last_error = models.TextField(_('最近错误'), blank=True)
+    # 下次可以发送的时间，失败重试时按退避时间推后
+    next_attempt_at = models.DateTimeField(_('下次发送时间'), default=timezone.now)
+    # worker领取消息时写入，用于识别本批领取的消息和回收超时未完成的消息
+    claim_token = models.CharField(_('领取标识'), max_length=32, blank=True)
+    claimed_at = models.DateTimeField(_('领取时间'), blank=True, null=True)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('发送时间'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('待发送消息')
+        verbose_name_plural = _('待发送消息')
+        ordering = ['id']
+        indexes = [
+            # worker按状态和发送时间领取消息
+            models.Index(fields=['status', 'next_attempt_at'], name='users_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} -> {self.recipient} ({self.get_status_display()})"
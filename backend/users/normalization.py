@@ -0,0 +1,84 @@
+"""
+邮箱、手机号的规范化
+
+规范化后的值写入 User.email_normalized / phone_normalized（唯一索引），
+查重和按邮箱/手机号查找用户都使用规范化后的列，走唯一索引而不是全表扫描。
+空值规范化为None，多个没有邮箱/手机号的用户不会违反唯一约束。
+"""
+import re
+
+_PHONE_SEPARATORS = re.compile(r'[\s\-()（）]')
+
+
+def normalize_email(value):
+    """
+    去除首尾空白并转为小写
+    """
+    value = (value or '').strip().lower()
+    return value or None
+
+
+def normalize_phone(value):
+    """
+    去除空格、横线、括号，中国大陆号码去掉+86/0086/86前缀
+    """
+    value = _PHONE_SEPARATORS.sub('', value or '')
+    for prefix in ('+86', '0086'):
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+            break
+    else:
+        if len(value) == 13 and value.startswith('86'):
+            value = value[2:]
+    return value or None
+
+
+def phone_variants(value):
+    """
+    规范化手机号的常见原始写法（带或不带国际区号前缀）
+    """
+    return [value, f'+86{value}', f'0086{value}', f'86{value}']
+
+
+CONTACT_FIELDS = (
+    ('email', 'email_normalized', normalize_email),
+    ('phone', 'phone_normalized', normalize_phone),
+)
+
+
+def backfill_normalized_contacts(user_model, batch_size=1000):
+    """
+    按邮箱/手机号重新计算全部用户的规范化列，可重复执行
+
+    同一个规范化值分配给id最小的用户，其余用户的规范化列置空并作为重复返回：
+    {'email': {值: [重复用户id, ...]}, 'phone': {...}}
+    """
+    fields = [normalized_field for _field, normalized_field, _normalize in CONTACT_FIELDS]
+    owners = {field: set() for field, _n, _f in CONTACT_FIELDS}
+    duplicates = {field: {} for field, _n, _f in CONTACT_FIELDS}
+    changed = {}
+
+    queryset = user_model.objects.order_by('id').values(
+        'id', *(field for field, _n, _f in CONTACT_FIELDS), *fields
+    )
+    for row in queryset.iterator(chunk_size=batch_size):
+        desired = {}
+        for field, normalized_field, normalize in CONTACT_FIELDS:
+            value = normalize(row[field])
+            if value and value in owners[field]:
+                duplicates[field].setdefault(value, []).append(row['id'])
+                value = None
+            elif value:
+                owners[field].add(value)
+            desired[normalized_field] = value
+        if any(row[field] != desired[field] for field in fields):
+            changed[row['id']] = desired
+
+    # 先把需要变化的用户置空，再写入新值，避免值在用户之间转移时触发唯一约束
+    ids = list(changed)
+    for start in range(0, len(ids), batch_size):
+        user_model.objects.filter(id__in=ids[start:start + batch_size]).update(**{field: None for field in fields})
+    user_model.objects.bulk_update(
+        [user_model(id=user_id, **desired) for user_id, desired in changed.items()], fields, batch_size=batch_size
+    )
+    return duplicates
@@ -0,0 +1,296 @@
+"""
+邮件/短信发件箱
+
+接口只把要发送的消息写入 OutboundMessage 表（enqueue_email / enqueue_sms），
+不在请求中连接SMTP或短信服务；后台worker批量领取待发送的消息并发送：
+- 同一批邮件复用一个SMTP连接
+- 发送失败按 RETRY_BACKOFF * 2^(n-1) 秒退避重试，达到 MAX_ATTEMPTS 次后标记为失败
+- 领取消息用一条带条件的UPDATE完成，多个worker同时运行时同一条消息只会被一个领取；
+  worker异常退出时，超过 CLAIM_TIMEOUT 秒仍未完成的消息会被重新领取
+- 每条消息发送前按领取令牌续期领取时间，已被其他worker重新领取的消息不再发送；
+  发送结果也只在领取令牌仍然匹配时写入，因此单条消息的发送耗时必须小于 CLAIM_TIMEOUT
+
+worker可以是web进程内的后台线程（IN_PROCESS_WORKER，消息提交后立即唤醒），
+也可以是单独运行的 manage.py send_outbound_messages 命令。
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX_SETTINGS = {
+    'BATCH_SIZE': 50,            # 每批领取的消息数
+    'MAX_ATTEMPTS': 5,           # 最多发送次数
+    'RETRY_BACKOFF': 30,         # 重试退避的基础时间（秒）
+    'CLAIM_TIMEOUT': 5 * 60,     # 领取或续期后超过该时间未完成视为worker已退出（秒）
+    'POLL_INTERVAL': 5,          # 后台线程检查到期重试的间隔（秒）
+    'IN_PROCESS_WORKER': True,   # 是否在web进程内启动后台发送线程
+}
+
+
+def outbox_settings():
+    return {**DEFAULT_OUTBOX_SETTINGS, **getattr(settings, 'USER_OUTBOX', {})}
+
+
+def enqueue(channel, recipient, body, subject='', html_body='', purpose=''):
+    """
+    写入一条待发送的消息，事务提交后唤醒进程内的发送线程
+    """
+    from .models import OutboundMessage
+
+    message = OutboundMessage.objects.create(
+        channel=channel, recipient=recipient, subject=subject, body=body,
+        html_body=html_body, purpose=purpose,
+    )
+    if outbox_settings()['IN_PROCESS_WORKER']:
+        transaction.on_commit(get_outbox_worker().wake)
+    return message
+
+
+def enqueue_email(recipient, subject, body, html_body='', purpose=''):
+    return enqueue('email', recipient, body, subject=subject, html_body=html_body, purpose=purpose)
+
+
+def enqueue_sms(recipient, body, purpose=''):
+    return enqueue('sms', recipient, body, purpose=purpose)
+
+
+def send_emails(messages):
+    """
+    用同一个SMTP连接发送一批邮件，返回发送失败的 {消息id: 错误信息}
+    """
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        return {message.id: f"连接邮件服务器失败: {str(e)}" for message in messages}
+
+    errors = {}
+    try:
+        for message in messages:
+            email = EmailMultiAlternatives(
+                subject=message.subject,
+                body=message.body,
+                from_email=settings.EMAIL_HOST_USER,
+                to=[message.recipient],
+                connection=connection,
+            )
+            if message.html_body:
+                email.attach_alternative(message.html_body, 'text/html')
+            try:
+                email.send()
+            except Exception as e:
+                errors[message.id] = str(e)
+    finally:
+        connection.close()
+    return errors
+
+
+def send_sms(messages):
+    """
+    通过Twilio发送一批短信，返回发送失败的 {消息id: 错误信息}；未配置Twilio时只打印（开发环境）
+    """
+    from core.config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER
+
+    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+        for message in messages:
+            logger.info("模拟发送短信到 %s: %s", message.recipient, message.body)
+        return {}
+
+    from twilio.rest import Client as Twilio_client
+
+    client = Twilio_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    errors = {}
+    for message in messages:
+        try:
+            client.messages.create(body=message.body, from_=TWILIO_PHONE_NUMBER, to=message.recipient)
+        except Exception as e:
+            errors[message.id] = str(e)
+    return errors
+
+
+# 发送函数逐条迭代收到的消息（迭代时续期领取），单条消息的错误在函数内捕获，
+# 返回发送失败的 {消息id: 错误信息}
+SENDERS = {
+    'email': send_emails,
+    'sms': send_sms,
+}
+
+
+def claim_batch(limit, now=None):
+    """
+    领取一批到期的消息（待发送或领取超时的），返回领取到的消息列表
+    """
+    from .models import OutboundMessage
+
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=outbox_settings()['CLAIM_TIMEOUT'])
+    due = (
+        Q(status=OutboundMessage.Status.PENDING, next_attempt_at__lte=now)
+        | Q(status=OutboundMessage.Status.SENDING, claimed_at__lt=stale)
+    )
+    ids = list(
+        OutboundMessage.objects.filter(due).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    # UPDATE时再次检查条件，其他worker先领取的消息不会被重复领取
+    token = uuid.uuid4().hex
+    OutboundMessage.objects.filter(due, id__in=ids).update(
+        status=OutboundMessage.Status.SENDING, claim_token=token, claimed_at=now
+    )
+    return list(OutboundMessage.objects.filter(claim_token=token).order_by('id'))
+
+
+def renew_claims(messages, token, lost, dispatched):
+    """
+    逐条续期领取时间后交给发送函数，交出的消息id记入dispatched；
+    领取令牌已不匹配（超时后被其他worker重新领取）的消息跳过，id记入lost
+    """
+    from .models import OutboundMessage
+
+    for message in messages:
+        renewed = OutboundMessage.objects.filter(id=message.id, claim_token=token).update(claimed_at=timezone.now())
+        if renewed:
+            dispatched.add(message.id)
+            yield message
+        else:
+            lost.add(message.id)
+
+
+def process_batch(limit=None):
+    """
+    领取并发送一批消息，返回 {'sent': 成功数, 'retry': 等待重试数, 'failed': 最终失败数}
+    """
+    from .models import OutboundMessage
+
+    config = outbox_settings()
+    messages = claim_batch(limit or config['BATCH_SIZE'])
+    result = {'sent': 0, 'retry': 0, 'failed': 0}
+    if not messages:
+        return result
+
+    token = messages[0].claim_token
+    errors = {}
+    lost = set()
+    dispatched = set()
+    by_channel = {}
+    for message in messages:
+        by_channel.setdefault(message.channel, []).append(message)
+    for channel, group in by_channel.items():
+        sender = SENDERS.get(channel)
+        try:
+            if sender is None:
+                raise ValueError(f"不支持的渠道: {channel}")
+            errors.update(sender(renew_claims(group, token, lost, dispatched)))
+        except Exception as e:
+            # 发送函数中途出错：已交给它的消息可能已经发出，按已发送处理，避免重复发送；
+            # 只有还没交出的消息重试
+            logger.exception("发送%s失败，%d条消息已交给发送函数", channel,
+                             sum(message.id in dispatched for message in group))
+            errors.update({message.id: str(e) for message in group if message.id not in dispatched})
+    if lost:
+        logger.warning("%d条消息已被其他worker重新领取，跳过", len(lost))
+
+    # 以下更新都要求领取令牌仍然匹配，已被重新领取的消息由新的worker负责
+    now = timezone.now()
+    claimed = OutboundMessage.objects.filter(claim_token=token)
+    sent_ids = [message.id for message in messages if message.id not in errors and message.id not in lost]
+    if sent_ids:
+        result['sent'] = claimed.filter(id__in=sent_ids).update(
+            status=OutboundMessage.Status.SENT, sent_at=now, attempts=F('attempts') + 1,
+            last_error='', claim_token='',
+        )
+
+    for message in messages:
+        if message.id not in errors or message.id in lost:
+            continue
+        attempts = message.attempts + 1
+        if attempts >= config['MAX_ATTEMPTS']:
+            outcome = 'failed'
+            updated = claimed.filter(id=message.id).update(
+                status=OutboundMessage.Status.FAILED, attempts=attempts,
+                last_error=errors[message.id], claim_token='',
+            )
+        else:
+            outcome = 'retry'
+            updated = claimed.filter(id=message.id).update(
+                status=OutboundMessage.Status.PENDING, attempts=attempts,
+                last_error=errors[message.id], claim_token='',
+                next_attempt_at=now + timedelta(seconds=config['RETRY_BACKOFF'] * 2 ** (attempts - 1)),
+            )
+        if not updated:
+            continue
+        result[outcome] += 1
+        logger.warning("发送%s到 %s 失败（第%d次）: %s", message.channel, message.recipient, attempts,
+                       errors[message.id], extra={'outbound_message_id': message.id})
+    return result
+
+
+def drain(limit=None):
+    """
+    连续发送直到没有到期的消息，返回发送的消息总数
+    """
+    total = 0
+    while True:
+        result = process_batch(limit)
+        processed = sum(result.values())
+        total += processed
+        if processed < (limit or outbox_settings()['BATCH_SIZE']):
+            return total
+
+
+class OutboxWorker:
+    """
+    进程内的后台发送线程：有新消息时被唤醒，空闲时每隔 POLL_INTERVAL 秒检查一次到期的重试
+    """
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def wake(self):
+        self.ensure_thread()
+        self.event.set()
+
+    def ensure_thread(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='user-outbox', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.event.wait(self.poll_interval)
+            self.event.clear()
+            try:
+                drain()
+            except Exception:
+                logger.exception("发送待发送消息失败")
+            finally:
+                close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_outbox_worker():
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = OutboxWorker(poll_interval=outbox_settings()['POLL_INTERVAL'])
+    return _worker
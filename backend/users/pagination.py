@@ -0,0 +1,10 @@
+from tools.pagination import KeysetPagination
+
+
+class UserPagination(KeysetPagination):
+    """
+    用户列表按注册时间倒序分页
+    """
+    ordering = ('-date_joined', '-id')
+    page_size = 20
+    max_page_size = 200
@@ -0,0 +1,80 @@
+"""
+用户权限集合缓存
+
+把用户直接拥有的权限和所在用户组的权限合并成一个codename集合，用一条查询计算后缓存，
+之后的权限检查是集合成员判断，不再按用户组逐个查询。
+
+失效方式：
+- 用户的 groups / user_permissions 变化：删除该用户的缓存
+- 用户组的权限、用户组或权限本身变化：增加全局版本号，所有用户的缓存键随之变化
+缓存和版本号都保存在所有worker共享的 auth 缓存中（见users.snapshots.auth_cache），
+撤销的权限在其他worker上同样立即失效。
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .snapshots import auth_cache
+
+PERMISSION_CACHE_TIMEOUT = getattr(settings, 'USER_PERMISSION_CACHE_TIMEOUT', 60 * 60)
+
+VERSION_KEY = 'user_perms_version'
+
+
+def permissions_version():
+    cache = auth_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_permissions_version():
+    """
+    用户组或权限变化后调用，使所有用户的权限缓存失效
+    """
+    cache = auth_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, None)
+
+
+def permission_cache_key(user_id, version=None):
+    return f"user_perms_v{version or permissions_version()}_{user_id}"
+
+
+def compute_permission_codenames(user_id):
+    """
+    一条查询取出用户直接拥有和通过用户组获得的全部权限codename
+    """
+    from django.contrib.auth.models import Permission
+
+    return frozenset(
+        Permission.objects.filter(Q(custom_user=user_id) | Q(group__custom_user=user_id))
+        .values_list('codename', flat=True)
+        .distinct()
+    )
+
+
+def get_permission_codenames(user):
+    """
+    返回用户的权限codename集合，同一请求内的用户对象只读取一次缓存
+    """
+    codenames = getattr(user, '_permission_codenames', None)
+    if codenames is not None:
+        return codenames
+
+    cache = auth_cache()
+    key = permission_cache_key(user.pk)
+    codenames = cache.get(key)
+    if codenames is None:
+        codenames = compute_permission_codenames(user.pk)
+        cache.set(key, codenames, PERMISSION_CACHE_TIMEOUT)
+    user._permission_codenames = codenames
+    return codenames
+
+
+def invalidate_user_permissions(user_ids):
+    version = permissions_version()
+    auth_cache().delete_many([permission_cache_key(user_id, version) for user_id in user_ids])
@@ -1,5 +1,19 @@
 from rest_framework import permissions
 
+from .models import User
+
+# 角色判断只读取 role 字段，认证时的用户快照已包含该字段（见users.snapshots），不会查询数据库
+
+
+def user_role(request):
+    """
+    返回已认证用户的角色，未认证时返回None
+    """
+    user = request.user
+    if user and user.is_authenticated:
+        return getattr(user, 'role', None)
+    return None
+
 
 class IsAdminUser(permissions.BasePermission):
     """
@@ -7,9 +21,7 @@ class IsAdminUser(permissions.BasePermission):
     """
     def has_permission(self, request, view):
         # 检查用户是否已认证并且是管理员
-        if request.user and request.user.is_authenticated:
-            return hasattr(request.user, 'is_admin') and request.user.is_admin
-        return False
+        return user_role(request) == User.Role.ADMIN
 
 
 class IsStaffOrAdmin(permissions.BasePermission):
@@ -18,9 +30,7 @@ class IsStaffOrAdmin(permissions.BasePermission):
     """
     def has_permission(self, request, view):
         # 检查用户是否为工作人员或管理员
-        if request.user and request.user.is_authenticated:
-            return request.user.is_admin or request.user.is_staff_member
-        return False
+        return user_role(request) in (User.Role.ADMIN, User.Role.STAFF)
 
 
 class IsSelfOrAdmin(permissions.BasePermission):
@@ -28,16 +38,17 @@ class IsSelfOrAdmin(permissions.BasePermission):
     允许用户修改自己的资料或允许管理员修改任何用户资料的权限类
     """
     def has_object_permission(self, request, view, obj):
+        role = user_role(request)
         # 检查用户是否已认证
-        if not request.user.is_authenticated:
+        if role is None:
             return False
             
         # 管理员可以修改任何用户
-        if hasattr(request.user, 'is_admin') and request.user.is_admin:
+        if role == User.Role.ADMIN:
             return True
             
         # 普通用户只能修改自己的资料
-        return obj.id == request.user.id
+        return obj.pk == request.user.pk
 
 
 class ReadOnly(permissions.BasePermission):
@@ -2,6 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import Group
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from .authentication import VersionedRefreshToken
 
 User = get_user_model()
 
@@ -21,7 +24,25 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'password': {'write_only': True}
         }
-    
+
+    def validate_email(self, value):
+        """验证邮箱唯一性"""
+        users = User.with_email(value)
+        if self.instance is not None:
+            users = users.exclude(id=self.instance.id)
+        if users.exists():
+            raise serializers.ValidationError(_("该邮箱已被注册"))
+        return value
+
+    def validate_phone(self, value):
+        """验证手机号唯一性"""
+        users = User.with_phone(value)
+        if self.instance is not None:
+            users = users.exclude(id=self.instance.id)
+        if users.exists():
+            raise serializers.ValidationError(_("该手机号已被绑定"))
+        return value
+
     def create(self, validated_data):
         """创建用户时对密码进行加密"""
         password = validated_data.pop('password', None)
@@ -56,12 +77,29 @@ class UserProfileSerializer(serializers.ModelSerializer):
                  'district', 'address', 'last_login_ip']
         read_only_fields = ['role', 'last_login_ip']  # 普通用户不能修改自己的角色和登录IP
         
+    def validate_email(self, value):
+        """验证邮箱唯一性"""
+        users = User.with_email(value)
+        if self.instance is not None:
+            users = users.exclude(id=self.instance.id)
+        if users.exists():
+            raise serializers.ValidationError(_("该邮箱已被注册"))
+        return value
+
+    def validate_phone(self, value):
+        """验证手机号唯一性"""
+        users = User.with_phone(value)
+        if self.instance is not None:
+            users = users.exclude(id=self.instance.id)
+        if users.exists():
+            raise serializers.ValidationError(_("该手机号已被绑定"))
+        return value
+
     def validate_avatar(self, value):
         """
         验证头像字段，支持文件对象和字符串URL
         """
         # 如果值为None，直接返回None表示不更新头像
-        print(value, 'value')
         if value is None:
             return None
             
@@ -206,7 +244,7 @@ class SendEmailCodeSerializer(serializers.Serializer):
     
     def validate_email(self, value):
         """验证邮箱是否已注册"""
-        if not User.objects.filter(email=value).exists():
+        if not User.with_email(value).exists():
             raise serializers.ValidationError(_("该邮箱未注册"), code="email_not_found")
         return value
 
@@ -219,7 +257,7 @@ class ResetPasswordPhoneSerializer(serializers.Serializer):
     
     def validate_phone(self, value):
         """验证手机号是否已注册"""
-        if not User.objects.filter(phone=value).exists():
+        if not User.with_phone(value).exists():
             raise serializers.ValidationError(_("该手机号未注册"), code="phone_not_found")
         return value
     
@@ -243,7 +281,7 @@ class ResetPasswordEmailSerializer(serializers.Serializer):
     
     def validate_email(self, value):
         """验证邮箱是否已注册"""
-        if not User.objects.filter(email=value).exists():
+        if not User.with_email(value).exists():
             raise serializers.ValidationError(_("该邮箱未注册"), code="email_not_found")
         return value
     
@@ -296,7 +334,12 @@ class UserListSerializer(serializers.ModelSerializer):
     def get_role(self, obj):
         """获取用户角色信息"""
         try:
-            group = obj.groups.first()
+            # 列表查询已预取用户组（按id排序，与first()一致）
+            groups = getattr(obj, 'prefetched_groups', None)
+            if groups is None:
+                group = obj.groups.first()
+            else:
+                group = groups[0] if groups else None
             if group:
                 return {
                     'id': group.id,
@@ -319,7 +362,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
         
     def validate_email(self, value):
         """验证邮箱唯一性"""
-        if User.objects.filter(email=value).exists():
+        if User.with_email(value).exists():
             raise serializers.ValidationError(_("该邮箱已被注册"))
         return value
         
@@ -356,7 +399,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
     def validate_email(self, value):
         """验证邮箱唯一性"""
         instance = self.instance
-        if User.objects.exclude(id=instance.id).filter(email=value).exists():
+        if User.with_email(value).exclude(id=instance.id).exists():
             raise serializers.ValidationError(_("该邮箱已被注册"))
         return value
         
@@ -388,4 +431,11 @@ class UserUpdateSerializer(serializers.ModelSerializer):
                 except Group.DoesNotExist:
                     pass
         
-        return instance 
\ No newline at end of file
+        return instance 
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    token/ 接口签发的令牌同样带有用户的令牌版本
+    """
+    token_class = VersionedRefreshToken
@@ -0,0 +1,39 @@
+"""
+用户组/权限变化时使权限缓存失效（见users.permission_cache）
+"""
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .permission_cache import bump_permissions_version, invalidate_user_permissions
+
+CHANGE_ACTIONS = ('post_add', 'post_remove', 'post_clear', 'pre_clear')
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in CHANGE_ACTIONS:
+        return
+    if not reverse:
+        invalidate_user_permissions([instance.pk])
+    elif action == 'pre_clear':
+        # 从用户组/权限一侧清空时，post_clear 拿不到受影响的用户
+        invalidate_user_permissions(list(instance.custom_user_set.values_list('pk', flat=True)))
+    elif pk_set:
+        invalidate_user_permissions(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action in CHANGE_ACTIONS:
+        bump_permissions_version()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def group_or_permission_changed(sender, **kwargs):
+    bump_permissions_version()
@@ -0,0 +1,75 @@
+"""
+用户快照缓存
+
+认证只需要用户的少数字段（id、角色、是否启用、令牌版本等），
+这里把这些字段缓存为一个小字典，认证时直接从快照构造用户对象，不查询数据库。
+访问快照之外的字段时，会用一次查询加载其余全部字段（见 User.refresh_from_db）。
+
+用户保存时（资料修改、角色变更、启用/禁用、撤销令牌）和活跃信息批量写入后删除快照，
+下次认证时从数据库重建。快照保存在所有worker共享的 auth 缓存中（见settings.CACHES），
+禁用用户或撤销令牌后其他worker的下一个请求即失效；未配置 auth 缓存时退回默认缓存，
+此时其他进程的快照要等到 USER_SNAPSHOT_TIMEOUT 过期。
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'role', 'is_active', 'is_staff', 'is_superuser',
+    'last_login_ip', 'last_seen', 'token_version',
+)
+
+SNAPSHOT_TIMEOUT = getattr(settings, 'USER_SNAPSHOT_TIMEOUT', 5 * 60)
+
+# 快照结构变化时修改版本号，避免读到旧结构的缓存
+SNAPSHOT_VERSION = 1
+
+AUTH_CACHE_ALIAS = 'auth'
+
+
+def auth_cache():
+    """
+    认证相关状态（用户快照、权限集合）使用的跨进程缓存
+    """
+    alias = AUTH_CACHE_ALIAS if AUTH_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def snapshot_cache_key(user_id):
+    return f"user_snapshot_v{SNAPSHOT_VERSION}_{user_id}"
+
+
+def get_user_snapshot(user_id):
+    """
+    返回用户快照字典，缓存未命中时从数据库加载；用户不存在时返回None
+    """
+    from .models import User
+
+    cache = auth_cache()
+    key = snapshot_cache_key(user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = User.objects.filter(pk=user_id).values(*SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def user_from_snapshot(snapshot):
+    """
+    用快照构造用户对象，快照之外的字段为延迟字段
+    """
+    from .models import User
+
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in snapshot]
+    user = User.from_db('default', field_names, [snapshot[name] for name in field_names])
+    user._from_snapshot = True
+    return user
+
+
+def invalidate_user_snapshot(user_id):
+    auth_cache().delete(snapshot_cache_key(user_id))
+
+
+def invalidate_user_snapshots(user_ids):
+    auth_cache().delete_many([snapshot_cache_key(user_id) for user_id in user_ids])
@@ -1,3 +1,5 @@
+import logging
+
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
@@ -16,12 +18,12 @@ router = DefaultRouter()
 router.register(r'users', UserManagementViewSet, basename='user-management')
 router.register(r'roles', GroupViewSet, basename='roles')
 
-# 打印路由器生成的URL
-print("="*50)
-print("Router URLs:")
-for url in router.urls:
-    print(f"{url.pattern} - {url.name} - {url.callback}")
-print("="*50)
+logger = logging.getLogger(__name__)
+
+# 调试时输出路由器生成的URL
+if logger.isEnabledFor(logging.DEBUG):
+    for url in router.urls:
+        logger.debug("Router URL: %s - %s", url.pattern, url.name)
 
 urlpatterns = [
     # JWT令牌视图
@@ -0,0 +1,195 @@
+"""
+验证码（短信/邮箱验证码、邮箱绑定令牌）的存取
+
+验证码保存在 settings.CACHES['verification'] 中（未配置时使用default缓存），
+该缓存需要在所有worker进程之间共享（SQLite文件或Redis），
+否则在一个进程发出的验证码在另一个进程中无法校验。
+
+校验成功时验证码同时被删除：只有真正删除了缓存键的请求算校验成功，
+同一个验证码被并发提交多次时只有一次成功。
+
+发送验证码（issue_code）时：
+- 按接收方（手机号/邮箱）和客户端IP做滑动窗口限流（settings.VERIFICATION_RATE_LIMITS）
+- 未过期的验证码直接重发并重置有效期，不再生成新验证码
+- 按分钟记录发出/重发/被限流的次数，用 manage.py verification_stats 查看
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from tools.metrics import Counter
+from tools.ratelimit import SlidingWindowRateLimiter
+
+from .normalization import normalize_email, normalize_phone
+
+VERIFICATION_CACHE_ALIAS = 'verification'
+
+# 验证码有效期（秒）
+CODE_TIMEOUT = 60 * 10
+# 邮箱绑定链接有效期（秒）
+EMAIL_BIND_TIMEOUT = 60 * 60 * 24
+
+# 默认的发送频率限制：[(次数, 窗口秒数), ...]
+DEFAULT_RATE_LIMITS = {
+    'target': [(1, 60), (5, 60 * 60), (10, 24 * 60 * 60)],
+    'ip': [(30, 60 * 60)],
+}
+
+# 发送统计按分钟计数，保留的时间（秒）
+STATS_RETENTION = 26 * 60 * 60
+STATS_OUTCOMES = ('issued', 'reused', 'limited')
+
+CODES_ISSUED = Counter('verification_codes_total', '验证码发送次数（outcome: issued/reused/limited）', ['kind', 'outcome'])
+
+# 限流时按规范化后的接收方计数，大小写或格式不同的同一手机号/邮箱共用限额
+TARGET_NORMALIZERS = {
+    'sms': normalize_phone,
+    'email': normalize_email,
+}
+
+
+class RateLimited(Exception):
+    """
+    验证码发送过于频繁
+    """
+    def __init__(self, scope, retry_after):
+        super().__init__(f"{scope} 发送过于频繁，{retry_after}秒后重试")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def verification_cache():
+    alias = VERIFICATION_CACHE_ALIAS if VERIFICATION_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def sms_code_key(phone):
+    return f"sms_code_{phone}"
+
+
+def email_code_key(email):
+    return f"email_code_{email}"
+
+
+def email_bind_key(email):
+    return f"email_bind_{email}"
+
+
+def store_code(key, value, timeout=CODE_TIMEOUT):
+    """
+    保存验证码（或绑定信息），覆盖之前发出的同一个键
+    """
+    verification_cache().set(key, value, timeout)
+
+
+def _matches(stored, expected):
+    return isinstance(stored, str) and isinstance(expected, str) and hmac.compare_digest(stored, expected)
+
+
+def consume_code(key, code):
+    """
+    校验验证码，正确时删除并返回True；错误、过期或已被使用时返回False
+
+    错误的验证码不会删除缓存中的验证码，用户可以重新输入
+    """
+    cache = verification_cache()
+    if not _matches(cache.get(key), code):
+        return False
+    # delete返回是否真的删除了该键，并发校验同一验证码时只有一个请求成功
+    return bool(cache.delete(key))
+
+
+def consume_email_bind(email, token):
+    """
+    校验邮箱绑定令牌，正确时删除并返回绑定信息，否则返回None
+    """
+    cache = verification_cache()
+    key = email_bind_key(email)
+    data = cache.get(key)
+    if not isinstance(data, dict) or not _matches(data.get('token'), token):
+        return None
+    return data if cache.delete(key) else None
+
+
+def rate_limits():
+    return {**DEFAULT_RATE_LIMITS, **getattr(settings, 'VERIFICATION_RATE_LIMITS', {})}
+
+
+def check_rate_limits(kind, target, ip=None):
+    """
+    记录一次发送请求，任一接收方或IP的限额超出时抛出RateLimited
+    """
+    cache = verification_cache()
+    normalize = TARGET_NORMALIZERS.get(kind)
+    target = (normalize(target) if normalize else None) or target
+    identities = [('target', f"{kind}:{target}")]
+    if ip:
+        identities.append(('ip', ip))
+    limits = rate_limits()
+    for scope, identity in identities:
+        for limit, window in limits.get(scope, []):
+            limiter = SlidingWindowRateLimiter(cache, f"verification_rl:{scope}", limit, window)
+            allowed, retry_after = limiter.hit(identity)
+            if not allowed:
+                record_issuance(kind, 'limited')
+                raise RateLimited(scope, retry_after)
+
+
+def issue_code(kind, key, target, generate, ip=None, timeout=CODE_TIMEOUT):
+    """
+    发送验证码前调用：检查频率限制，返回 (验证码, 是否为重发的旧验证码)
+
+    未过期的验证码直接返回并重置有效期，同一接收方多次请求收到的是同一个验证码，
+    先到的短信/邮件中的验证码仍然有效
+    """
+    check_rate_limits(kind, target, ip)
+    cache = verification_cache()
+    code = generate()
+    if cache.add(key, code, timeout):
+        record_issuance(kind, 'issued')
+        return code, False
+
+    existing = cache.get(key)
+    if isinstance(existing, str):
+        cache.touch(key, timeout)
+        record_issuance(kind, 'reused')
+        return existing, True
+    # 旧验证码在add和get之间过期或已被使用
+    cache.set(key, code, timeout)
+    record_issuance(kind, 'issued')
+    return code, False
+
+
+def _stats_key(kind, outcome, minute):
+    return f"verification_stats:{kind}:{outcome}:{minute}"
+
+
+def record_issuance(kind, outcome):
+    CODES_ISSUED.inc(kind=kind, outcome=outcome)
+    cache = verification_cache()
+    key = _stats_key(kind, outcome, int(time.time() // 60))
+    if not cache.add(key, 1, STATS_RETENTION):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, STATS_RETENTION)
+
+
+def issuance_stats(kinds, minutes=60):
+    """
+    最近minutes分钟内各类验证码的发送统计：{kind: {'issued': n, 'reused': n, 'limited': n}}
+    """
+    current = int(time.time() // 60)
+    keys = {
+        _stats_key(kind, outcome, minute): (kind, outcome)
+        for kind in kinds
+        for outcome in STATS_OUTCOMES
+        for minute in range(current - minutes + 1, current + 1)
+    }
+    stats = {kind: dict.fromkeys(STATS_OUTCOMES, 0) for kind in kinds}
+    for key, value in verification_cache().get_many(list(keys)).items():
+        kind, outcome = keys[key]
+        stats[kind][outcome] += value
+    return stats
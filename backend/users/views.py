@@ -8,15 +8,16 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample, OpenApiResponse
 from rest_framework import serializers
+import logging
 import random
 import string
-from django.core.mail import send_mail
 from django.conf import settings
-from django.core.cache import cache
 from django.template.loader import render_to_string
-from twilio.rest import Client as Twilio_client
-from core.config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER
 from django.contrib.auth.models import Group
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
 
 from .serializers import (
     UserSerializer, UserProfileSerializer, LoginSerializer,
@@ -29,6 +30,16 @@ from .serializers import (
     UserUpdateSerializer
 )
 from .permissions import IsAdminUser, IsStaffOrAdmin, IsSelfOrAdmin
+from .authentication import VersionedRefreshToken
+from .pagination import UserPagination
+from .outbox import enqueue_email, enqueue_sms
+from .verification import (
+    EMAIL_BIND_TIMEOUT, RateLimited, consume_code, consume_email_bind, email_bind_key, email_code_key,
+    issue_code, sms_code_key, store_code
+)
+from .activity import get_client_ip
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -111,7 +122,7 @@ class LoginView(APIView):
             user = serializer.validated_data['user']
             
             # 创建JWT令牌
-            refresh = RefreshToken.for_user(user)
+            refresh = VersionedRefreshToken.for_user(user)
             
             return ApiResponse.success({
                 'user': UserSerializer(user).data,
@@ -187,10 +198,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         获取或更新当前用户信息
         """
-        print("="*50)
-        print(f"请求方法: {request.method}")
-        print(f"请求用户: {request.user}")
-        print(f"请求路径: {request.path}")
+        logger.debug("用户信息请求: method=%s, user=%s", request.method, request.user.pk)
         
         if request.method == 'GET':
             # 获取用户信息
@@ -199,8 +207,7 @@ class UserViewSet(viewsets.ModelViewSet):
         
         elif request.method in ['PUT', 'PATCH']:
             # 更新用户信息
-            print(f"请求数据: {request.data}")
-            print(f"请求文件: {request.FILES}")
+            logger.debug("用户信息更新数据: %s, 文件: %s", request.data, request.FILES)
             serializer = UserProfileSerializer(
                 request.user,
                 data=request.data,
@@ -210,10 +217,8 @@ class UserViewSet(viewsets.ModelViewSet):
             if serializer.is_valid():
                 serializer.save()
                 return ApiResponse.success(serializer.data, "用户信息更新成功")
-            print(f"序列化器错误: {serializer.errors}")
+            logger.info("用户信息更新失败: %s", serializer.errors)
             return ApiResponse.error("用户信息更新失败", status_code=status.HTTP_400_BAD_REQUEST, data=serializer.errors)
-        
-        print("="*50)
     
     @extend_schema(
         summary="上传用户头像",
@@ -228,11 +233,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         上传用户头像
         """
-        print("="*50)
-        print(f"请求方法: {request.method}")
-        print(f"请求用户: {request.user}")
-        print(f"请求路径: {request.path}")
-        print(f"请求文件: {request.FILES}")
+        logger.debug("上传头像: user=%s, 文件: %s", request.user.pk, request.FILES)
         
         if 'avatar' not in request.FILES:
             return ApiResponse.error(
@@ -286,6 +287,20 @@ class UserViewSet(viewsets.ModelViewSet):
     def _generate_code(self, length=6):
         """生成数字验证码"""
         return ''.join(random.choices(string.digits, k=length))
+
+    def _rate_limited_response(self, field, exc):
+        """验证码发送过于频繁时返回429，并通过Retry-After告知等待时间"""
+        response = ApiResponse.error(
+            "验证码发送过于频繁，请稍后再试",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            data={
+                'field': field,
+                'message': f"请{exc.retry_after}秒后再试",
+                'retry_after': exc.retry_after
+            }
+        )
+        response['Retry-After'] = str(exc.retry_after)
+        return response
     
     @extend_schema(
         summary="发送手机验证码",
@@ -306,10 +321,10 @@ class UserViewSet(viewsets.ModelViewSet):
             phone = serializer.validated_data['phone']
             # 获取验证码用途，默认为绑定手机号
             purpose = serializer.validated_data.get('purpose', 'binding')
-            print(purpose, "="*50)
+            logger.debug("发送短信验证码: purpose=%s", purpose)
             # 如果是重置密码，需要检查手机号是否已注册
             if purpose == 'reset':
-                user_exists = User.objects.filter(phone=phone).exists()
+                user_exists = User.with_phone(phone).exists()
                 if not user_exists:
                     return ApiResponse.error(
                         "该手机号未注册", 
@@ -323,7 +338,7 @@ class UserViewSet(viewsets.ModelViewSet):
             # 管理员账号可以自由绑定任何手机号，普通账号需要验证该手机号没被其他账号使用
             elif purpose == 'binding' and not request.user.is_staff:
                 # 检查该手机号是否已被其他账户绑定
-                if User.objects.filter(phone=phone).exclude(id=request.user.id if request.user.is_authenticated else -1).exists():
+                if User.with_phone(phone).exclude(id=request.user.id if request.user.is_authenticated else -1).exists():
                     return ApiResponse.error(
                         "该手机号已被其他账户绑定", 
                         status_code=status.HTTP_400_BAD_REQUEST,
@@ -333,24 +348,21 @@ class UserViewSet(viewsets.ModelViewSet):
                         }
                     )
             
-            # 生成验证码
-            code = self._generate_code()
-            
-            # 将验证码存入缓存(使用Django缓存系统)
-            # 设置过期时间为10分钟
-            cache_key = f"sms_code_{phone}"
-            cache.set(cache_key, code, 60 * 10)
+            # 限流后生成验证码并存入共享缓存（有效期10分钟），未过期的验证码直接重发
+            try:
+                code, _reused = issue_code(
+                    'sms', sms_code_key(phone), phone, self._generate_code, ip=get_client_ip(request)
+                )
+            except RateLimited as e:
+                return self._rate_limited_response('phone', e)
             
-            # TODO: 实际发送短信的代码
-            # t_client = Twilio_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            # SMS_LABEL = "【白杨】"
-            # message = t_client.messages.create(
-            #     body=f"{SMS_LABEL}你好，验证码是：{code}。用于{purpose}，请勿泄露给他人。",  # 短信内容
-            #     from_=TWILIO_PHONE_NUMBER,     # 你的 Twilio 号码
-            #     to=phone                       # 接收方手机号
-            # )
-            # 这里模拟发送短信，实际项目中应该调用短信发送API
-            print(f"向 {phone} 发送验证码: {code}, 用途: {purpose}")
+            # 写入发件箱，由后台worker发送短信，接口不等待短信服务返回
+            SMS_LABEL = "【白杨】"
+            enqueue_sms(
+                phone,
+                f"{SMS_LABEL}你好，验证码是：{code}。用于{purpose}，请勿泄露给他人。",
+                purpose=purpose
+            )
             code_data = {"sms_code": code, "purpose": purpose}
             return ApiResponse.success(code_data, "验证码发送成功，有效期10分钟")
         
@@ -381,26 +393,25 @@ class UserViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             email = serializer.validated_data['email']
             
-            # 生成验证码
-            code = self._generate_code()
-            
-            # 将验证码存入缓存(使用Django缓存系统)
-            # 设置过期时间为10分钟
-            cache_key = f"email_code_{email}"
-            cache.set(cache_key, code, 60 * 10)
+            # 限流后生成验证码并存入共享缓存（有效期10分钟），未过期的验证码直接重发
+            try:
+                code, _reused = issue_code(
+                    'email', email_code_key(email), email, self._generate_code, ip=get_client_ip(request)
+                )
+            except RateLimited as e:
+                return self._rate_limited_response('email', e)
             
-            # 发送邮件
+            # 写入发件箱，由后台worker发送邮件，接口不等待SMTP
             try:
-                send_mail(
+                enqueue_email(
+                    email,
                     subject='密码重置验证码',
-                    message=f'您的密码重置验证码是：{code}，有效期10分钟。',
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[email],
-                    fail_silently=False,
+                    body=f'您的密码重置验证码是：{code}，有效期10分钟。',
+                    purpose='reset'
                 )
                 return ApiResponse.success(None, "验证码已发送到您的邮箱，有效期10分钟")
-            except Exception as e:
-                print(f"邮件发送失败: {str(e)}")
+            except Exception:
+                logger.exception("邮件发送失败")
                 return ApiResponse.error(
                     "验证码发送失败，请稍后重试", 
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -436,10 +447,8 @@ class UserViewSet(viewsets.ModelViewSet):
             new_password = serializer.validated_data['newPassword']
             
             # 验证码校验
-            cache_key = f"sms_code_{phone}"
-            cached_code = cache.get(cache_key)
-            
-            if not cached_code or cached_code != code:
+            # 校验成功的同时删除验证码，同一验证码不能重复使用
+            if not consume_code(sms_code_key(phone), code):
                 return ApiResponse.error(
                     "验证码错误或已过期", 
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -451,12 +460,11 @@ class UserViewSet(viewsets.ModelViewSet):
             
             # 更新密码
             try:
-                user = User.objects.get(phone=phone)
+                user = User.with_phone(phone).get()
                 user.set_password(new_password)
                 user.save(update_fields=['password'])
-                
-                # 清除缓存中的验证码
-                cache.delete(cache_key)
+                # 找回密码后之前登录的设备需要重新登录
+                user.revoke_tokens()
                 
                 return ApiResponse.success(None, "密码重置成功")
             except User.DoesNotExist:
@@ -499,10 +507,8 @@ class UserViewSet(viewsets.ModelViewSet):
             new_password = serializer.validated_data['newPassword']
             
             # 验证码校验
-            cache_key = f"email_code_{email}"
-            cached_code = cache.get(cache_key)
-            
-            if not cached_code or cached_code != code:
+            # 校验成功的同时删除验证码，同一验证码不能重复使用
+            if not consume_code(email_code_key(email), code):
                 return ApiResponse.error(
                     "验证码错误或已过期", 
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -514,12 +520,11 @@ class UserViewSet(viewsets.ModelViewSet):
             
             # 更新密码
             try:
-                user = User.objects.get(email=email)
+                user = User.with_email(email).get()
                 user.set_password(new_password)
                 user.save(update_fields=['password'])
-                
-                # 清除缓存中的验证码
-                cache.delete(cache_key)
+                # 找回密码后之前登录的设备需要重新登录
+                user.revoke_tokens()
                 
                 return ApiResponse.success(None, "密码重置成功")
             except User.DoesNotExist:
@@ -564,10 +569,8 @@ class UserViewSet(viewsets.ModelViewSet):
             code = serializer.validated_data['code']
             
             # 验证码校验
-            cache_key = f"sms_code_{phone}"
-            cached_code = cache.get(cache_key)
-            
-            if not cached_code or cached_code != code:
+            # 校验成功的同时删除验证码，同一验证码不能重复使用
+            if not consume_code(sms_code_key(phone), code):
                 return ApiResponse.error(
                     "验证码错误或已过期", 
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -578,7 +581,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 )
             
             # 检查该手机号是否已被其他账户绑定
-            if User.objects.filter(phone=phone).exclude(id=request.user.id).exists():
+            if User.with_phone(phone).exclude(id=request.user.id).exists():
                 return ApiResponse.error(
                     "该手机号已被其他账户绑定", 
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -592,9 +595,6 @@ class UserViewSet(viewsets.ModelViewSet):
             request.user.phone = phone
             request.user.save(update_fields=['phone'])
             
-            # 清除缓存中的验证码
-            cache.delete(cache_key)
-            
             # 返回更新后的用户信息
             serializer = UserProfileSerializer(request.user)
             return ApiResponse.success(serializer.data, "手机号绑定成功")
@@ -634,7 +634,7 @@ class UserViewSet(viewsets.ModelViewSet):
             email = serializer.validated_data['email']
             
             # 检查该邮箱是否已被其他账户绑定
-            if User.objects.filter(email=email).exclude(id=request.user.id).exists():
+            if User.with_email(email).exclude(id=request.user.id).exists():
                 return ApiResponse.error(
                     "该邮箱已被其他账户绑定", 
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -651,19 +651,19 @@ class UserViewSet(viewsets.ModelViewSet):
             token = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode('utf-8').rstrip('=')
             
             # 将令牌存入缓存，设置过期时间为24小时
-            cache_key = f"email_bind_{email}"
             cache_data = {
                 'user_id': request.user.id,
-                'email': email
+                'email': email,
+                'token': token
             }
-            cache.set(cache_key, cache_data, 60 * 60 * 24)
+            store_code(email_bind_key(email), cache_data, EMAIL_BIND_TIMEOUT)
             
             # 构建激活链接
             # 实际项目中，这个URL应该是前端页面的URL，处理验证逻辑
             frontend_url = settings.FRONTEND_URL or 'http://localhost:5173'
             activate_url = f"{frontend_url}/verify-email?token={token}&email={email}&type=bind"
             
-            # 发送邮件
+            # 写入发件箱，由后台worker发送邮件，接口不等待SMTP
             try:
                 # 准备模板上下文
                 context = {
@@ -676,21 +676,20 @@ class UserViewSet(viewsets.ModelViewSet):
                 # 纯文本邮件内容
                 plain_message = f'请点击以下链接完成邮箱绑定：{activate_url}\n链接有效期为24小时。\n如果打不开链接，请复制链接在浏览器打开。'
                 
-                send_mail(
+                enqueue_email(
+                    email,
                     subject='绑定邮箱',
-                    message=plain_message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[email],
-                    fail_silently=False,
-                    html_message=html_message
+                    body=plain_message,
+                    html_body=html_message,
+                    purpose='bind'
                 )
                 return ApiResponse.success({
                     'activate_url': activate_url, # 仅开发环境返回，生产环境应该移除
                     'email': email,
                     'expires_in': '24小时'
                 }, "激活链接已发送到您的邮箱，请查收并点击链接完成绑定")
-            except Exception as e:
-                print(f"邮件发送失败: {str(e)}")
+            except Exception:
+                logger.exception("邮件发送失败")
                 return ApiResponse.error(
                     "邮件发送失败，请稍后重试", 
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -731,9 +730,8 @@ class UserViewSet(viewsets.ModelViewSet):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        # 从缓存获取绑定信息
-        cache_key = f"email_bind_{email}"
-        cache_data = cache.get(cache_key)
+        # 令牌正确时取出并删除绑定信息，链接只能使用一次
+        cache_data = consume_email_bind(email, token)
         
         if not cache_data:
             return ApiResponse.error(
@@ -749,17 +747,14 @@ class UserViewSet(viewsets.ModelViewSet):
             user.email = email
             user.save(update_fields=['email'])
             
-            # 清除缓存
-            cache.delete(cache_key)
-            
             return ApiResponse.success(None, "邮箱绑定成功")
         except User.DoesNotExist:
             return ApiResponse.error(
                 "用户不存在", 
                 status_code=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            print(f"邮箱绑定失败: {str(e)}")
+        except Exception:
+            logger.exception("邮箱绑定失败")
             return ApiResponse.error(
                 "邮箱绑定失败，请稍后重试", 
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -788,7 +783,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
         
         # 创建JWT令牌
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         
         return ApiResponse.success({
             'user': UserSerializer(user).data,
@@ -800,9 +795,78 @@ class RegisterView(generics.CreateAPIView):
 
 
 class UserManagementViewSet(viewsets.ModelViewSet):
-    """用户管理视图集"""
+    """
+    用户管理视图集
+
+    列表支持的查询参数（均可组合）：
+    - role: 用户角色（admin/staff/user）
+    - is_active: true/false
+    - group: 用户组ID
+    - date_joined_after / date_joined_before: 注册时间范围（日期或ISO时间）
+    - search: 用户名、邮箱或手机号的前缀
+    - cursor / page_size: 游标分页
+    """
     queryset = User.objects.all().order_by('-date_joined')
     permission_classes = [IsAdminUser]
+    pagination_class = UserPagination
+    
+    # 列表只读取序列化需要的列
+    LIST_FIELDS = ('id', 'username', 'email', 'is_active', 'date_joined')
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        queryset = queryset.only(*self.LIST_FIELDS).prefetch_related(
+            Prefetch('groups', queryset=Group.objects.only('id', 'name').order_by('id'), to_attr='prefetched_groups')
+        )
+        return self.filter_users(queryset)
+    
+    def filter_users(self, queryset):
+        params = self.request.query_params
+        
+        role = params.get('role')
+        if role:
+            if role not in User.Role.values:
+                raise serializers.ValidationError({'role': f'无效的角色: {role}'})
+            queryset = queryset.filter(role=role)
+        
+        is_active = params.get('is_active')
+        if is_active:
+            if is_active.lower() not in ('true', 'false', '1', '0'):
+                raise serializers.ValidationError({'is_active': '只能为true或false'})
+            queryset = queryset.filter(is_active=is_active.lower() in ('true', '1'))
+        
+        group = params.get('group')
+        if group:
+            if not group.isdigit():
+                raise serializers.ValidationError({'group': '无效的用户组ID'})
+            queryset = queryset.filter(groups__id=int(group))
+        
+        for param, lookup in (('date_joined_after', 'gte'), ('date_joined_before', 'lt')):
+            value = params.get(param)
+            if value:
+                queryset = queryset.filter(**{f'date_joined__{lookup}': self.parse_datetime_param(param, value)})
+        
+        # 前缀匹配可以使用索引（MySQL默认排序规则不区分大小写，istartswith对应 LIKE 'xxx%'）
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(
+                Q(username__istartswith=search) | Q(email__istartswith=search) | Q(phone__startswith=search)
+            )
+        return queryset
+    
+    @staticmethod
+    def parse_datetime_param(param, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                raise serializers.ValidationError({param: f'无效的时间: {value}'})
+            parsed = datetime.combine(parsed_date, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -825,6 +889,9 @@ class UserManagementViewSet(viewsets.ModelViewSet):
         
         user.is_active = is_active
         user.save()
+        # 禁用用户时使已签发的令牌失效
+        if not is_active:
+            user.revoke_tokens()
         
         serializer = self.get_serializer(user)
         return Response(serializer.data)